@@ -0,0 +1,102 @@
+'''
+Measures the per-message overhead of passing outputs from a worker thread
+to the asyncio loop, comparing janus.Queue (if installed) and ThreadChannel.
+
+Usage: python benchmarks/bench_channel.py [num_messages]
+'''
+
+import asyncio
+import sys
+import threading
+import time
+
+from ai.backend.kernel.channel import ThreadChannel
+
+try:
+    import janus
+except ImportError:
+    janus = None
+
+
+def measure(loop, num_messages, put, drain):
+    sentinel = object()
+    msg = [b'stdout', b'x' * 64]
+
+    def producer():
+        for _ in range(num_messages):
+            put(msg)
+        put(sentinel)
+
+    thread = threading.Thread(target=producer)
+    begin = time.perf_counter()
+    thread.start()
+    loop.run_until_complete(drain(sentinel))
+    elapsed = time.perf_counter() - begin
+    thread.join()
+    return num_messages / elapsed
+
+
+def bench_janus(loop, num_messages):
+    queue = janus.Queue(loop=loop)
+
+    async def drain(sentinel):
+        while True:
+            item = await queue.async_q.get()
+            queue.async_q.task_done()
+            if item is sentinel:
+                break
+
+    result = measure(loop, num_messages, queue.sync_q.put, drain)
+    queue.close()
+    loop.run_until_complete(queue.wait_closed())
+    return result
+
+
+def bench_channel(loop, num_messages):
+    channel = ThreadChannel(loop=loop)
+
+    async def drain(sentinel):
+        while True:
+            item = await channel.async_q.get()
+            if item is sentinel:
+                break
+
+    result = measure(loop, num_messages, channel.sync_q.put, drain)
+    channel.close()
+    return result
+
+
+def bench_channel_batch(loop, num_messages):
+    channel = ThreadChannel(loop=loop)
+
+    async def drain(sentinel):
+        while True:
+            for item in await channel.async_q.get_batch():
+                if item is sentinel:
+                    return
+
+    result = measure(loop, num_messages, channel.sync_q.put, drain)
+    channel.close()
+    return result
+
+
+def main():
+    num_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    cases = [
+        ('janus', bench_janus),
+        ('channel', bench_channel),
+        ('channel-batch', bench_channel_batch),
+    ]
+    for name, bench in cases:
+        if name == 'janus' and janus is None:
+            print(f'{name:>14s}: skipped (not installed)')
+            continue
+        msgs_per_sec = bench(loop, num_messages)
+        print(f'{name:>14s}: {msgs_per_sec:12,.0f} msgs/sec')
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+'''
+Measures the console output throughput of the Python in-process runner.
+
+It runs a print() loop in a separate thread as user codes do and drains the
+generated records from the asyncio loop side, comparing the unbuffered
+ConsoleOutput with the BufferedConsoleOutput with and without the output
+compaction.  The "progress" workload redraws a progress bar by carriage
+returns instead of printing lines.
+
+Usage: python benchmarks/bench_console_output.py [num_lines]
+'''
+
+import asyncio
+import sys
+import threading
+import time
+
+from ai.backend.kernel.channel import ThreadChannel
+from ai.backend.kernel.python.inproc import ConsoleOutput, BufferedConsoleOutput
+
+
+def write_lines(console, num_lines):
+    for i in range(num_lines):
+        print('line', i, file=console)
+
+
+def write_progress(console, num_lines):
+    for i in range(num_lines):
+        done = i * 40 // num_lines
+        console.write(f'\r{i * 100 // num_lines:3d}%|{"#" * done:40s}| {i}')
+        console.flush()
+    console.write('\n')
+
+
+def measure(loop, console_factory, workload, num_lines):
+    channel = ThreadChannel(loop=loop)
+    sentinel = object()
+
+    def emit(record):
+        channel.put([record.target.encode('ascii'), record.data])
+
+    console = console_factory(emit)
+
+    def writer():
+        workload(console, num_lines)
+        getattr(console, 'drain', console.flush)()
+        channel.put(sentinel)
+
+    async def reader():
+        num_records = 0
+        num_bytes = 0
+        while True:
+            for msg in await channel.async_q.get_batch():
+                if msg is sentinel:
+                    return num_records, num_bytes
+                num_records += 1
+                num_bytes += len(msg[1])
+
+    thread = threading.Thread(target=writer)
+    begin = time.perf_counter()
+    thread.start()
+    num_records, num_bytes = loop.run_until_complete(reader())
+    elapsed = time.perf_counter() - begin
+    thread.join()
+    channel.close()
+    return num_lines / elapsed, num_records, num_bytes
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    cases = [
+        ('unbuffered', lambda emit: ConsoleOutput(emit, 'stdout')),
+        ('buffered', lambda emit: BufferedConsoleOutput(emit, 'stdout',
+                                                        compact=False)),
+        ('compacted', lambda emit: BufferedConsoleOutput(emit, 'stdout')),
+    ]
+    for workload in (write_lines, write_progress):
+        print(f'{workload.__name__}:')
+        for name, factory in cases:
+            lines_per_sec, num_records, num_bytes = \
+                measure(loop, factory, workload, num_lines)
+            print(f'{name:>12s}: {lines_per_sec:12,.0f} lines/sec '
+                  f'({num_records:,} records, {num_bytes:,} bytes '
+                  f'for {num_lines:,} lines)')
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''
+Compares the output throughput of the default asyncio event loop and uvloop.
+
+It relays the output of a child process ("seq") to a ZeroMQ socket as the
+kernel runner does, both via a pipe and pipe_output() (batch and query
+runs) and via a pty and read_fd() (terminals).
+
+Usage: python benchmarks/bench_event_loop.py [num_lines]
+'''
+
+import asyncio
+import os
+import pty
+import subprocess
+import sys
+import time
+
+import zmq, zmq.asyncio
+
+from ai.backend.kernel.base import pipe_output
+from ai.backend.kernel.compat import install_event_loop_policy
+from ai.backend.kernel.utils import read_fd
+
+
+async def relay_pipe(outsock, num_lines):
+    proc = await asyncio.create_subprocess_exec(
+        'seq', str(num_lines), stdout=asyncio.subprocess.PIPE)
+    await pipe_output(proc.stdout, outsock, 'stdout')
+    await proc.wait()
+
+
+async def relay_pty(outsock, num_lines):
+    loop = asyncio.get_event_loop()
+    master, slave = pty.openpty()
+    os.set_blocking(master, False)
+    proc = subprocess.Popen(['seq', str(num_lines)], stdout=slave)
+    os.close(slave)
+    try:
+        while True:
+            data = await read_fd(loop, master, 4096)
+            if not data:
+                break
+            await outsock.send_multipart([data])
+    finally:
+        os.close(master)
+        proc.wait()
+
+
+def measure(relay, num_lines):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    zctx = zmq.asyncio.Context()
+    outsock = zctx.socket(zmq.PUSH)
+    port = outsock.bind_to_random_port('tcp://127.0.0.1')
+    observer = zctx.socket(zmq.PULL)
+    observer.connect(f'tcp://127.0.0.1:{port}')
+
+    async def consume():
+        num_msgs = num_bytes = 0
+        while True:
+            msg = await observer.recv_multipart()
+            if msg == [b'end']:
+                return num_msgs, num_bytes
+            num_msgs += 1
+            num_bytes += len(msg[-1])
+
+    async def run():
+        consumer = loop.create_task(consume())
+        await relay(outsock, num_lines)
+        await outsock.send_multipart([b'end'])
+        return await consumer
+
+    # pipe_output() also copies the output to the runner's own stdout.
+    stdout_fd = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    try:
+        begin = time.perf_counter()
+        num_msgs, num_bytes = loop.run_until_complete(run())
+        elapsed = time.perf_counter() - begin
+    finally:
+        os.dup2(stdout_fd, 1)
+        os.close(stdout_fd)
+        os.close(devnull)
+    outsock.close()
+    observer.close()
+    zctx.term()
+    loop.close()
+    return num_msgs, num_bytes / elapsed / 1e6
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    cases = [
+        ('pipe', relay_pipe),
+        ('pty', relay_pty),
+    ]
+    for impl in ('asyncio', 'uvloop'):
+        if install_event_loop_policy(impl) != impl:
+            print(f'{impl:>8s}: skipped (not installed)')
+            continue
+        for name, relay in cases:
+            num_msgs, mb_per_sec = measure(relay, num_lines)
+            print(f'{impl:>8s} {name:>5s}: {mb_per_sec:8.1f} MB/sec '
+                  f'({num_msgs:,d} msgs)')
+    install_event_loop_policy('asyncio')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+'''
+Compares the memory cost per query-mode session when hosting N sessions in
+one runner process against running one process (container) per session.
+
+Each session runs a typical teaching workload (importing numpy and pandas
+and creating a small DataFrame).  Memory is measured as the sum of RSS and
+PSS (proportional set size, which splits shared pages among processes).
+
+Usage: python benchmarks/bench_sessions.py [num_sessions]
+'''
+
+import subprocess
+import sys
+
+WORKLOAD = '''
+import numpy as np
+import pandas as pd
+df = pd.DataFrame({"x": np.arange(1000), "y": np.random.rand(1000)})
+print(df.describe().shape)
+'''
+
+HOST_SCRIPT = '''
+import queue, sys, time
+from ai.backend.kernel.python.inproc import PythonInprocRunner
+
+workload = sys.stdin.read()
+runners = []
+for _ in range(int(sys.argv[1])):
+    runner = PythonInprocRunner(queue.Queue(), queue.Queue(), queue.Queue(),
+                                object())
+    runner.start()
+    runner.input_queue.put(workload)
+    while runner.output_queue.get() is not runner.sentinel:
+        pass
+    runners.append(runner)
+time.sleep(0.5)  # let the background pre-warming settle
+print('ready', flush=True)
+time.sleep(3600)  # until killed
+'''
+
+
+def read_memory(pid):
+    rss = pss = 0
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Rss:'):
+                rss = int(line.split()[1]) * 1024
+            elif line.startswith('Pss:'):
+                pss = int(line.split()[1]) * 1024
+    return rss, pss
+
+
+def measure(num_processes, sessions_per_process):
+    procs = []
+    try:
+        for _ in range(num_processes):
+            proc = subprocess.Popen(
+                [sys.executable, '-c', HOST_SCRIPT, str(sessions_per_process)],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            proc.stdin.write(WORKLOAD.encode('utf8'))
+            proc.stdin.close()
+            procs.append(proc)
+        for proc in procs:
+            assert proc.stdout.readline().strip() == b'ready'
+        total_rss = total_pss = 0
+        for proc in procs:
+            rss, pss = read_memory(proc.pid)
+            total_rss += rss
+            total_pss += pss
+        return total_rss, total_pss
+    finally:
+        for proc in procs:
+            proc.kill()
+            proc.wait()
+
+
+def main():
+    num_sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    cases = [
+        ('shared process', 1, num_sessions),
+        ('process per session', num_sessions, 1),
+    ]
+    for name, num_processes, sessions_per_process in cases:
+        rss, pss = measure(num_processes, sessions_per_process)
+        print(f'{name:>20s}: {rss / num_sessions / 2**20:8.1f} MiB RSS, '
+              f'{pss / num_sessions / 2**20:8.1f} MiB PSS per session')
+
+
+if __name__ == '__main__':
+    main()
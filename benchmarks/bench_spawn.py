@@ -0,0 +1,67 @@
+'''
+Measures the latency of spawning a short-lived child process ("/bin/true")
+and waiting for its exit as BaseRunner.run_subproc() does, comparing a
+shell command line against a direct exec of an argument list, with and
+without a preexec_fn.
+
+Since Python 3.8 (posix_spawn) and 3.10 (vfork), the subprocess module
+uses the fast spawn paths only if no preexec_fn is given, which is why the
+scheduling policies are applied after spawning instead.
+
+Usage: python benchmarks/bench_spawn.py [num_spawns]
+'''
+
+import asyncio
+import statistics
+import sys
+import time
+
+
+def _noop():
+    pass
+
+
+async def spawn_shell(preexec_fn):
+    proc = await asyncio.create_subprocess_shell(
+        '/bin/true',
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        preexec_fn=preexec_fn)
+    await proc.communicate()
+
+
+async def spawn_exec(preexec_fn):
+    proc = await asyncio.create_subprocess_exec(
+        '/bin/true',
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        preexec_fn=preexec_fn)
+    await proc.communicate()
+
+
+def measure(loop, spawn, preexec_fn, num_spawns):
+    latencies = []
+    for _ in range(num_spawns):
+        begin = time.perf_counter()
+        loop.run_until_complete(spawn(preexec_fn))
+        latencies.append(time.perf_counter() - begin)
+    return statistics.median(latencies), max(latencies)
+
+
+def main():
+    num_spawns = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    cases = [
+        ('shell', spawn_shell, None),
+        ('shell+preexec', spawn_shell, _noop),
+        ('exec', spawn_exec, None),
+        ('exec+preexec', spawn_exec, _noop),
+    ]
+    for name, spawn, preexec_fn in cases:
+        median, worst = measure(loop, spawn, preexec_fn, num_spawns)
+        print(f'{name:>14s}: {median * 1e3:7.2f} ms (median), '
+              f'{worst * 1e3:7.2f} ms (max)')
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+'''
+Measures the startup cost of the Python kernel runner: the import time of
+the kernel package and the time to the first query result of a fresh
+process.
+
+Usage: python benchmarks/bench_startup.py [--repeat N] [--budget-ms MS]
+
+With --budget-ms, it exits with status 1 if the import time exceeds the
+budget so that it can guard against regressions.  The per-module breakdown
+requires "python -X importtime" (Python 3.7+).
+'''
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+TARGET_MODULE = 'ai.backend.kernel.python'
+
+FIRST_RESULT_SCRIPT = '''
+import time
+begin = time.perf_counter()
+import asyncio
+from ai.backend.kernel.channel import ThreadChannel
+from ai.backend.kernel.python.inproc import PythonInprocRunner
+
+loop = asyncio.get_event_loop()
+sentinel = object()
+input_queue = ThreadChannel(loop=loop)
+output_queue = ThreadChannel(loop=loop)
+runner = PythonInprocRunner(input_queue.sync_q, output_queue.sync_q,
+                            ThreadChannel(loop=loop).sync_q, sentinel)
+runner.start()
+
+async def first_result():
+    input_queue.put('print(42)')
+    while True:
+        for msg in await output_queue.async_q.get_batch():
+            if msg is sentinel:
+                return
+
+loop.run_until_complete(first_result())
+print(time.perf_counter() - begin)
+'''
+
+
+def measure_import_time():
+    '''
+    Returns the import time of TARGET_MODULE in seconds and the heaviest
+    imported modules as (cumulative seconds, name) pairs if available.
+    '''
+    if sys.version_info >= (3, 7):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {TARGET_MODULE}'],
+            stderr=subprocess.PIPE, check=True)
+        entries = []
+        for line in proc.stderr.decode('utf8').splitlines():
+            if not line.startswith('import time:'):
+                continue
+            _, cumulative_us, name = line[len('import time:'):].split('|')
+            try:
+                entries.append((int(cumulative_us) / 1e6, name.rstrip()))
+            except ValueError:
+                continue  # the header line
+        total = next(t for t, name in entries if name.strip() == TARGET_MODULE)
+        # Report the direct dependencies of the kernel package.
+        top_level = [(t, name.strip()) for t, name in entries
+                     if len(name) - len(name.lstrip()) <= 3 and
+                     name.strip() != TARGET_MODULE]
+        top_level.sort(reverse=True)
+        return total, top_level[:8]
+
+    # Fall back to the wall-clock time excluding the interpreter startup.
+    def run(code):
+        begin = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        return time.perf_counter() - begin
+    return run(f'import {TARGET_MODULE}') - run('pass'), []
+
+
+def measure_first_result():
+    proc = subprocess.run([sys.executable, '-c', FIRST_RESULT_SCRIPT],
+                          stdout=subprocess.PIPE, check=True)
+    return float(proc.stdout.decode('utf8').split()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    import_times = []
+    breakdown = []
+    for _ in range(args.repeat):
+        elapsed, breakdown = measure_import_time()
+        import_times.append(elapsed)
+    first_results = [measure_first_result() for _ in range(args.repeat)]
+
+    import_ms = statistics.median(import_times) * 1000
+    print(f'{"import time":>36s}: {import_ms:8.1f} ms (median)')
+    for elapsed, name in breakdown:
+        print(f'{name:>36s}: {elapsed * 1000:8.1f} ms')
+    first_ms = statistics.median(first_results) * 1000
+    print(f'{"first result":>36s}: {first_ms:8.1f} ms (median)')
+    if args.budget_ms is not None and import_ms > args.budget_ms:
+        print(f'import time exceeds the budget ({args.budget_ms:.1f} ms)')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
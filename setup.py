@@ -15,8 +15,6 @@ requires = [
     'pyzmq~=17.0',
     'uvloop~=0.11.0',
     'attrs>=18.0',  # to avoid pip 10 resolver issue
-    'namedlist',
-    'janus>=0.3.0',
     'msgpack~=0.5.6',
 ]
 build_requires = [
@@ -71,7 +69,7 @@ setup(
         # kernel-specific requirements
         'python': [
             'six', 'IPython', 'pandas', 'numpy',
-            'matplotlib', 'msgpack'],
+            'matplotlib', 'msgpack', 'cython'],
         'c': [],
         'cpp': [],
         'git': [],
@@ -10,28 +10,62 @@ import signal
 import sys
 import time
 
-import janus
 import msgpack
 import zmq
 
+from .channel import ThreadChannel
+from .compactor import OutputCompactor
 from .logging import BraceStyleAdapter, setup_logger
-from .compat import asyncio_run_forever, current_loop
-from .utils import wait_local_port_open
+from .procgroup import grace_periods_from_env, terminate_group
+from .compat import (
+    asyncio_run_forever, current_loop, install_event_loop_policy,
+)
+from .resources import ResourceLimits, thread_env
+from .sched import SCHED_KINDS, SchedPolicy
+from .utils import FdReader, open_pty, wait_local_port_open
 
 log = BraceStyleAdapter(logging.getLogger())
 
 
-async def pipe_output(stream, outsock, target):
+async def pipe_output(stream, outsock, target, *, compact=False):
+    '''
+    Copy the output stream of a subprocess to the kernel's own output and
+    send it to the client.  If ``compact`` is set, the progress bars and
+    repeated lines are compacted (see :class:`.compactor.OutputCompactor`)
+    in what is sent to the client, while the kernel's own output (the
+    container log) gets the raw stream.  It is meant for interactive
+    (query-mode) outputs only, as the batch outputs may be binary data.
+    '''
     assert target in ('stdout', 'stderr')
-    target = target.encode('ascii')
     fd = sys.stdout.fileno() if target == 'stdout' else sys.stderr.fileno()
+    target = target.encode('ascii')
+    compactor = OutputCompactor() if compact else None
     try:
         while True:
-            data = await stream.read(4096)
+            if compactor is not None and compactor.dirty:
+                # Wake up to send the throttled redraws of a quiet writer.
+                try:
+                    data = await asyncio.wait_for(stream.read(4096),
+                                                  compactor.refresh_interval)
+                except asyncio.TimeoutError:
+                    data = compactor.refresh()
+                    if data:
+                        await outsock.send_multipart([target, data])
+                    continue
+            else:
+                data = await stream.read(4096)
             if not data:
                 break
             os.write(fd, data)
+            if compactor is not None:
+                data = compactor.feed(data)
+                if not data:
+                    continue
             await outsock.send_multipart([target, data])
+        if compactor is not None:
+            data = compactor.flush()
+            if data:
+                await outsock.send_multipart([target, data])
     except asyncio.CancelledError:
         pass
     except Exception:
@@ -67,6 +101,26 @@ class BaseRunner(ABC):
         except Exception:
             log.exception('Reading /home/config/environ.txt failed!')
 
+        # Size the thread pools of the child processes (and of the libraries
+        # used in-process) by the container's CPUs unless set explicitly.
+        self.resources = ResourceLimits.probe()
+        for k, v in thread_env(self.resources).items():
+            if k not in os.environ and k not in self.child_env:
+                self.child_env[k] = v
+                os.environ[k] = v
+
+        # the scheduling policies of the child processes by their kinds
+        self.sched_policies = {kind: SchedPolicy.from_env(kind)
+                               for kind in SCHED_KINDS}
+        self._sched_kind = None
+
+        # the seconds before escalating interrupts to SIGTERM and SIGKILL
+        self.interrupt_grace = grace_periods_from_env()
+        self._interrupt_task = None
+
+        # the event loop implementation ("uvloop" or "asyncio") set by run()
+        self.loop_impl = None
+
         # initialized after loop creation
         self.loop = loop if loop is not None else current_loop()
         self.zctx = zmq.asyncio.Context()
@@ -103,8 +157,16 @@ class BaseRunner(ABC):
     async def init_with_loop(self):
         """Initialize after the event loop is created."""
 
+    @property
+    def sched_policy(self):
+        '''
+        The scheduling policy of the child processes for the current task.
+        '''
+        return self.sched_policies.get(self._sched_kind) or SchedPolicy()
+
     async def _clean(self, clean_cmd):
         ret = 0
+        self._sched_kind = 'build'
         try:
             if clean_cmd is None or clean_cmd == '':
                 # skipped
@@ -117,6 +179,7 @@ class BaseRunner(ABC):
             log.exception('unexpected error')
             ret = -1
         finally:
+            self._sched_kind = None
             await asyncio.sleep(0.01)  # extra delay to flush logs
             payload = json.dumps({
                 'exitCode': ret,
@@ -129,13 +192,14 @@ class BaseRunner(ABC):
 
     async def _build(self, build_cmd):
         ret = 0
+        self._sched_kind = 'build'
         try:
             if build_cmd is None or build_cmd == '':
                 # skipped
                 return
             elif build_cmd == '*':
                 if Path('Makefile').is_file():
-                    ret = await self.run_subproc('make')
+                    ret = await self.run_subproc(['make'])
                 else:
                     ret = await self.build_heuristic()
             else:
@@ -144,6 +208,7 @@ class BaseRunner(ABC):
             log.exception('unexpected error')
             ret = -1
         finally:
+            self._sched_kind = None
             await asyncio.sleep(0.01)  # extra delay to flush logs
             self._build_success = (ret == 0)
             payload = json.dumps({
@@ -157,6 +222,7 @@ class BaseRunner(ABC):
 
     async def _execute(self, exec_cmd):
         ret = 0
+        self._sched_kind = 'exec'
         try:
             if exec_cmd is None or exec_cmd == '':
                 # skipped
@@ -169,6 +235,7 @@ class BaseRunner(ABC):
             log.exception('unexpected error')
             ret = -1
         finally:
+            self._sched_kind = None
             await asyncio.sleep(0.01)  # extra delay to flush logs
             payload = json.dumps({
                 'exitCode': ret,
@@ -181,12 +248,14 @@ class BaseRunner(ABC):
 
     async def _query(self, code_text):
         ret = 0
+        self._sched_kind = 'query'
         try:
             ret = await self.query(code_text)
         except Exception:
             log.exception('unexpected error')
             ret = -1
         finally:
+            self._sched_kind = None
             payload = json.dumps({
                 'exitCode': ret,
             }).encode('utf8')
@@ -196,6 +265,40 @@ class BaseRunner(ABC):
     async def query(self, code_text) -> int:
         """Run user code by creating a temporary file and compiling it."""
 
+    async def _checkpoint(self, op_type, path):
+        ret = 0
+        try:
+            if op_type == 'snapshot':
+                ret = await self.snapshot(path)
+            else:
+                ret = await self.restore(path)
+        except NotImplementedError:
+            log.error('Unsupported operation for this kernel: {0}', op_type)
+            ret = -1
+        except Exception:
+            log.exception('unexpected error')
+            ret = -1
+        finally:
+            payload = json.dumps({
+                'exitCode': ret,
+            }).encode('utf8')
+            await self.outsock.send_multipart([b'finished', payload])
+
+    async def snapshot(self, path) -> int:
+        """Save the query-mode user namespace to the path (or the default)."""
+        raise NotImplementedError
+
+    async def restore(self, path) -> int:
+        """Restore the query-mode user namespace saved by snapshot()."""
+        raise NotImplementedError
+
+    async def handle_session_op(self, session_id, op_type, text):
+        """
+        Handle a query-mode op with a session ID (the third frame).
+        The outputs of the op should carry the session ID as their last frames.
+        """
+        raise NotImplementedError
+
     async def _complete(self, completion_data):
         try:
             return await self.complete(completion_data)
@@ -208,10 +311,58 @@ class BaseRunner(ABC):
     async def complete(self, completion_data):
         """Return the list of strings to be shown in the auto-complete list."""
 
+    async def _send_variables(self):
+        try:
+            variables = await self.variables()
+        except NotImplementedError:
+            raise
+        except Exception:
+            log.exception('unexpected error')
+            variables = []
+        await self.outsock.send_multipart([
+            b'variables',
+            json.dumps(variables).encode('utf8'),
+        ])
+
+    async def variables(self):
+        """
+        Return the summaries (names, types, shapes, dtypes, and approximate
+        sizes) of the query-mode user variables.
+        """
+        raise NotImplementedError
+
+    async def _send_stacks(self, options):
+        # It runs as a separate task not to block the other ops while
+        # sampling, so the errors are handled here.
+        try:
+            stacks = await self.stacks(options)
+        except NotImplementedError:
+            log.error('Unsupported operation for this kernel: stacks')
+            stacks = {'threads': []}
+        except Exception:
+            log.exception('unexpected error')
+            stacks = {'threads': []}
+        await self.outsock.send_multipart([
+            b'stacks',
+            json.dumps(stacks).encode('utf8'),
+        ])
+
+    async def stacks(self, options):
+        """
+        Return the current stacks of the running query-mode user code without
+        stopping it.  If options have "duration" (and "interval") in seconds,
+        also sample the stacks for the duration and return the hot frames.
+        """
+        raise NotImplementedError
+
     async def _interrupt(self):
         try:
             if self.subproc:
-                self.subproc.send_signal(signal.SIGINT)
+                # Interrupt the whole process group of the child, escalating
+                # to SIGTERM and SIGKILL in the background if it survives.
+                if self._interrupt_task is None or self._interrupt_task.done():
+                    self._interrupt_task = current_loop().create_task(
+                        terminate_group(self.subproc, self.interrupt_grace))
                 return
             return await self.interrupt()
         except Exception:
@@ -228,6 +379,9 @@ class BaseRunner(ABC):
     async def _send_status(self):
         data = {
             'started_at': self.started_at,
+            'event_loop': self.loop_impl,
+            'sched_policies': {kind: policy.to_dict()
+                               for kind, policy in self.sched_policies.items()},
         }
         await self.outsock.send_multipart([
             b'status',
@@ -258,7 +412,9 @@ class BaseRunner(ABC):
                 proc = await asyncio.create_subprocess_exec(
                     *cmdargs,
                     env={**self.child_env, **env},
+                    start_new_session=True,
                 )
+                self.sched_policies['service'].apply(proc.pid, group=True)
                 self.service_processes.append(proc)
             self.services_running.add(service_info['name'])
             await wait_local_port_open(service_info['port'])
@@ -272,30 +428,87 @@ class BaseRunner(ABC):
                 json.dumps(result).encode('utf8'),
             ])
 
-    async def run_subproc(self, cmd):
-        """A thin wrapper for an external command."""
+    async def run_subproc(self, cmd, *, use_pty=None):
+        """
+        A thin wrapper for an external command.
+
+        ``cmd`` is either a shell command line or an argument list.  Use
+        argument lists for simple commands as they are executed directly
+        without spawning an intermediate shell, and keep command lines for
+        compound ones (e.g., ``"gcc main.c && ./a.out"``).
+
+        If ``use_pty`` is set, the stdout of the command is a pty so that
+        programs using the C stdio (C, C++, ...) flush their outputs line
+        by line instead of every 4 KiB or at exit, while the stderr is kept
+        as a separate pipe.  It is the default for query-mode runs, whereas
+        batch-mode runs use pipes by default.  The outputs of pty runs are
+        compacted as well (see :func:`pipe_output`).
+        """
+        if use_pty is None:
+            use_pty = (self._sched_kind == 'query')
+        master = slave = None
+        try:
+            if use_pty:
+                master, slave = open_pty()
+            spawn_opts = {
+                'env': self.child_env,
+                'stdin': None,
+                'stdout': slave if use_pty else asyncio.subprocess.PIPE,
+                'stderr': asyncio.subprocess.PIPE,
+                # in its own process group to interrupt its descendants too
+                'start_new_session': True,
+            }
+            if isinstance(cmd, str):
+                # errors like "command not found" is handled by the spawned
+                # shell. (it will terminate immediately with return code 127)
+                proc = await asyncio.create_subprocess_shell(cmd, **spawn_opts)
+            else:
+                try:
+                    proc = await asyncio.create_subprocess_exec(*cmd,
+                                                                **spawn_opts)
+                except (FileNotFoundError, PermissionError) as e:
+                    # Report it as the shell does.
+                    msg = f'{cmd[0]}: {os.strerror(e.errno)}\n'.encode('utf8')
+                    await self.outsock.send_multipart([b'stderr', msg])
+                    return 127 if isinstance(e, FileNotFoundError) else 126
+            self.sched_policy.apply(proc.pid, group=True)
+            if not use_pty:
+                return await self.wait_subproc(proc)
+            # Only the child should hold the slave side so that reading the
+            # master ends when the child (and its descendants) exit.
+            os.close(slave)
+            slave = None
+            return await self.wait_subproc(proc, stdout=FdReader(master),
+                                           compact=True)
+        except Exception:
+            log.exception('unexpected error')
+            return -1
+        finally:
+            for fd in (master, slave):
+                if fd is not None:
+                    os.close(fd)
+
+    async def wait_subproc(self, proc, *, stdout=None, compact=False):
+        """
+        Relay the outputs of an already spawned process until it terminates.
+        The process becomes the target of interrupts while running.
+        ``stdout`` overrides the stream to read the process's stdout from,
+        and ``compact`` is passed to :func:`pipe_output`.
+        """
         loop = current_loop()
+        if stdout is None:
+            stdout = proc.stdout
         try:
-            # errors like "command not found" is handled by the spawned shell.
-            # (the subproc will terminate immediately with return code 127)
-            proc = await asyncio.create_subprocess_shell(
-                cmd,
-                env=self.child_env,
-                stdin=None,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
             self.subproc = proc
             pipe_tasks = [
-                loop.create_task(pipe_output(proc.stdout, self.outsock, 'stdout')),
-                loop.create_task(pipe_output(proc.stderr, self.outsock, 'stderr')),
+                loop.create_task(pipe_output(stdout, self.outsock, 'stdout',
+                                             compact=compact)),
+                loop.create_task(pipe_output(proc.stderr, self.outsock, 'stderr',
+                                             compact=compact)),
             ]
             retcode = await proc.wait()
             await asyncio.gather(*pipe_tasks)
             return retcode
-        except Exception:
-            log.exception('unexpected error')
-            return -1
         finally:
             self.subproc = None
 
@@ -341,12 +554,10 @@ class BaseRunner(ABC):
         log_queue = self.log_queue.async_q
         try:
             while True:
-                rec = await log_queue.get()
-                await self.outsock.send_multipart(rec)
-                log_queue.task_done()
+                for rec in await log_queue.get_batch():
+                    await self.outsock.send_multipart(rec)
         except asyncio.CancelledError:
-            log_queue.close()
-            await log_queue.wait_closed()
+            self.log_queue.close()
 
     async def main_loop(self, cmdargs):
         user_input_server = \
@@ -359,6 +570,11 @@ class BaseRunner(ABC):
                 data = await self.insock.recv_multipart()
                 op_type = data[0].decode('ascii')
                 text = data[1].decode('utf8')
+                if len(data) > 2:
+                    # an op for one of the multiple sessions hosted by the runner
+                    session_id = data[2].decode('utf8')
+                    await self.handle_session_op(session_id, op_type, text)
+                    continue
                 if op_type == 'clean':
                     await self.task_queue.put(partial(self._clean, text))
                 if op_type == 'build':    # batch-mode step 1
@@ -367,12 +583,20 @@ class BaseRunner(ABC):
                     await self.task_queue.put(partial(self._execute, text))
                 elif op_type == 'code':   # query-mode
                     await self.task_queue.put(partial(self._query, text))
+                elif op_type in ('snapshot', 'restore'):  # query-mode checkpoint
+                    await self.task_queue.put(
+                        partial(self._checkpoint, op_type, text))
                 elif op_type == 'input':  # interactive input
                     if self.user_input_queue is not None:
                         await self.user_input_queue.put(text)
                 elif op_type == 'complete':  # auto-completion
                     data = json.loads(text)
                     await self._complete(data)
+                elif op_type == 'variables':  # variable explorer
+                    await self._send_variables()
+                elif op_type == 'stacks':  # diagnosis of running code
+                    data = json.loads(text) if text else {}
+                    self.loop.create_task(self._send_stacks(data))
                 elif op_type == 'interrupt':
                     await self._interrupt()
                 elif op_type == 'status':
@@ -395,7 +619,8 @@ class BaseRunner(ABC):
     async def _init(self, cmdargs):
         self.loop = current_loop()
         # Initialize event loop.
-        executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.resources.executor_workers)
         self.loop.set_default_executor(executor)
 
         self.insock = self.zctx.socket(zmq.PULL, io_loop=self.loop)
@@ -403,11 +628,12 @@ class BaseRunner(ABC):
         self.outsock = self.zctx.socket(zmq.PUSH, io_loop=self.loop)
         self.outsock.bind('tcp://*:2001')
 
-        self.log_queue = janus.Queue(loop=self.loop)
+        self.log_queue = ThreadChannel(loop=self.loop)
         self.task_queue = asyncio.Queue(loop=self.loop)
         self.init_done = asyncio.Event(loop=self.loop)
 
         setup_logger(self.log_queue.sync_q, self.log_prefix, cmdargs.debug)
+        log.debug('using the {0} event loop', self.loop_impl)
         self._log_task = self.loop.create_task(self._handle_logs())
         self._main_task = self.loop.create_task(self.main_loop(cmdargs))
         self._run_task = self.loop.create_task(self.run_tasks())
@@ -440,8 +666,8 @@ class BaseRunner(ABC):
         # (trying to read stdin will raise EOFError immediately afterwards.)
         sys.stdin = open(os.devnull, 'rb')
 
-        # Terminal does not work with uvloop! :(
-        # FIXME: asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        self.loop_impl = install_event_loop_policy(
+            os.environ.get('BACKENDAI_EVENT_LOOP', 'uvloop'))
 
         asyncio_run_forever(self._init(cmdargs), self._shutdown(),
                             stop_signals={signal.SIGINT, signal.SIGTERM})
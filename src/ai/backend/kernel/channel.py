@@ -0,0 +1,205 @@
+'''
+A low-overhead message channel between worker threads and the asyncio loop.
+'''
+
+from collections import deque
+import queue
+import threading
+
+from .compat import current_loop
+
+__all__ = (
+    'ChannelClosed',
+    'ThreadChannel',
+)
+
+
+class ChannelClosed(Exception):
+    pass
+
+
+class _SyncView:
+    '''
+    The thread-side interface of ThreadChannel.
+    '''
+
+    __slots__ = ('put', 'put_nowait', 'get', 'get_nowait', 'qsize', 'empty')
+
+    def __init__(self, channel):
+        self.put = channel.put
+        self.put_nowait = channel.put
+        self.get = channel.get_sync
+        self.get_nowait = channel.get_nowait
+        self.qsize = channel.qsize
+        self.empty = channel.empty
+
+
+class _AsyncView:
+    '''
+    The loop-side interface of ThreadChannel, which is an asyncio.Queue-like
+    object so that it can be used as BaseRunner.user_input_queue as well.
+    '''
+
+    __slots__ = ('put', 'put_nowait', 'get', 'get_batch', 'get_nowait',
+                 'qsize', 'empty')
+
+    def __init__(self, channel):
+        self.put = channel.put_async
+        self.put_nowait = channel.put
+        self.get = channel.get_async
+        self.get_batch = channel.get_batch_async
+        self.get_nowait = channel.get_nowait
+        self.qsize = channel.qsize
+        self.empty = channel.empty
+
+
+class ThreadChannel:
+    '''
+    An unbounded FIFO channel between a thread and the asyncio loop,
+    designed for a single producer and a single consumer.
+
+    Unlike janus.Queue, putting an item does not take any lock nor schedule
+    a loop callback: items are appended to a deque and the consumer is woken
+    up only when it is actually waiting, i.e., upon the empty-to-non-empty
+    transition.  The loop-side wakeup goes through the event loop's
+    self-pipe via call_soon_threadsafe(), and the thread-side wakeup uses
+    a threading.Event.
+
+    Like janus.Queue, it exposes ``sync_q`` for threads and ``async_q`` for
+    coroutines.  The loop side may drain all pending items at once using
+    ``async_q.get_batch()``.
+    '''
+
+    def __init__(self, *, loop=None):
+        self._loop = loop if loop is not None else current_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._items = deque()
+        self._closed = False
+
+        self._loop_waiter = None
+        self._loop_waiting = False
+        self._thread_event = threading.Event()
+        self._thread_waiting = False
+
+        self.sync_q = _SyncView(self)
+        self.async_q = _AsyncView(self)
+
+    def qsize(self):
+        return len(self._items)
+
+    def empty(self):
+        return not self._items
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        self._closed = True
+        self._wakeup_waiters()
+
+    def put(self, item):
+        '''
+        Put an item without blocking.  It can be called from any thread,
+        including the event loop.
+        '''
+        if self._closed:
+            raise ChannelClosed
+        self._items.append(item)
+        if self._loop_waiting or self._thread_waiting:
+            self._wakeup_waiters()
+
+    async def put_async(self, item):
+        self.put(item)
+
+    def get_nowait(self):
+        try:
+            return self._items.popleft()
+        except IndexError:
+            if self._closed:
+                raise ChannelClosed
+            raise queue.Empty
+
+    def get_sync(self, timeout=None):
+        '''
+        Get an item, blocking the current thread until one is available.
+        It must not be called inside the event loop.
+        '''
+        items = self._items
+        while True:
+            try:
+                return items.popleft()
+            except IndexError:
+                pass
+            if self._closed:
+                raise ChannelClosed
+            self._thread_event.clear()
+            self._thread_waiting = True
+            # Re-check after announcing the wait to avoid lost wakeups.
+            if items or self._closed:
+                self._thread_waiting = False
+                continue
+            woken = self._thread_event.wait(timeout)
+            self._thread_waiting = False
+            if not woken:
+                raise queue.Empty
+
+    async def get_async(self):
+        '''
+        Get an item, waiting asynchronously until one is available.
+        '''
+        if not self._items:
+            await self._wait_async()
+        return self._items.popleft()
+
+    async def get_batch_async(self, max_items=None):
+        '''
+        Get all available items at once as a list, waiting asynchronously
+        until there is at least one item.
+        '''
+        items = self._items
+        if not items:
+            await self._wait_async()
+        if max_items is None or max_items >= len(items):
+            batch = list(items)
+            # Only the consumer removes items, so this does not drop
+            # concurrently appended ones.
+            for _ in range(len(batch)):
+                items.popleft()
+            return batch
+        return [items.popleft() for _ in range(max_items)]
+
+    async def _wait_async(self):
+        items = self._items
+        while not items:
+            if self._closed:
+                raise ChannelClosed
+            waiter = self._loop.create_future()
+            self._loop_waiter = waiter
+            self._loop_waiting = True
+            # Re-check after announcing the wait to avoid lost wakeups.
+            if items or self._closed:
+                self._loop_waiting = False
+                self._loop_waiter = None
+                continue
+            try:
+                await waiter
+            finally:
+                self._loop_waiting = False
+                self._loop_waiter = None
+
+    def _wakeup_waiters(self):
+        if self._loop_waiting:
+            self._loop_waiting = False
+            if threading.get_ident() == self._loop_thread_id:
+                self._wakeup_loop()
+            else:
+                self._loop.call_soon_threadsafe(self._wakeup_loop)
+        if self._thread_waiting:
+            self._thread_waiting = False
+            self._thread_event.set()
+
+    def _wakeup_loop(self):
+        waiter = self._loop_waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
@@ -0,0 +1,351 @@
+'''
+Compaction of console outputs for the clients.
+
+Progress bars and status lines redraw the current line(s) by carriage returns
+and ANSI cursor movements, often thousands of times per second, while the
+client only needs the latest state.  :class:`OutputCompactor` keeps a tiny
+model of the lines which may still change (the "live" rows) and sends their
+latest state at a capped refresh rate, as the minimal redraws of the rows
+that have changed.  Lines never redrawn pass through as-is with their own
+line endings, except that runs of identical lines are collapsed into a
+"(repeated N times)" note.
+'''
+
+import re
+import time
+
+ESC_ERASE_LINE = b'\x1b[K'
+
+_CONTROL_RE = re.compile(rb'\r\n|\r|\n|\x1b\[([0-9;]*)([ABCDGK])')
+_TOKEN_RE = re.compile(rb'\x1b\[[0-?]*[ -/]*[@-~]|\x1b[^\[]?|[\xc0-\xff][\x80-\xbf]*'
+                       rb'|[\x00-\xff]')
+_NON_ASCII_RE = re.compile(rb'[\x1b\x80-\xff]')
+_INCOMPLETE_ESC_RE = re.compile(rb'\x1b(\[[0-?]*[ -/]*)?$')
+
+
+def _is_cell(token):
+    # Escape sequences and stray UTF-8 continuation bytes take no columns.
+    return token[0] != 0x1b and not (0x80 <= token[0] <= 0xbf)
+
+
+def _width(data):
+    if not _NON_ASCII_RE.search(data):
+        return len(data)
+    return sum(1 for token in _TOKEN_RE.findall(data) if _is_cell(token))
+
+
+def _split_at(data, col):
+    # Split the line at the given column, keeping the zero-width tokens
+    # (e.g., colors) before the column in the head.
+    tokens = _TOKEN_RE.findall(data)
+    cells = 0
+    for index, token in enumerate(tokens):
+        if _is_cell(token):
+            if cells == col:
+                return b''.join(tokens[:index]), tokens[index:]
+            cells += 1
+    return data, []
+
+
+def _skip_cells(tokens, count):
+    for index, token in enumerate(tokens):
+        if _is_cell(token):
+            if count == 0:
+                return b''.join(tokens[index:])
+            count -= 1
+    return b''
+
+
+class OutputCompactor:
+    '''
+    Compacts a stream of console output bytes.  :meth:`feed` returns the
+    bytes to send for the given output, :meth:`refresh` should be called
+    periodically while :attr:`dirty`, and :meth:`flush` returns the rest at
+    the end of the output.  It is not thread-safe.
+
+    Only the overwrites of the live rows (by carriage returns, cursor
+    movements, and erases) are throttled; texts appended to them are sent as
+    they come.
+
+    Lines are committed (passed to the client as final) once the cursor has
+    moved below them, or, after cursor-up sequences have been seen (e.g.,
+    multiple progress bars), once they are more than ``max_live_rows`` rows
+    above the cursor.  Cursor movements above the live rows are clamped.
+
+    The repeats of a line are held back for at most ``refresh_interval`` so
+    that a program printing the same line periodically (e.g., a heartbeat)
+    does not look stalled.
+    '''
+
+    def __init__(self, *, refresh_interval=0.1, max_live_rows=24, min_repeats=3):
+        self.refresh_interval = refresh_interval
+        self.max_live_rows = max_live_rows
+        self.min_repeats = min_repeats
+        # the live rows (from the top), their widths and line endings
+        self._rows = [b'']
+        self._widths = [0]
+        self._eols = [b'\n']
+        self._row = 0
+        self._col = 0
+        self._multi_row = False
+        # the live rows as shown by the client and its cursor position
+        self._drawn = []
+        self._client_row = 0
+        self._client_col = 0
+        self._stale = False
+        self._overwritten = False
+        self._last_refresh = 0.0
+        self._last_line = None
+        self._last_eol = b'\n'
+        self._num_repeats = 0
+        self._repeats_since = 0.0
+        self._incomplete = b''
+        self._out = bytearray()
+
+    @property
+    def dirty(self):
+        '''
+        True if there are outputs held back to be sent by :meth:`refresh`.
+        '''
+        return self._stale or self._num_repeats > 0
+
+    # -- the model of the live rows --
+
+    def _ensure_row(self, row):
+        while len(self._rows) <= row:
+            self._rows.append(b'')
+            self._widths.append(0)
+            self._eols.append(b'\n')
+
+    def _write_text(self, text):
+        row, col = self._row, self._col
+        line, width = self._rows[row], self._widths[row]
+        text_width = _width(text)
+        if col == width:
+            line += text
+        elif col > width:
+            line += b' ' * (col - width) + text
+        elif col == 0 and text_width >= width:
+            line = text
+            self._overwritten = True
+        else:
+            head, tail = _split_at(line, col)
+            line = head + text + _skip_cells(tail, text_width)
+            self._overwritten = True
+        self._rows[row] = line
+        self._widths[row] = _width(line)
+        self._col = col + text_width
+
+    def _erase(self, mode):
+        row, col = self._row, self._col
+        line = self._rows[row]
+        if mode == 2:
+            line = b''
+        elif mode == 1:
+            _, tail = _split_at(line, col)
+            line = b' ' * col + _skip_cells(tail, 1)
+        else:
+            line, _ = _split_at(line, col)
+        self._rows[row] = line
+        self._widths[row] = _width(line)
+        self._overwritten = True
+
+    def _control(self, match):
+        seq = match.group(0)
+        if seq in (b'\n', b'\r\n'):
+            self._eols[self._row] = seq
+            self._row += 1
+            self._col = 0
+            self._ensure_row(self._row)
+            return
+        if seq == b'\r':
+            self._col = 0
+            return
+        param, command = match.group(1), match.group(2)
+        try:
+            n = int(param.split(b';')[0]) if param else None
+        except ValueError:
+            n = None
+        if command == b'A':
+            self._row = max(0, self._row - (n or 1))
+            self._multi_row = True
+        elif command == b'B':
+            self._row += n or 1
+            self._ensure_row(self._row)
+        elif command == b'C':
+            self._col += n or 1
+        elif command == b'D':
+            self._col = max(0, self._col - (n or 1))
+        elif command == b'G':
+            self._col = max(0, (n or 1) - 1)
+        elif command == b'K':
+            self._erase(n or 0)
+
+    # -- the output to the client --
+
+    def _move_client(self, row, col):
+        out = self._out
+        if row < self._client_row:
+            out += b'\x1b[%dA' % (self._client_row - row)
+        elif row > self._client_row:
+            out += b'\n' * (row - self._client_row)
+            self._client_col = 0
+        if col != self._client_col:
+            out += b'\r' if col == 0 else b'\r\x1b[%dC' % col
+        self._client_row, self._client_col = row, col
+
+    def _sync_row(self, row):
+        line = self._rows[row]
+        if row < len(self._drawn):
+            old = self._drawn[row]
+            if line == old:
+                return
+            if old and line.startswith(old):
+                self._move_client(row, _width(old))
+                self._out += line[len(old):]
+            else:
+                self._move_client(row, 0)
+                self._out += line
+                if self._widths[row] < _width(old):
+                    self._out += ESC_ERASE_LINE
+            self._drawn[row] = line
+        else:
+            self._move_client(row, 0)
+            self._out += line
+            self._drawn.append(line)
+        self._client_col = self._widths[row]
+
+    def _flush_repeats(self):
+        if not self._num_repeats:
+            return
+        if self._num_repeats < self.min_repeats:
+            self._out += (self._last_line + self._last_eol) * self._num_repeats
+        else:
+            self._out += b'(repeated %d times)%s' % (self._num_repeats,
+                                                     self._last_eol)
+        self._num_repeats = 0
+
+    def _commit(self, count, now):
+        num_drawn = min(count, len(self._drawn))
+        if num_drawn:
+            self._flush_repeats()
+            for row in range(num_drawn):
+                self._sync_row(row)
+            self._move_client(num_drawn, 0)
+            self._last_line = self._rows[num_drawn - 1]
+            self._last_eol = b'\n'
+        # The rest have never been shown.
+        for line, eol in zip(self._rows[num_drawn:count],
+                             self._eols[num_drawn:count]):
+            if line == self._last_line and line.strip():
+                if not self._num_repeats:
+                    self._repeats_since = now
+                self._num_repeats += 1
+                continue
+            self._flush_repeats()
+            self._out += line + eol
+            self._last_line, self._last_eol = line, eol
+        del self._rows[:count]
+        del self._widths[:count]
+        del self._eols[:count]
+        del self._drawn[:num_drawn]
+        self._row -= count
+        self._client_row -= num_drawn
+
+    def _is_synced(self):
+        if (self._client_row, self._client_col) != (self._row, self._col):
+            return False
+        num_drawn = len(self._drawn)
+        return (self._rows[:num_drawn] == self._drawn and
+                not any(self._rows[num_drawn:]))
+
+    def _redraw(self):
+        self._flush_repeats()
+        for row in range(len(self._rows)):
+            self._sync_row(row)
+        self._move_client(self._row, self._col)
+        self._stale = False
+        self._overwritten = False
+
+    def _take_output(self):
+        data = bytes(self._out)
+        self._out.clear()
+        return data
+
+    def feed(self, data, now=None):
+        if now is None:
+            now = time.monotonic()
+        if self._incomplete:
+            data = self._incomplete + data
+            self._incomplete = b''
+        match = _INCOMPLETE_ESC_RE.search(data)
+        if match is not None:
+            self._incomplete = data[match.start():]
+            data = data[:match.start()]
+        if (not self._multi_row and len(self._rows) == 1 and
+                self._col == self._widths[0] and
+                b'\r' not in data and b'\x1b' not in data):
+            # the fast path for plain lines
+            lines = data.split(b'\n')
+            lines[0] = self._rows[0] + lines[0]
+            self._rows = lines
+            self._widths = [_width(lines[0])] + [0] * (len(lines) - 1)
+            if len(lines) > 1:
+                self._widths[-1] = _width(lines[-1])
+            self._eols = [b'\n'] * len(lines)
+            self._row = len(lines) - 1
+            self._col = self._widths[-1]
+        else:
+            pos = 0
+            for match in _CONTROL_RE.finditer(data):
+                if match.start() > pos:
+                    self._write_text(data[pos:match.start()])
+                self._control(match)
+                pos = match.end()
+            if pos < len(data):
+                self._write_text(data[pos:])
+        if self._multi_row:
+            count = max(0, self._row - self.max_live_rows + 1)
+        else:
+            count = self._row
+        if count:
+            self._commit(count, now)
+        self._stale = not self._is_synced()
+        return self.refresh(now)
+
+    def refresh(self, now=None):
+        '''
+        Redraw the changed live rows if the refresh interval has passed.
+        The texts only appended since the last redraw are sent immediately.
+        The repeats of a line held back for the refresh interval are sent
+        as well.
+        '''
+        if not self.dirty:
+            return self._take_output()
+        if now is None:
+            now = time.monotonic()
+        if (self._num_repeats and
+                now - self._repeats_since >= self.refresh_interval):
+            if self._num_repeats >= self.min_repeats:
+                # Show the line again before the next note of its repeats.
+                self._last_line = None
+            self._flush_repeats()
+        if self._stale:
+            if (not self._overwritten or
+                    now - self._last_refresh >= self.refresh_interval):
+                self._redraw()
+                self._last_refresh = now
+        return self._take_output()
+
+    def flush(self):
+        '''
+        Send everything pending, including the collapsed repeats.
+        '''
+        if self._incomplete:
+            self._write_text(self._incomplete)
+            self._incomplete = b''
+            self._stale = True
+        if self._stale:
+            self._redraw()
+        self._flush_repeats()
+        return self._take_output()
@@ -3,6 +3,7 @@ import signal
 
 __all__ = (
     'current_loop',
+    'install_event_loop_policy',
 )
 
 
@@ -59,6 +60,24 @@ else:
     asyncio_run = _asyncio_run
 
 
+def install_event_loop_policy(name='uvloop'):
+    '''
+    Install the event loop policy of the given implementation ("uvloop" or
+    "asyncio") and return the name of the one actually installed.
+    It falls back to the default asyncio loop if uvloop is not available.
+    '''
+    if name == 'uvloop':
+        try:
+            import uvloop
+        except ImportError:
+            pass
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            return 'uvloop'
+    asyncio.set_event_loop_policy(None)
+    return 'asyncio'
+
+
 def asyncio_run_forever(setup_coro, shutdown_coro, *,
                         stop_signals={signal.SIGINT}, debug=False):
     '''
@@ -5,6 +5,7 @@ import shlex
 import tempfile
 
 from .. import BaseRunner
+from ..utils import scratch_dir
 
 log = logging.getLogger()
 
@@ -34,7 +35,7 @@ class Runner(BaseRunner):
 
     async def clean_heuristic(self) -> int:
         if Path('Makefile').is_file():
-            return await self.run_subproc('make clean')
+            return await self.run_subproc(['make', 'clean'])
         log.warning('skipping the clean phase due to missing "Makefile".')
         return 0
 
@@ -43,13 +44,12 @@ class Runner(BaseRunner):
             cppfiles = list(Path('.').glob('**/*.cpp'))
             ofiles = [Path(p.stem + '.o') for p in sorted(cppfiles)]
             for cppf in cppfiles:
-                cmd = f'g++ -c {cppf} {DEFAULT_CFLAGS}'
+                cmd = ['g++', '-c', str(cppf), *shlex.split(DEFAULT_CFLAGS)]
                 ret = await self.run_subproc(cmd)
                 if ret != 0:  # stop if gcc has failed
                     return ret
-            cppfiles = ' '.join(map(lambda p: shlex.quote(str(p)), cppfiles))
-            ofiles = ' '.join(map(lambda p: shlex.quote(str(p)), ofiles))
-            cmd = f'g++ {ofiles} {DEFAULT_LDFLAGS} -o ./main'
+            cmd = ['g++', *map(str, ofiles), *shlex.split(DEFAULT_LDFLAGS),
+                   '-o', './main']
             return await self.run_subproc(cmd)
         else:
             log.error('cannot find build script ("Makefile") '
@@ -58,22 +58,24 @@ class Runner(BaseRunner):
 
     async def execute_heuristic(self) -> int:
         if Path('./main').is_file():
-            return await self.run_subproc('./main')
+            return await self.run_subproc(['./main'])
         elif Path('./a.out').is_file():
-            return await self.run_subproc('./a.out')
+            return await self.run_subproc(['./a.out'])
         else:
             log.error('cannot find executable ("a.out" or "main").')
             return 127
 
     async def query(self, code_text) -> int:
-        with tempfile.NamedTemporaryFile(suffix='.cpp', dir='.') as tmpf:
-            tmpf.write(code_text.encode('utf8'))
-            tmpf.flush()
-            cmd = (
-                f'g++ {tmpf.name} {DEFAULT_CFLAGS} -o ./main {DEFAULT_LDFLAGS}'
-                f'&& ./main'
-            )
-            return await self.run_subproc(cmd)
+        with tempfile.TemporaryDirectory(dir=scratch_dir()) as tmpdir:
+            src = Path(tmpdir) / 'main.cpp'
+            src.write_bytes(code_text.encode('utf8'))
+            binary = Path(tmpdir) / 'main'
+            cmd = ['g++', str(src), *shlex.split(DEFAULT_CFLAGS),
+                   '-o', str(binary), *shlex.split(DEFAULT_LDFLAGS)]
+            ret = await self.run_subproc(cmd)
+            if ret != 0:  # stop if g++ has failed
+                return ret
+            return await self.run_subproc([str(binary)])
 
     async def complete(self, data):
         return []
@@ -4,6 +4,7 @@ import shlex
 import tempfile
 
 from .. import BaseRunner
+from ..utils import scratch_dir
 
 log = logging.getLogger()
 
@@ -34,8 +35,8 @@ class Runner(BaseRunner):
     async def build_heuristic(self) -> int:
         if Path('main.go').is_file():
             gofiles = Path('.').glob('**/*.go')
-            gofiles = ' '.join(map(lambda p: shlex.quote(str(p)), gofiles))
-            cmd = f'go build -o main {DEFAULT_BFLAGS} {gofiles}'
+            cmd = ['go', 'build', '-o', 'main', *shlex.split(DEFAULT_BFLAGS),
+                   *map(str, gofiles)]
             return await self.run_subproc(cmd)
         else:
             log.error('cannot find main file ("main.go").')
@@ -43,16 +44,17 @@ class Runner(BaseRunner):
 
     async def execute_heuristic(self) -> int:
         if Path('./main').is_file():
-            return await self.run_subproc('./main')
+            return await self.run_subproc(['./main'])
         else:
             log.error('cannot find executable ("main").')
             return 127
 
     async def query(self, code_text) -> int:
-        with tempfile.NamedTemporaryFile(suffix='.go', dir='.') as tmpf:
+        with tempfile.NamedTemporaryFile(suffix='.go',
+                                         dir=scratch_dir()) as tmpf:
             tmpf.write(code_text.encode('utf8'))
             tmpf.flush()
-            cmd = f'go run {tmpf.name}'
+            cmd = ['go', 'run', tmpf.name]
             return await self.run_subproc(cmd)
 
     async def complete(self, data):
@@ -1,10 +1,10 @@
 import logging
 import os
 from pathlib import Path
-import shlex
 import tempfile
 
 from .. import BaseRunner
+from ..utils import scratch_dir
 
 log = logging.getLogger()
 
@@ -35,22 +35,22 @@ class Runner(BaseRunner):
     async def build_heuristic(self) -> int:
         # GHC will generate error if no Main module exist among srcfiles.
         srcfiles = Path('.').glob('**/*.hs')
-        srcfiles = ' '.join(map(lambda p: shlex.quote(str(p)), srcfiles))
-        cmd = f'ghc --make main {srcfiles}'
+        cmd = ['ghc', '--make', 'main', *map(str, srcfiles)]
         return await self.run_subproc(cmd)
 
     async def execute_heuristic(self) -> int:
         if Path('./main').is_file():
-            return await self.run_subproc('./main')
+            return await self.run_subproc(['./main'])
         else:
             log.error('cannot find executable ("main").')
             return 127
 
     async def query(self, code_text) -> int:
-        with tempfile.NamedTemporaryFile(suffix='.hs', dir='.') as tmpf:
+        with tempfile.NamedTemporaryFile(suffix='.hs',
+                                         dir=scratch_dir()) as tmpf:
             tmpf.write(code_text.encode('utf8'))
             tmpf.flush()
-            cmd = f'runhaskell {tmpf.name}'
+            cmd = ['runhaskell', tmpf.name]
             return await self.run_subproc(cmd)
 
     async def complete(self, data):
@@ -7,6 +7,7 @@ import shlex
 import tempfile
 
 from .. import BaseRunner
+from ..utils import scratch_dir
 
 log = logging.getLogger()
 
@@ -56,22 +57,15 @@ class Runner(BaseRunner):
         self.user_input_queue = asyncio.Queue()
 
     async def build_heuristic(self) -> int:
-        if Path('Main.java').is_file():
-            javafiles = Path('.').glob('**/*.java')
-            javafiles = ' '.join(map(lambda p: shlex.quote(str(p)), javafiles))
-            cmd = f'{JCC} {DEFAULT_JFLAGS} {javafiles}'
-            return await self.run_subproc(cmd)
-        else:
-            javafiles = Path('.').glob('**/*.java')
-            javafiles = ' '.join(map(lambda p: shlex.quote(str(p)), javafiles))
-            cmd = f'{JCC} {DEFAULT_JFLAGS} {javafiles}'
-            return await self.run_subproc(cmd)
+        javafiles = Path('.').glob('**/*.java')
+        cmd = [JCC, *shlex.split(DEFAULT_JFLAGS), *map(str, javafiles)]
+        return await self.run_subproc(cmd)
 
     async def execute_heuristic(self) -> int:
         if Path('./main/Main.class').is_file():
-            return await self.run_subproc(f'{JCR} main.Main')
+            return await self.run_subproc([JCR, 'main.Main'])
         elif Path('./Main.class').is_file():
-            return await self.run_subproc(f'{JCR} Main')
+            return await self.run_subproc([JCR, 'Main'])
         else:
             log.error('cannot find entry class (main.Main).')
             return 127
@@ -83,7 +77,7 @@ class Runner(BaseRunner):
         # static void method where the filename must be same to the class name)
         #
         # NOTE: This approach won't perfectly handle all edge cases!
-        with tempfile.TemporaryDirectory() as tmpdir:
+        with tempfile.TemporaryDirectory(dir=scratch_dir()) as tmpdir:
             m = re.search(r'public[\s]+class[\s]+([\w]+)[\s]*{', code_text)
             if m:
                 mainpath = Path(tmpdir) / (m.group(1) + '.java')
@@ -93,8 +87,10 @@ class Runner(BaseRunner):
             code = self._code_for_user_input_server(code_text)
             with open(mainpath, 'w', encoding='utf-8') as tmpf:
                 tmpf.write(code)
-            cmd = f'{JCC} {mainpath} && ' \
-                  f'{JCR} -classpath {tmpdir} {mainpath.stem}'
+            ret = await self.run_subproc([JCC, str(mainpath)])
+            if ret != 0:  # stop if javac has failed
+                return ret
+            cmd = [JCR, '-classpath', tmpdir, mainpath.stem]
             return await self.run_subproc(cmd)
 
     async def complete(self, data):
@@ -4,6 +4,7 @@ from pathlib import Path
 import tempfile
 
 from .. import BaseRunner
+from ..utils import MAX_ARG_SIZE, scratch_dir
 
 log = logging.getLogger()
 
@@ -36,17 +37,22 @@ class Runner(BaseRunner):
 
     async def execute_heuristic(self) -> int:
         if Path('main.jl').is_file():
-            cmd = 'julia main.jl'
+            cmd = ['julia', 'main.jl']
             return await self.run_subproc(cmd)
         else:
             log.error('cannot find executable ("main.jl").')
             return 127
 
     async def query(self, code_text) -> int:
-        with tempfile.NamedTemporaryFile(suffix='.jl', dir='.') as tmpf:
+        if len(code_text.encode('utf8')) < MAX_ARG_SIZE and '\0' not in code_text:
+            # Evaluate it without a file so that relative include()s are
+            # resolved against the working directory.
+            return await self.run_subproc(['julia', '-e', code_text])
+        with tempfile.NamedTemporaryFile(suffix='.jl',
+                                         dir=scratch_dir()) as tmpf:
             tmpf.write(code_text.encode('utf8'))
             tmpf.flush()
-            cmd = f'julia {tmpf.name}'
+            cmd = ['julia', tmpf.name]
             return await self.run_subproc(cmd)
 
     async def complete(self, data):
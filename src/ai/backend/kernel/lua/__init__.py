@@ -4,6 +4,7 @@ from pathlib import Path
 import tempfile
 
 from .. import BaseRunner
+from ..utils import scratch_dir
 
 log = logging.getLogger()
 
@@ -35,17 +36,18 @@ class Runner(BaseRunner):
 
     async def execute_heuristic(self) -> int:
         if Path('main.lua').is_file():
-            cmd = 'lua main.lua'
+            cmd = ['lua', 'main.lua']
             return await self.run_subproc(cmd)
         else:
             log.error('cannot find executable ("main.lua").')
             return 127
 
     async def query(self, code_text) -> int:
-        with tempfile.NamedTemporaryFile(suffix='.lua', dir='.') as tmpf:
+        with tempfile.NamedTemporaryFile(suffix='.lua',
+                                         dir=scratch_dir()) as tmpf:
             tmpf.write(code_text.encode('utf8'))
             tmpf.flush()
-            cmd = f'lua {tmpf.name}'
+            cmd = ['lua', tmpf.name]
             return await self.run_subproc(cmd)
 
     async def complete(self, data):
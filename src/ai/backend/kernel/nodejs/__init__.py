@@ -4,6 +4,7 @@ from pathlib import Path
 import tempfile
 
 from .. import BaseRunner
+from ..utils import MAX_ARG_SIZE, scratch_dir
 
 log = logging.getLogger()
 
@@ -35,17 +36,22 @@ class Runner(BaseRunner):
 
     async def execute_heuristic(self) -> int:
         if Path('main.js').is_file():
-            cmd = 'node main.js'
+            cmd = ['node', 'main.js']
             return await self.run_subproc(cmd)
         else:
             log.error('cannot find executable ("main.js").')
             return 127
 
     async def query(self, code_text) -> int:
-        with tempfile.NamedTemporaryFile(suffix='.js', dir='.') as tmpf:
+        if len(code_text.encode('utf8')) < MAX_ARG_SIZE and '\0' not in code_text:
+            # Evaluate it without a file so that relative require()s are
+            # resolved against the working directory.
+            return await self.run_subproc(['node', '-e', code_text])
+        with tempfile.NamedTemporaryFile(suffix='.js',
+                                         dir=scratch_dir()) as tmpf:
             tmpf.write(code_text.encode('utf8'))
             tmpf.flush()
-            cmd = f'node {tmpf.name}'
+            cmd = ['node', tmpf.name]
             return await self.run_subproc(cmd)
 
     async def complete(self, data):
@@ -4,6 +4,7 @@ from pathlib import Path
 import tempfile
 
 from .. import BaseRunner
+from ..utils import scratch_dir
 
 log = logging.getLogger()
 
@@ -35,18 +36,19 @@ class Runner(BaseRunner):
 
     async def execute_heuristic(self) -> int:
         if Path('main.js').is_file():
-            cmd = 'octave-cli main.m'
+            cmd = ['octave-cli', 'main.m']
             return await self.run_subproc(cmd)
         else:
             log.error('cannot find executable ("main.m").')
             return 127
 
     async def query(self, code_text) -> int:
-        with tempfile.NamedTemporaryFile(suffix='.m', dir='.') as tmpf:
+        with tempfile.NamedTemporaryFile(suffix='.m',
+                                         dir=scratch_dir()) as tmpf:
             tmpf.write(code_text.encode('utf8'))
             tmpf.flush()
             # TODO: support graphics output to display
-            cmd = f'octave-cli {tmpf.name}'
+            cmd = ['octave-cli', tmpf.name]
             return await self.run_subproc(cmd)
 
     async def complete(self, data):
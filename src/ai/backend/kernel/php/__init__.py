@@ -4,6 +4,7 @@ from pathlib import Path
 import tempfile
 
 from .. import BaseRunner
+from ..utils import scratch_dir
 
 log = logging.getLogger()
 
@@ -35,18 +36,19 @@ class Runner(BaseRunner):
 
     async def execute_heuristic(self) -> int:
         if Path('main.php').is_file():
-            cmd = 'php main.php'
+            cmd = ['php', 'main.php']
             return await self.run_subproc(cmd)
         else:
             log.error('cannot find executable ("main.php").')
             return 127
 
     async def query(self, code_text) -> int:
-        with tempfile.NamedTemporaryFile(suffix='.php', dir='.') as tmpf:
+        with tempfile.NamedTemporaryFile(suffix='.php',
+                                         dir=scratch_dir()) as tmpf:
             tmpf.write(b'<?php\n\n')
             tmpf.write(code_text.encode('utf8'))
             tmpf.flush()
-            cmd = f'php {tmpf.name}'
+            cmd = ['php', tmpf.name]
             return await self.run_subproc(cmd)
 
     async def complete(self, data):
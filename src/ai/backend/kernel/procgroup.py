@@ -0,0 +1,135 @@
+'''
+Interrupting the child processes of the kernel runner with their descendants.
+
+Each child process starts a new session (and so its own process group) so
+that interrupts reach the programs it has spawned as well, e.g., those run
+by a shell, a build tool or a test harness.  An interrupt sends SIGINT to
+the whole group and escalates to SIGTERM and then SIGKILL if any process
+of the group survives the grace periods, which are configured by the
+``BACKENDAI_INTERRUPT_GRACE`` environment variable as the seconds before
+each escalation, e.g., ``"2,3"``.
+'''
+
+import asyncio
+import logging
+import os
+import signal
+
+from .compat import current_loop
+from .logging import BraceStyleAdapter
+
+log = BraceStyleAdapter(logging.getLogger())
+
+__all__ = (
+    'group_members',
+    'grace_periods_from_env',
+    'terminate_group',
+)
+
+DEFAULT_GRACE_PERIODS = (2.0, 3.0)
+ESCALATION = (signal.SIGINT, signal.SIGTERM, signal.SIGKILL)
+KILL_TIMEOUT = 5.0  # processes in uninterruptible sleeps may linger
+
+
+def grace_periods_from_env():
+    text = os.environ.get('BACKENDAI_INTERRUPT_GRACE')
+    if not text:
+        return DEFAULT_GRACE_PERIODS
+    try:
+        periods = tuple(float(item) for item in text.split(','))
+        if len(periods) != 2 or any(p < 0 for p in periods):
+            raise ValueError
+    except ValueError:
+        log.warning('ignoring invalid interrupt grace periods: {0!r}', text)
+        return DEFAULT_GRACE_PERIODS
+    return periods
+
+
+def group_members(pgid, *, proc_root='/proc'):
+    '''
+    Returns the list of (pid, state) pairs of the processes in the process
+    group, where the state is the one-letter code of ``/proc/<pid>/stat``
+    (e.g., "R" for running and "Z" for zombies).
+    '''
+    members = []
+    try:
+        entries = os.scandir(proc_root)
+    except OSError:
+        return members
+    with entries:
+        for entry in entries:
+            if not entry.name.isdigit():
+                continue
+            try:
+                with open(os.path.join(entry.path, 'stat'), 'rb') as f:
+                    stat = f.read()
+            except OSError:
+                continue  # already gone
+            # The command name (in parentheses) may contain spaces.
+            fields = stat[stat.rindex(b')') + 2:].split()
+            if int(fields[2]) == pgid:
+                members.append((int(entry.name), fields[0].decode('ascii')))
+    return members
+
+
+def _signal_group(proc, sig):
+    try:
+        os.killpg(proc.pid, sig)
+        return True
+    except ProcessLookupError:
+        pass
+    if proc.returncode is None:
+        # It has not started its own process group yet.
+        try:
+            os.kill(proc.pid, sig)
+            return True
+        except ProcessLookupError:
+            pass
+    return False
+
+
+def _reap_group(proc):
+    '''
+    Reap the zombies in the group left to the kernel runner (e.g., when it
+    runs as the init process of the container), except the group leader
+    which is waited by its owner.  Returns the number of the other (live)
+    processes in the group.
+    '''
+    alive = 0
+    for pid, state in group_members(proc.pid):
+        if pid == proc.pid:
+            continue
+        if state != 'Z':
+            alive += 1
+            continue
+        try:
+            os.waitpid(pid, os.WNOHANG)
+        except ChildProcessError:
+            pass  # not our child; its parent will reap it.
+    return alive
+
+
+async def terminate_group(proc, grace_periods=DEFAULT_GRACE_PERIODS, *,
+                          poll_interval=0.05):
+    '''
+    Interrupt the process group led by the child process ``proc`` (an
+    asyncio.subprocess.Process or alike) with SIGINT and escalate to SIGTERM
+    and SIGKILL while any process of the group survives each grace period.
+
+    Returns the last signal sent, or None if there was nothing to signal.
+    '''
+    loop = current_loop()
+    last_sig = None
+    for sig, grace in zip(ESCALATION, (*grace_periods, KILL_TIMEOUT)):
+        if last_sig is not None:
+            log.info('escalating the interrupt of the process group {0} '
+                     'to {1}', proc.pid, sig.name)
+        if not _signal_group(proc, sig):
+            break
+        last_sig = sig
+        deadline = loop.time() + grace
+        while loop.time() < deadline:
+            if _reap_group(proc) == 0 and proc.returncode is not None:
+                return last_sig
+            await asyncio.sleep(poll_interval)
+    return last_sig
@@ -1,21 +1,23 @@
 import asyncio
-import ctypes
 import json
 import logging
 import os
 from pathlib import Path
+import re
+import shlex
 import shutil
 import site
 import tempfile
-import threading
-
-import janus
 
 from .. import BaseRunner
-from .inproc import PythonInprocRunner
+from .inproc import DEFAULT_SNAPSHOT_PATH
+from .session import QuerySession
+from .zygote import PythonZygote
 
 log = logging.getLogger()
 
+SESSION_ID_REGEX = re.compile(r'\w[\w.-]{0,127}')
+
 DEFAULT_PYFLAGS = ''
 CHILD_ENV = {
     'TERM': 'xterm',
@@ -45,10 +47,35 @@ class Runner(BaseRunner):
     def __init__(self):
         super().__init__()
         self.child_env.update(CHILD_ENV)
-        self.inproc_runner = None
-        self.sentinel = object()
-        self.input_queue = None
-        self.output_queue = None
+        # the session for the ops without session IDs
+        self.default_session = None
+        # secondary sessions hosted by this runner, keyed by session IDs
+        self.sessions = {}
+
+        # Run query-mode user codes in a thread (default) or in a separate
+        # child process ("process") which supports real interrupts.
+        self.isolation = os.environ.get('BACKENDAI_PYTHON_ISOLATION', 'thread')
+        max_rss = os.environ.get('BACKENDAI_PYTHON_SESSION_MAX_RSS_MB')
+        self.session_max_rss = int(max_rss) * 2**20 if max_rss else None
+
+        # Pre-import the heavy modules frequently used in the past sessions
+        # while idle.  ("0" disables both recording and pre-warming.)
+        self.prewarm = os.environ.get('BACKENDAI_PYTHON_PREWARM', '1') != '0'
+
+        # Report the memory usage of every query-mode cell ("rss" or
+        # "tracemalloc"), warning when a cell grows the process past the
+        # given share of the memory limit.  (Also switchable by %memprof.)
+        self.memory_profile = \
+            os.environ.get('BACKENDAI_PYTHON_MEMORY_PROFILE') or None
+        self.memory_warn_ratio = float(
+            os.environ.get('BACKENDAI_PYTHON_MEMORY_WARN_RATIO', '0.8'))
+
+        # Serve batch executions by forking a zygote process which has
+        # pre-imported these modules.  (An empty value disables it.)
+        preload = os.environ.get('BACKENDAI_PYTHON_ZYGOTE_PRELOAD', 'numpy,pandas')
+        self.zygote_modules = [m.strip() for m in preload.split(',') if m.strip()]
+        self.zygote = None
+        self._zygote_start_task = None
 
         # Add sitecustomize.py to site-packages directory.
         # No permission to access global site packages, we use user local directory.
@@ -59,16 +86,20 @@ class Runner(BaseRunner):
         shutil.copy(str(input_src), str(pkgdir / 'sitecustomize.py'))
 
     async def init_with_loop(self):
-        self.input_queue = janus.Queue(loop=self.loop)
-        self.output_queue = janus.Queue(loop=self.loop)
+        self.default_session = self.create_session(None)
 
         # We have interactive input functionality!
-        self._user_input_queue = janus.Queue(loop=self.loop)
-        self.user_input_queue = self._user_input_queue.async_q
+        self.user_input_queue = self.default_session.user_input_queue.async_q
+
+        # Pre-warm the in-process runner so that the first query does not
+        # pay for its startup.
+        self.default_session.ensure_inproc_runner()
 
     async def build_heuristic(self) -> int:
         if Path('setup.py').is_file():
-            cmd = f'python {DEFAULT_PYFLAGS} setup.py develop'
+            # The build may change installed packages the zygote has imported.
+            await self.stop_zygote()
+            cmd = ['python', *shlex.split(DEFAULT_PYFLAGS), 'setup.py', 'develop']
             return await self.run_subproc(cmd)
         else:
             log.warning('skipping the build phase due to missing "setup.py" file')
@@ -76,55 +107,166 @@ class Runner(BaseRunner):
 
     async def execute_heuristic(self) -> int:
         if Path('main.py').is_file():
-            cmd = f'python {DEFAULT_PYFLAGS} main.py'
+            proc = await self.spawn_from_zygote(['python', 'main.py'])
+            if proc is not None:
+                self.sched_policy.apply(proc.pid)
+                return await self.wait_subproc(proc)
+            cmd = ['python', *shlex.split(DEFAULT_PYFLAGS), 'main.py']
             return await self.run_subproc(cmd)
         else:
             log.error('cannot find the main script ("main.py").')
             return 127
 
+    async def spawn_from_zygote(self, argv):
+        '''
+        Fork the given Python program from the zygote process.
+        It returns None if the zygote is not available (yet), and then the
+        caller should spawn the program as usual.
+        The zygote is started in the background upon the first call.
+        '''
+        if not self.zygote_modules or DEFAULT_PYFLAGS:
+            return None
+        if self._zygote_start_task is None:
+            self.zygote = PythonZygote('python', self.zygote_modules,
+                                       self.child_env, loop=self.loop)
+            self._zygote_start_task = self.loop.create_task(self.zygote.start())
+            return None
+        if not self._zygote_start_task.done():
+            return None
+        if not self.zygote.ready:
+            if self.zygote.reason is not None:
+                log.warning('zygote is disabled: %s', self.zygote.reason)
+                self.zygote.reason = None
+            return None
+        try:
+            return await self.zygote.spawn(argv, self.child_env, os.getcwd())
+        except Exception:
+            log.exception('zygote spawn failed; falling back to normal spawn')
+            await self.stop_zygote()
+            return None
+
+    async def stop_zygote(self):
+        if self._zygote_start_task is not None:
+            await self._zygote_start_task
+            await self.zygote.close()
+            self.zygote = None
+            self._zygote_start_task = None
+
     async def query(self, code_text) -> int:
-        self.ensure_inproc_runner()
-        await self.input_queue.async_q.put(code_text)
-        # Read the generated outputs until done
-        while True:
-            try:
-                msg = await self.output_queue.async_q.get()
-            except asyncio.CancelledError:
-                break
-            self.output_queue.async_q.task_done()
-            if msg is self.sentinel:
-                break
-            self.outsock.send_multipart(msg)
-        return 0
+        return await self.default_session.query(code_text,
+                                                self.outsock.send_multipart)
+
+    async def snapshot(self, path):
+        return await self.query(f'%snapshot {path}')
+
+    async def restore(self, path):
+        return await self.query(f'%restore {path}')
 
     async def complete(self, data):
-        self.ensure_inproc_runner()
-        matches = self.inproc_runner.complete(data)
+        matches = await self.default_session.complete(data)
         self.outsock.send_multipart([
             b'completion',
             json.dumps(matches).encode('utf8'),
         ])
 
     async def interrupt(self):
-        if self.inproc_runner is None:
-            log.error('No user code is running!')
-            return
-        # A dirty hack to raise an exception inside a running thread.
-        target_tid = self.inproc_runner.ident
-        if target_tid not in {t.ident for t in threading.enumerate()}:
-            log.error('Interrupt failed due to missing thread.')
+        self.default_session.interrupt()
+
+    async def variables(self):
+        return await self.default_session.inspect_variables()
+
+    async def stacks(self, options):
+        return await self.default_session.inspect_stacks(options)
+
+    def create_session(self, session_id):
+        if session_id is None:
+            snapshot_path = None
+        else:
+            snapshot_path = DEFAULT_SNAPSHOT_PATH / 'sessions' / session_id
+        return QuerySession(session_id, loop=self.loop,
+                            isolation=self.isolation,
+                            max_rss=self.session_max_rss,
+                            prewarm=self.prewarm,
+                            snapshot_path=snapshot_path,
+                            memory_profile=self.memory_profile,
+                            memory_warn_ratio=self.memory_warn_ratio)
+
+    async def handle_session_op(self, session_id, op_type, text):
+        if not SESSION_ID_REGEX.fullmatch(session_id):
+            log.error('invalid session ID: %r', session_id)
             return
-        affected_count = ctypes.pythonapi.PyThreadState_SetAsyncExc(
-            ctypes.c_long(target_tid),
-            ctypes.py_object(KeyboardInterrupt))
-        if affected_count == 0:
-            log.error('Interrupt failed due to invalid thread identity.')
-        elif affected_count > 1:
-            ctypes.pythonapi.PyThreadState_SetAsyncExc(
-                ctypes.c_long(target_tid),
-                ctypes.c_long(0))
-            log.error('Interrupt broke the interpreter state -- '
-                      'recommended to reset the session.')
+        session = self.sessions.get(session_id)
+        if session is None:
+            if op_type == 'close-session':
+                return
+            session = self.sessions[session_id] = self.create_session(session_id)
+            session.worker_task = self.loop.create_task(
+                self._run_session_tasks(session))
+        if op_type in ('code', 'snapshot', 'restore', 'close-session'):
+            await session.task_queue.put((op_type, text))
+        elif op_type == 'input':
+            await session.user_input_queue.async_q.put(text)
+        elif op_type == 'complete':
+            matches = await session.complete(json.loads(text))
+            self.outsock.send_multipart([
+                b'completion',
+                json.dumps(matches).encode('utf8'),
+                session_id.encode('utf8'),
+            ])
+        elif op_type == 'variables':
+            variables = await session.inspect_variables()
+            self.outsock.send_multipart([
+                b'variables',
+                json.dumps(variables).encode('utf8'),
+                session_id.encode('utf8'),
+            ])
+        elif op_type == 'stacks':
+            # A sampling burst should not block the other ops.
+            self.loop.create_task(self._send_session_stacks(session, text))
+        elif op_type == 'interrupt':
+            session.interrupt()
+        else:
+            raise NotImplementedError
+
+    async def _send_session_stacks(self, session, text):
+        try:
+            stacks = await session.inspect_stacks(json.loads(text or '{}'))
+        except Exception:
+            log.exception('unexpected error')
+            stacks = {'threads': []}
+        self.outsock.send_multipart([
+            b'stacks',
+            json.dumps(stacks).encode('utf8'),
+            session.session_id.encode('utf8'),
+        ])
+
+    async def _run_session_tasks(self, session):
+        # Queries of different sessions run concurrently.
+        sid = session.session_id.encode('utf8')
+
+        def send(msg):
+            self.outsock.send_multipart([*msg, sid])
+
+        while True:
+            try:
+                op_type, text = await session.task_queue.get()
+            except asyncio.CancelledError:
+                break
+            ret = 0
+            try:
+                if op_type == 'code':
+                    ret = await session.query(text, send)
+                elif op_type in ('snapshot', 'restore'):
+                    ret = await session.query(f'%{op_type} {text}', send)
+                elif op_type == 'close-session':
+                    del self.sessions[session.session_id]
+                    await session.shutdown()
+            except Exception:
+                log.exception('unexpected error')
+                ret = -1
+            send([b'finished', json.dumps({'exitCode': ret}).encode('utf8')])
+            if op_type == 'close-session':
+                break
 
     async def start_service(self, service_info):
         if service_info['name'] == 'jupyter':
@@ -148,11 +290,8 @@ class Runner(BaseRunner):
                 '-m', 'ipython',
             ], {}
 
-    def ensure_inproc_runner(self):
-        if self.inproc_runner is None:
-            self.inproc_runner = PythonInprocRunner(
-                self.input_queue.sync_q,
-                self.output_queue.sync_q,
-                self._user_input_queue.sync_q,
-                self.sentinel)
-            self.inproc_runner.start()
+    async def shutdown(self):
+        for session in [self.default_session, *self.sessions.values()]:
+            if session is not None:
+                await session.shutdown()
+        await self.stop_zygote()
@@ -0,0 +1,58 @@
+'''
+Top-level await support for query-mode cells.
+
+The cells using top-level await run on a persistent event loop of each
+session, so that the connection pools and other loop-bound resources created
+by the user codes stay alive across cells.
+'''
+
+import ast
+import asyncio
+from inspect import CO_COROUTINE
+
+from .cells import ASYNC_CELL_FUNC, analyze_statements, wrap_async_cell
+
+# available since Python 3.8
+PyCF_ALLOW_TOP_LEVEL_AWAIT = getattr(ast, 'PyCF_ALLOW_TOP_LEVEL_AWAIT', 0)
+
+
+def may_use_await(code_text):
+    return 'await' in code_text or 'async' in code_text
+
+
+def compile_async_cell(code_text, filename='<input>'):
+    '''
+    Compile a cell code using top-level await.
+    The returned code object should be run by :func:`run_async_cell`.
+    '''
+    if PyCF_ALLOW_TOP_LEVEL_AWAIT:
+        return compile(code_text, filename, 'exec',
+                       flags=PyCF_ALLOW_TOP_LEVEL_AWAIT)
+    # Wrap the cell into an async function which declares all names bound
+    # at its top level as globals.
+    tree = wrap_async_cell(code_text, filename)
+    func = tree.body[0]
+    _, writes = analyze_statements(func.body)
+    if writes:
+        func.body.insert(0, ast.copy_location(
+            ast.Global(names=sorted(writes)), func.body[0]))
+    return compile(tree, filename, 'exec')
+
+
+def run_async_cell(code_obj, namespace, loop):
+    if code_obj.co_flags & CO_COROUTINE:
+        coro = eval(code_obj, namespace)
+    else:
+        exec(code_obj, namespace)
+        coro = namespace.pop(ASYNC_CELL_FUNC)()
+    task = loop.create_task(coro)
+    try:
+        return loop.run_until_complete(task)
+    except KeyboardInterrupt:
+        if not task.done():
+            task.cancel()
+            try:
+                loop.run_until_complete(task)
+            except (asyncio.CancelledError, Exception):
+                pass
+        raise
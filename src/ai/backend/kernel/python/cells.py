@@ -0,0 +1,248 @@
+'''
+Dependency tracking of query-mode cells for incremental re-execution.
+
+Each cell is analyzed to find the user namespace names it reads and writes.
+The tracker versions each name by the identity of its value (and by the
+explicit writes of cells for in-place mutations), so that a cell is "stale"
+when any of its inputs has changed since its last execution.
+'''
+
+import ast
+import builtins
+from collections import OrderedDict
+import textwrap
+
+ASYNC_CELL_FUNC = '__bai_async_cell__'
+
+
+class _CellVisitor(ast.NodeVisitor):
+
+    def __init__(self):
+        self.reads = set()
+        self.writes = set()
+        self._depth = 0  # nesting level of function/class scopes
+
+    def _bind(self, name):
+        if self._depth == 0:
+            self.writes.add(name)
+
+    def _base_name(self, node):
+        while isinstance(node, (ast.Attribute, ast.Subscript)):
+            node = node.value
+        return node.id if isinstance(node, ast.Name) else None
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.reads.add(node.id)
+        else:
+            self._bind(node.id)
+
+    def _visit_mutation_target(self, node):
+        # "x.attr = ..." and "x[key] = ..." mutate x in place.
+        if isinstance(node, (ast.Attribute, ast.Subscript)):
+            name = self._base_name(node)
+            if name is not None:
+                self._bind(name)
+        elif isinstance(node, (ast.Tuple, ast.List)):
+            for elt in node.elts:
+                self._visit_mutation_target(elt)
+
+    def visit_Assign(self, node):
+        for target in node.targets:
+            self._visit_mutation_target(target)
+        self.generic_visit(node)
+
+    def visit_AugAssign(self, node):
+        self._visit_mutation_target(node.target)
+        self.generic_visit(node)
+
+    def visit_Delete(self, node):
+        for target in node.targets:
+            self._visit_mutation_target(target)
+        self.generic_visit(node)
+
+    def visit_Expr(self, node):
+        # A top-level method call statement (e.g., "items.append(x)") is
+        # likely to mutate its receiver.
+        value = node.value
+        if isinstance(value, ast.Call) and isinstance(value.func, ast.Attribute):
+            name = self._base_name(value.func.value)
+            if name is not None:
+                self._bind(name)
+        self.generic_visit(node)
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self._bind(alias.asname or alias.name.partition('.')[0])
+
+    def visit_ImportFrom(self, node):
+        for alias in node.names:
+            if alias.name != '*':
+                self._bind(alias.asname or alias.name)
+
+    def _visit_scope(self, node):
+        if not isinstance(node, ast.Lambda):
+            self._bind(node.name)
+        for decorator in getattr(node, 'decorator_list', ()):
+            self.visit(decorator)
+        self._depth += 1
+        for child in ast.iter_child_nodes(node):
+            if child not in getattr(node, 'decorator_list', ()):
+                self.visit(child)
+        self._depth -= 1
+
+    visit_FunctionDef = _visit_scope
+    visit_AsyncFunctionDef = _visit_scope
+    visit_ClassDef = _visit_scope
+    visit_Lambda = _visit_scope
+
+
+def wrap_async_cell(code_text, filename='<input>'):
+    '''
+    Parse the cell code as the body of an async function, to support
+    top-level await on Python versions whose parser rejects it.
+    The line numbers are kept the same as the cell code.
+    (The lines inside multi-line string literals get indented.)
+    '''
+    source = f'async def {ASYNC_CELL_FUNC}():\n' + \
+             textwrap.indent(code_text, '    ') + '\n    pass\n'
+    tree = ast.parse(source, filename)
+    ast.increment_lineno(tree, -1)
+    return tree
+
+
+def parse_cell(code_text):
+    '''
+    Returns the list of top-level statements of the cell code, which may
+    use top-level await.
+    '''
+    try:
+        return ast.parse(code_text).body
+    except SyntaxError:
+        if 'await' not in code_text and 'async' not in code_text:
+            raise
+        return wrap_async_cell(code_text).body[0].body
+
+
+def analyze_statements(statements):
+    '''
+    Returns the sets of the global names read and written by the given
+    top-level statements.
+    Reads are collected conservatively, including those inside functions.
+    '''
+    visitor = _CellVisitor()
+    for stmt in statements:
+        visitor.visit(stmt)
+    return visitor.reads, visitor.writes
+
+
+def analyze_cell(code_text):
+    '''
+    Returns the sets of the global names read and written by the given cell
+    code, or None if it cannot be parsed.
+    '''
+    try:
+        statements = parse_cell(code_text)
+    except (SyntaxError, ValueError):
+        return None
+    return analyze_statements(statements)
+
+
+class CellRecord:
+
+    __slots__ = ('source', 'reads', 'writes', 'read_versions', 'write_versions',
+                 'failed')
+
+    def __init__(self, source, reads, writes):
+        self.source = source
+        self.reads = reads
+        self.writes = writes
+        self.read_versions = {}
+        self.write_versions = {}
+        self.failed = False
+
+    @property
+    def title(self):
+        first_line = self.source.strip().splitlines()[0]
+        return first_line if len(first_line) <= 60 else first_line[:57] + '...'
+
+
+class CellTracker:
+    '''
+    Keeps the latest execution record of each distinct cell source in the
+    order of their first executions.
+    '''
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.cells = OrderedDict()
+        self.versions = {}
+        self._values = {}
+        self._clock = 0
+        self.update_versions(())
+
+    def begin(self, code_text):
+        '''
+        Called before executing a cell.  Returns the record to pass to
+        :meth:`end`, or None if the cell is not tracked.
+        '''
+        result = analyze_cell(code_text)
+        if result is None:
+            return None
+        reads, writes = result
+        reads = {name for name in reads
+                 if name in self.namespace or not hasattr(builtins, name)}
+        record = CellRecord(code_text, reads, writes)
+        record.read_versions = {name: self.versions.get(name) for name in reads}
+        return record
+
+    def end(self, record, failed=False):
+        '''
+        Called after executing a cell.
+        '''
+        if record is None:
+            self.update_versions(())
+            return
+        changed = self.update_versions(record.writes)
+        record.write_versions = {name: self.versions[name] for name in changed
+                                 if name in self.versions}
+        record.failed = failed
+        self.cells[record.source] = record
+
+    def update_versions(self, writes):
+        '''
+        Bump the versions of the names whose values have been replaced or
+        explicitly written.  Returns the set of changed names.
+        '''
+        changed = set()
+        self._clock += 1
+        # (Background jobs may modify the namespace concurrently.)
+        for name, value in list(self.namespace.items()):
+            if name.startswith('__') and name.endswith('__'):
+                continue
+            if name in writes or self._values.get(name, self) is not value:
+                self._values[name] = value
+                self.versions[name] = self._clock
+                changed.add(name)
+        for name in list(self._values):
+            if name not in self.namespace:
+                del self._values[name]
+                del self.versions[name]
+                changed.add(name)
+        return changed
+
+    def is_stale(self, record):
+        if record.failed:
+            return True
+        for name, version in record.read_versions.items():
+            current = self.versions.get(name)
+            if name in record.write_versions and \
+                    current == record.write_versions[name]:
+                # changed only by this cell itself
+                continue
+            if current != version:
+                return True
+        return False
+
+    def stale_cells(self):
+        return [record for record in self.cells.values() if self.is_stale(record)]
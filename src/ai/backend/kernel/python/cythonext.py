@@ -0,0 +1,170 @@
+'''
+Compilation of query-mode cells into extension modules by Cython (the
+``%%cython`` magic).
+
+The compiled modules are cached on disk by the hash of the source, the build
+options, and the interpreter ABI, so re-running an unchanged cell (even in a
+new session) only loads the cached module.  Each build runs in a separate
+process so that the compiler outputs can be reported to the user and the
+distutils machinery does not pollute the user process.
+'''
+
+import hashlib
+import importlib.util
+import json
+import os
+from pathlib import Path
+import re
+import signal
+import subprocess
+import sys
+import sysconfig
+import tempfile
+
+DEFAULT_CACHE_PATH = Path.home() / '.cache' / 'backend.ai' / 'cython'
+MODULE_PREFIX = '_cython_cell_'
+
+_NUMPY_CIMPORT_RE = re.compile(r'^\s*(cimport\s+numpy|from\s+numpy\s+cimport)',
+                               re.M)
+
+_BUILD_SCRIPT = '''
+import json
+import sys
+from distutils.core import Distribution, Extension
+from distutils.command.build_ext import build_ext
+from Cython.Build import cythonize
+
+spec = json.loads(sys.argv[1])
+ext = Extension(spec['name'], [spec['source']],
+                language=spec['language'],
+                include_dirs=spec['include_dirs'],
+                extra_compile_args=spec['compile_args'],
+                libraries=spec['libraries'])
+cmd = build_ext(Distribution())
+cmd.finalize_options()
+cmd.build_temp = cmd.build_lib = spec['build_dir']
+cmd.extensions = cythonize([ext], quiet=True, build_dir=spec['build_dir'],
+                           compiler_directives={'language_level': 3})
+cmd.run()
+'''
+
+
+class CythonBuildError(Exception):
+    '''
+    Raised when Cython or the C compiler fails.  The message contains their
+    outputs.
+    '''
+
+
+def cython_version():
+    '''
+    Returns the version of the installed Cython, or None if not installed.
+    '''
+    try:
+        import Cython
+    except ImportError:
+        return None
+    return Cython.__version__
+
+
+def module_name(source, options, cython_version):
+    '''
+    Returns the name of the extension module built from the source with the
+    given options, which is unique per the interpreter ABI and the Cython
+    version.
+    '''
+    key = json.dumps({
+        'source': source,
+        'options': options,
+        'abi': sysconfig.get_config_var('EXT_SUFFIX'),
+        'python': sys.version,
+        'cython': cython_version,
+    }, sort_keys=True)
+    return MODULE_PREFIX + hashlib.sha256(key.encode('utf8')).hexdigest()[:32]
+
+
+def build_module(source, name, options, cache_path):
+    '''
+    Builds the extension module into the cache directory unless it exists
+    already, and returns the path of the built module.
+    '''
+    cache_path = Path(cache_path)
+    module_path = cache_path / (name + sysconfig.get_config_var('EXT_SUFFIX'))
+    if module_path.exists():
+        return module_path
+    cache_path.mkdir(parents=True, exist_ok=True)
+    include_dirs = []
+    if _NUMPY_CIMPORT_RE.search(source):
+        import numpy
+        include_dirs.append(numpy.get_include())
+    # Build in a temporary directory next to the cache so that concurrent
+    # builds of the same module replace the cached one atomically.
+    with tempfile.TemporaryDirectory(dir=cache_path) as build_dir:
+        pyx_path = Path(build_dir) / (name + '.pyx')
+        pyx_path.write_text(source)
+        spec = {
+            'name': name,
+            'source': str(pyx_path),
+            'language': 'c++' if options.get('cplus') else 'c',
+            'include_dirs': include_dirs,
+            'compile_args': options.get('compile_args', []),
+            'libraries': options.get('libraries', []),
+            'build_dir': build_dir,
+        }
+        # The compiler runs in its own process group to be killed with its
+        # children when the cell is interrupted.
+        with subprocess.Popen(
+                [sys.executable, '-c', _BUILD_SCRIPT, json.dumps(spec)],
+                stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT, cwd=build_dir,
+                start_new_session=True) as proc:
+            try:
+                output = _communicate(proc)
+            except BaseException:
+                # e.g., KeyboardInterrupt
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                raise
+        built_path = Path(build_dir) / module_path.name
+        if proc.returncode != 0 or not built_path.exists():
+            raise CythonBuildError(output.decode('utf8', 'replace'))
+        os.replace(str(built_path), str(module_path))
+    return module_path
+
+
+def _communicate(proc, poll_interval=0.1):
+    # Wait in short intervals as the asynchronous exceptions used to
+    # interrupt the user-code thread are not delivered in blocking calls.
+    while True:
+        try:
+            return proc.communicate(timeout=poll_interval)[0]
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def load_module(name, path):
+    '''
+    Loads the extension module, reusing the one already loaded in this
+    process.  It executes the module-level code of the cell.
+    '''
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.spec_from_file_location(name, str(path))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module
+
+
+def public_names(module):
+    names = getattr(module, '__all__', None)
+    if names is None:
+        names = [name for name in vars(module) if not name.startswith('_')]
+    return {name: getattr(module, name) for name in names}
@@ -2,8 +2,12 @@
 This module is an equivalent of IPython.display module.
 '''
 
-from ai.backend.helpers.display import display
-
 __all__ = (
     'display',
 )
+
+
+def display(obj, **kwargs):
+    # Perform lazy-import for fast initialization.
+    from ai.backend.helpers.display import display as _display
+    return _display(obj, **kwargs)
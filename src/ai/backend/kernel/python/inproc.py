@@ -1,19 +1,28 @@
+import asyncio
 import builtins as builtin_mod
 import code
+from collections import OrderedDict
+from contextlib import ExitStack
 from functools import partial
 from io import IOBase, UnsupportedOperation
 import json
 import logging
+from pathlib import Path
 import sys
+import time
 import traceback
 import threading
 import types
 
-from IPython.core.completer import Completer
-
 import getpass
 
+from ..compactor import OutputCompactor
+from ..resources import cgroup_memory_limit
+from .aio import compile_async_cell, may_use_await, run_async_cell
+from .cells import CellTracker
 from .display import display
+# The modules of the optional features (magics, profilers, the variable
+# inspector, etc.) are imported on their first use for fast startup.
 from .types import (
     ConsoleRecord, MediaRecord, HTMLRecord,
 )
@@ -21,6 +30,122 @@ from .types import (
 
 log = logging.getLogger()
 
+DEFAULT_SNAPSHOT_PATH = Path.home() / '.cache' / 'backend.ai' / 'snapshot'
+MAX_SAMPLING_DURATION = 10.0
+STACK_OPTIONS = ('duration', 'interval')  # of inspect_stacks()
+
+
+# The process-wide hooks for user codes (sys.stdout/stderr, builtins.input,
+# etc.) are routed to the runner of the current thread, so that multiple
+# runners (sessions) can share a process.  Threads not owned by any runner
+# are routed to the runner which has started a cell most recently.
+_local = threading.local()
+_routing_lock = threading.Lock()
+_num_running_cells = 0
+_orig_streams = None
+_last_runner = None
+
+
+def current_runner():
+    return getattr(_local, 'runner', None) or _last_runner
+
+
+class _ConsoleRouter:
+
+    def __init__(self, stream_type, orig_stream):
+        self._stream_type = stream_type
+        self._orig_stream = orig_stream
+
+    def _target(self):
+        runner = current_runner()
+        if runner is None:
+            return self._orig_stream
+        return getattr(runner, self._stream_type)
+
+    def write(self, s):
+        return self._target().write(s)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+
+def _route_emit(record):
+    return current_runner().emit(record)
+
+
+def _route_input(prompt=None, password=False):
+    return current_runner().handle_input(prompt, password=password)
+
+
+def _enter_cell(runner, *, foreground=True):
+    global _num_running_cells, _orig_streams, _last_runner
+    with _routing_lock:
+        if foreground:
+            _last_runner = runner
+        if _num_running_cells == 0:
+            _orig_streams = sys.stdout, sys.stderr
+            sys.stdout = _ConsoleRouter('stdout', _orig_streams[0])
+            sys.stderr = _ConsoleRouter('stderr', _orig_streams[1])
+        _num_running_cells += 1
+
+
+def _exit_cell():
+    global _num_running_cells
+    with _routing_lock:
+        _num_running_cells -= 1
+        if _num_running_cells == 0:
+            sys.stdout, sys.stderr = _orig_streams
+
+
+def compile_cell(code_text):
+    '''
+    Returns the code object of the cell code and whether it uses top-level
+    await (see :func:`.aio.run_async_cell`).
+    '''
+    try:
+        return code.compile_command(code_text, symbol='exec'), False
+    except SyntaxError:
+        if not may_use_await(code_text):
+            raise
+        return compile_async_cell(code_text), True
+
+
+class UsageError(Exception):
+    '''
+    Raised by the magic functions on invalid arguments.
+    '''
+
+
+def split_magic_options(args, *, flags=(), options=()):
+    '''
+    Splits the leading options of the magic arguments from the rest (e.g.,
+    the statement of a line magic).  Returns a dict of the options, with
+    True as the values of ``flags``, and the rest.
+    '''
+    parsed = {}
+    rest = args.strip()
+    while rest.startswith('-'):
+        token, _, rest = rest.partition(' ')
+        rest = rest.lstrip()
+        if token in flags:
+            parsed[token] = True
+        elif token in options:
+            value, _, rest = rest.partition(' ')
+            if not value:
+                raise UsageError(f'Option {token} requires a value.')
+            parsed[token] = value
+            rest = rest.lstrip()
+        else:
+            raise UsageError(f'Unknown option: {token}')
+    return parsed, rest
+
+
+COMPILE_ERRORS = (OverflowError, IndentationError, SyntaxError,
+                  ValueError, TypeError, MemoryError)
+
 
 class ConsoleOutput(IOBase):
 
@@ -58,15 +183,151 @@ class ConsoleOutput(IOBase):
         return True
 
 
+class BufferedConsoleOutput(ConsoleOutput):
+    '''
+    A console that batches writes into a pre-allocated buffer and emits them
+    as a single record when the buffer fills up, when the oldest buffered
+    byte gets older than ``flush_interval`` seconds, or upon explicit
+    ``flush()`` calls.
+
+    If ``line_buffering`` is set, any write containing a newline flushes the
+    buffer like a line-buffered TTY.
+
+    If ``compact`` is set, the outputs pass through an
+    :class:`~ai.backend.kernel.compactor.OutputCompactor` so that progress
+    bars redrawn by carriage returns are sent at most once per
+    ``refresh_interval`` seconds.  ``flush()`` keeps the refresh rate (as
+    progress bars flush after every update) while :meth:`drain` sends the
+    latest state immediately.
+    '''
+
+    def __init__(self, emit, stream_type, *,
+                 buffer_size=65536, flush_interval=0.05,
+                 line_buffering=False, compact=True, refresh_interval=0.1):
+        super().__init__(emit, stream_type)
+        self._buffer = bytearray(buffer_size)
+        self._buffer_size = buffer_size
+        self._length = 0
+        self._first_write_at = 0.0
+        self._lock = threading.Lock()
+        self.flush_interval = flush_interval
+        self.line_buffering = line_buffering
+        self._compactor = OutputCompactor(refresh_interval=refresh_interval) \
+                          if compact else None
+        # The other console of the same session, flushed before writing into
+        # this one to keep the relative ordering of stdout and stderr.
+        self.sibling = None
+
+    def write(self, s):
+        if self.closed:
+            raise ValueError('Cannot write to the closed console.')
+        if isinstance(s, str):
+            s = s.encode('utf8')
+        size = len(s)
+        if size == 0:
+            return 0
+        sibling = self.sibling
+        if sibling is not None and sibling._length > 0:
+            sibling.flush()
+        with self._lock:
+            now = time.monotonic()
+            if self._length + size > self._buffer_size:
+                self._flush_locked()
+            if size >= self._buffer_size:
+                self._emit_locked(bytes(s))
+                return size
+            if self._length == 0:
+                self._first_write_at = now
+            self._buffer[self._length:self._length + size] = s
+            self._length += size
+            if ((self.line_buffering and b'\n' in s) or
+                    now - self._first_write_at >= self.flush_interval):
+                self._flush_locked()
+        return size
+
+    def _has_pending(self):
+        return self._length > 0 or \
+               (self._compactor is not None and self._compactor.dirty)
+
+    def flush(self):
+        if not self._has_pending():
+            return
+        with self._lock:
+            self._flush_locked()
+            self._refresh_locked()
+
+    def flush_if_expired(self):
+        '''
+        Flush the buffer only when the oldest buffered byte has waited
+        longer than the flush interval.
+        It is called periodically by the consumer side so that the output
+        of a writer which has gone quiet does not get stuck in the buffer.
+        '''
+        if not self._has_pending():
+            return
+        with self._lock:
+            if (self._length > 0 and
+                    time.monotonic() - self._first_write_at >= self.flush_interval):
+                self._flush_locked()
+            self._refresh_locked()
+
+    def drain(self):
+        '''
+        Flush the buffer and the compacted outputs regardless of the
+        intervals, e.g., at the end of a cell.
+        '''
+        if not self._has_pending():
+            return
+        with self._lock:
+            self._flush_locked()
+            if self._compactor is not None:
+                data = self._compactor.flush()
+                if data:
+                    self._emit(ConsoleRecord(self._stream_type, data))
+
+    def _emit_locked(self, data):
+        if self._compactor is not None:
+            data = self._compactor.feed(data)
+            if not data:
+                return
+        self._emit(ConsoleRecord(self._stream_type, data))
+
+    def _refresh_locked(self):
+        if self._compactor is not None and self._compactor.dirty:
+            data = self._compactor.refresh()
+            if data:
+                self._emit(ConsoleRecord(self._stream_type, data))
+
+    def _flush_locked(self):
+        if self._length == 0:
+            return
+        data = bytes(self._buffer[:self._length])
+        self._length = 0
+        self._emit_locked(data)
+
+
 class PythonInprocRunner(threading.Thread):
     '''
     A thin wrapper for REPL.
 
     It creates a dummy module that user codes run and keeps the references to
     user-created objects (e.g., variables and functions).
+
+    The code completer (IPython) is imported in the background while the
+    session is idle.  If ``prewarm`` is set, it also records the heavy modules
+    imported by user codes and imports the most frequently used ones (up to
+    ``prewarm_count``) in the same way.
+
+    It tracks the names read and written by each cell and supports magic
+    commands such as ``%rerun-stale`` (see :attr:`magics`).
+    The cells using top-level await run on a persistent event loop of the
+    session.
     '''
 
-    def __init__(self, input_queue, output_queue, user_input_queue, sentinel):
+    def __init__(self, input_queue, output_queue, user_input_queue, sentinel, *,
+                 flush_interval=0.05, prewarm=False, prewarm_count=3,
+                 snapshot_path=DEFAULT_SNAPSHOT_PATH, memory_profile=None,
+                 memory_warn_ratio=0.8):
         super().__init__(name='InprocRunner', daemon=True)
 
         # for interoperability with the main asyncio loop
@@ -75,8 +336,14 @@ class PythonInprocRunner(threading.Thread):
         self.user_input_queue = user_input_queue
         self.sentinel = sentinel
 
-        self.stdout = ConsoleOutput(self.emit, 'stdout')
-        self.stderr = ConsoleOutput(self.emit, 'stderr')
+        self.flush_interval = flush_interval
+        self.stdout = BufferedConsoleOutput(self.emit_console, 'stdout',
+                                            flush_interval=flush_interval)
+        self.stderr = BufferedConsoleOutput(self.emit_console, 'stderr',
+                                            flush_interval=flush_interval,
+                                            line_buffering=True)
+        self.stdout.sibling = self.stderr
+        self.stderr.sibling = self.stdout
 
         # Initialize user module and namespaces.
         user_module = types.ModuleType(
@@ -87,56 +354,495 @@ class PythonInprocRunner(threading.Thread):
         self.user_module = user_module
         self.user_ns = user_module.__dict__
 
-        self.completer = Completer(namespace=self.user_ns, global_namespace={})
-        self.completer.limit_to__all__ = True
+        self._completer = None
+        self.event_loop = None
+
+        self.cells = CellTracker(self.user_ns)
+        self._variable_inspector = None
+        self.magics = {
+            '%rerun-stale': self.magic_rerun_stale,
+            '%snapshot': self.magic_snapshot,
+            '%restore': self.magic_restore,
+            '%%background': self.magic_background,
+            '%jobs': self.magic_jobs,
+            '%join': self.magic_join,
+            '%interrupt': self.magic_interrupt,
+            '%prun': self.magic_prun,
+            '%%prun': self.magic_prun,
+            '%memprof': self.magic_memprof,
+            '%timeit': self.magic_timeit,
+            '%%timeit': self.magic_timeit,
+            '%%cython': self.magic_cython,
+        }
+        self.jobs = OrderedDict()
+        self._last_job_id = 0
+        self.snapshots = {}
+        self.snapshot_path = Path(snapshot_path)
+        self.memory_profile = memory_profile
+        self.memory_warn_ratio = memory_warn_ratio
+        self.memory_top = 5
+        self.memory_limit = cgroup_memory_limit()
+        self.cython_cache_path = None  # the default of cythonext
+
+        self.idle = threading.Event()
+        # the thread running user codes (the main thread of isolated sessions)
+        self.worker_ident = None
+        if prewarm:
+            from .prewarm import ImportStats
+            self.import_stats = ImportStats()
+        else:
+            self.import_stats = None
+        self.prewarm_count = prewarm_count
+        self.prewarmer = None
 
     def run(self):
+        if self.prewarmer is None:
+            from .prewarm import ModulePrewarmer
+            modules = ['IPython.core.completer']
+            if self.import_stats is not None:
+                modules.extend(self.import_stats.top(self.prewarm_count))
+            self.prewarmer = ModulePrewarmer(modules, self.idle)
+            self.prewarmer.start()
         # User code is executed in a separate thread.
+        _local.runner = self
+        self.worker_ident = threading.get_ident()
         while True:
+            self.idle.set()
             code_text = self.input_queue.get()
-            self.input_queue.task_done()
+            self.idle.clear()
+            if code_text is None:
+                # The session is closed.
+                if self.event_loop is not None:
+                    self.event_loop.close()
+                break
 
             # Set Backend.AI Media handler
-            self.user_module.__builtins__._sorna_emit = self.emit
+            self.user_module.__builtins__._sorna_emit = _route_emit
             self.user_module.__builtins__.display = display
 
             # Override interactive input functions
-            self.user_module.__builtins__.input = self.handle_input
-            getpass.getpass = partial(self.handle_input, password=True)
+            self.user_module.__builtins__.input = _route_input
+            getpass.getpass = partial(_route_input, password=True)
+
+            # Deliver the outputs of background jobs made while idle.
+            for job in self.jobs.values():
+                job.flush_pending()
 
             try:
-                code_obj = code.compile_command(code_text, symbol='exec')
-            except (OverflowError, IndentationError, SyntaxError,
-                    ValueError, TypeError, MemoryError):
-                exc_type, exc_val, tb = sys.exc_info()
-                user_tb = type(self).strip_traceback(tb)
-                err_str = ''.join(traceback.format_exception(exc_type, exc_val,
-                                                             user_tb))
-                hdr_str = 'Traceback (most recent call last):\n' \
-                        if not err_str.startswith('Traceback ') else ''
-                self.stderr.write(hdr_str + err_str)
+                if code_text.lstrip().startswith('%'):
+                    self.run_magic(code_text)
+                elif self.memory_profile is not None:
+                    self.execute_with_memory_profile(code_text)
+                else:
+                    self.execute(code_text)
+            finally:
+                self.flush_console()
                 self.output_queue.put(self.sentinel)
-            else:
-                sys.stdout, orig_stdout = self.stdout, sys.stdout
-                sys.stderr, orig_stderr = self.stderr, sys.stderr
+            if self.import_stats is not None:
                 try:
-                    exec(code_obj, self.user_ns)
-                except KeyboardInterrupt:
-                    print('Interrupted!', file=self.stderr)
+                    self.import_stats.record(code_text)
                 except Exception:
-                    # strip the first frame
-                    exc_type, exc_val, tb = sys.exc_info()
-                    user_tb = type(self).strip_traceback(tb)
-                    traceback.print_exception(exc_type, exc_val, user_tb,
-                                              file=sys.stderr)
-                finally:
-                    sys.stdout = orig_stdout
-                    sys.stderr = orig_stderr
-                    self.output_queue.put(self.sentinel)
+                    # e.g., RecursionError from too deeply nested codes
+                    log.exception('failed to record the imported modules')
+
+    def execute(self, code_text, *, instrument=None):
+        '''
+        Execute the code in the user namespace, tracking its dependencies.
+        Returns whether it has finished without errors.
+        ``instrument`` is a context manager (e.g., a profiler) wrapping only
+        the execution of the compiled code.
+        '''
+        try:
+            code_obj, is_async = compile_cell(code_text)
+        except COMPILE_ERRORS:
+            self.write_compile_error(self.stderr)
+            return False
+        record = self.cells.begin(code_text)
+        failed = True
+        _enter_cell(self)
+        try:
+            with instrument if instrument is not None else ExitStack():
+                if is_async:
+                    run_async_cell(code_obj, self.user_ns, self.get_event_loop())
+                else:
+                    exec(code_obj, self.user_ns)
+            failed = False
+        except KeyboardInterrupt:
+            print('Interrupted!', file=self.stderr)
+        except Exception:
+            # strip the first frame
+            exc_type, exc_val, tb = sys.exc_info()
+            user_tb = type(self).strip_traceback(tb)
+            traceback.print_exception(exc_type, exc_val, user_tb,
+                                      file=sys.stderr)
+        finally:
+            _exit_cell()
+            self.cells.end(record, failed=failed)
+        return not failed
+
+    def execute_with_memory_profile(self, code_text):
+        from .memprof import CellMemoryMonitor
+        monitor = CellMemoryMonitor(self.memory_profile, code_text=code_text,
+                                    top=self.memory_top,
+                                    warn_ratio=self.memory_warn_ratio,
+                                    limit=self.memory_limit)
+        self.execute(code_text, instrument=monitor)
+        self.stdout.write(monitor.format_report())
+        warning = monitor.format_warning()
+        if warning is not None:
+            self.stderr.write(warning)
+
+    @classmethod
+    def write_compile_error(cls, stream):
+        exc_type, exc_val, tb = sys.exc_info()
+        user_tb = cls.strip_traceback(tb)
+        err_str = ''.join(traceback.format_exception(exc_type, exc_val,
+                                                     user_tb))
+        hdr_str = 'Traceback (most recent call last):\n' \
+                if not err_str.startswith('Traceback ') else ''
+        stream.write(hdr_str + err_str)
+
+    def get_event_loop(self):
+        '''
+        Returns the persistent event loop of this session for the cells using
+        top-level await.  It must be called in the user-code thread.
+        '''
+        if self.event_loop is None:
+            self.event_loop = asyncio.new_event_loop()
+            # Let user codes get the same loop via asyncio.get_event_loop().
+            asyncio.set_event_loop(self.event_loop)
+        return self.event_loop
+
+    def run_magic(self, code_text):
+        line, _, body = code_text.lstrip().partition('\n')
+        name, _, args = line.partition(' ')
+        handler = self.magics.get(name)
+        if handler is None:
+            self.stderr.write(f'UsageError: magic function `{name}` not found.\n')
+            return
+        try:
+            handler(args.strip(), body)
+        except UsageError as e:
+            self.stderr.write(f'UsageError: {e}\n')
+        except KeyboardInterrupt:
+            print('Interrupted!', file=self.stderr)
+        except Exception:
+            exc_type, exc_val, tb = sys.exc_info()
+            traceback.print_exception(exc_type, exc_val, tb, file=self.stderr)
+
+    def magic_background(self, args, body):
+        '''
+        %%background: run the cell in a background job on a separate thread
+        sharing the user namespace.  Its outputs are tagged with the job ID.
+        '''
+        try:
+            code_obj, is_async = compile_cell(body)
+        except COMPILE_ERRORS:
+            self.write_compile_error(self.stderr)
+            return
+        from .jobs import BackgroundJob
+        self._last_job_id += 1
+        job = BackgroundJob(self._last_job_id, body, self)
+        job.thread = threading.Thread(
+            target=self._run_job, args=(job, code_obj, is_async),
+            name=f'BackgroundJob-{job.id}', daemon=True)
+        self.jobs[job.id] = job
+        self.stdout.write(f'[job {job.id}] started\n')
+        self.flush_console()
+        job.thread.start()
+
+    def _run_job(self, job, code_obj, is_async):
+        _local.runner = job
+        _enter_cell(job, foreground=False)
+        try:
+            if is_async:
+                job.event_loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(job.event_loop)
+                run_async_cell(code_obj, self.user_ns, job.event_loop)
+            else:
+                exec(code_obj, self.user_ns)
+            job.status = 'done'
+        except KeyboardInterrupt:
+            job.status = 'interrupted'
+        except Exception:
+            job.status = 'failed'
+            exc_type, exc_val, tb = sys.exc_info()
+            user_tb = type(self).strip_traceback(tb)
+            traceback.print_exception(exc_type, exc_val, user_tb,
+                                      file=job.stderr)
+        finally:
+            _exit_cell()
+            if job.event_loop is not None:
+                job.event_loop.close()
+            job.finished_at = time.monotonic()
+            job.stdout.write(f'{job.status} ({job.elapsed:.1f} sec)\n')
+
+    def _get_job(self, args):
+        try:
+            return self.jobs[int(args.lstrip('#'))]
+        except (ValueError, KeyError):
+            raise UsageError(f'No such job: {args!r}') from None
+
+    def magic_jobs(self, args, body):
+        '''
+        %jobs: list the background jobs.
+        '''
+        if not self.jobs:
+            self.stdout.write('No background jobs.\n')
+        for job in self.jobs.values():
+            self.stdout.write(f'[job {job.id}] {job.status:<11s} '
+                              f'{job.elapsed:8.1f} sec  {job.title}\n')
+
+    def magic_join(self, args, body):
+        '''
+        %join <job-id>: wait until the job finishes, streaming its outputs.
+        Interrupting it stops only the waiting.
+        '''
+        job = self._get_job(args)
+        job.flush_pending()
+        while job.thread.is_alive():
+            job.thread.join(0.1)
+        job.flush_pending()
+
+    def magic_interrupt(self, args, body):
+        '''
+        %interrupt <job-id>: interrupt the background job.
+        '''
+        job = self._get_job(args)
+        if not job.interrupt():
+            self.stdout.write(f'[job {job.id}] is not running.\n')
+
+    def magic_prun(self, args, body):
+        '''
+        %prun [options] statement, %%prun [options]: profile the statement
+        or the cell, showing the hotspot table and a flame graph.
+
+        Options:
+          -s <key>       the sort key of the table (default: tottime)
+          -l <limit>     the number of rows of the table (default: 20)
+          -i <ms>        the sampling interval (default: 5)
+          --sampling     use only the sampling profiler (low overhead)
+        '''
+        opts, statement = split_magic_options(
+            args, flags=('--sampling',), options=('-s', '-l', '-i'))
+        code_text = body if body.strip() else statement
+        if not code_text.strip():
+            raise UsageError('Nothing to profile.')
+        try:
+            limit = int(opts.get('-l', 20))
+            interval = float(opts.get('-i', 5)) / 1000
+        except ValueError:
+            raise UsageError('Invalid -l or -i option.') from None
+        import pstats
+        from .profiling import CellProfiler, SPEEDSCOPE_MIME
+        sort_key = opts.get('-s', 'tottime')
+        if sort_key not in pstats.Stats.sort_arg_dict_default:
+            raise UsageError(f'Invalid sort key: {sort_key}')
+        profiler = CellProfiler(deterministic='--sampling' not in opts,
+                                interval=interval)
+        self.execute(code_text, instrument=profiler)
+        self.stdout.write(profiler.format_hotspots(sort_key, limit))
+        self.emit(MediaRecord(SPEEDSCOPE_MIME,
+                              json.dumps(profiler.flame_graph())))
+
+    def magic_timeit(self, args, body):
+        '''
+        %timeit [options] statement, %%timeit [options] [setup]: measure the
+        execution time of the statement or the cell, calibrating the number
+        of loops per run automatically.  For %%timeit, the rest of the first
+        line is the setup code run before each run.
+
+        Options:
+          -n <loops>     the number of loops per run
+          -r <runs>      the number of runs (default: 7)
+          --no-gc        disable the garbage collector during the runs
+                         (not affecting the memory usage of each run)
+        '''
+        opts, rest = split_magic_options(
+            args, flags=('--no-gc',), options=('-n', '-r'))
+        if body.strip():
+            stmt, setup = body, rest or 'pass'
+        else:
+            stmt, setup = rest, 'pass'
+        if not stmt.strip():
+            raise UsageError('Nothing to measure.')
+        try:
+            loops = int(opts['-n']) if '-n' in opts else None
+            repeat = int(opts.get('-r', 7))
+        except ValueError:
+            raise UsageError('Invalid -n or -r option.') from None
+        if (loops is not None and loops < 1) or repeat < 1:
+            raise UsageError('The -n and -r options must be positive.')
+        from .timing import StatementTimer, TIMEIT_MIME
+        try:
+            timer = StatementTimer(stmt, setup, self.user_ns,
+                                   gc_enabled='--no-gc' not in opts)
+        except COMPILE_ERRORS:
+            self.write_compile_error(self.stderr)
+            return
+        _enter_cell(self)
+        try:
+            result = timer.measure(loops, repeat)
+        except Exception:
+            exc_type, exc_val, tb = sys.exc_info()
+            user_tb = type(self).strip_traceback(tb, '<timeit-src>')
+            traceback.print_exception(exc_type, exc_val, user_tb,
+                                      file=self.stderr)
+            return
+        finally:
+            _exit_cell()
+        self.stdout.write(result.format())
+        self.emit(MediaRecord(TIMEIT_MIME, result.to_dict()))
+
+    def magic_cython(self, args, body):
+        '''
+        %%cython [options]: compile the cell into an extension module by
+        Cython and import its public names into the user namespace.  The
+        compiled modules are cached by the source and the options, so
+        re-running an unchanged cell reuses the compiled module.
+
+        Options:
+          --cplus        compile as C++
+          -c <args>      extra compiler arguments (comma-separated)
+          -l <libs>      libraries to link (comma-separated)
+          -f, --force    rebuild the module even if it is cached
+        '''
+        opts, rest = split_magic_options(
+            args, flags=('--cplus', '-f', '--force'), options=('-c', '-l'))
+        if rest:
+            raise UsageError(f'Unexpected arguments: {rest}')
+        if not body.strip():
+            raise UsageError('Nothing to compile.')
+        from .cythonext import (
+            CythonBuildError, DEFAULT_CACHE_PATH, build_module, cython_version,
+            load_module, module_name, public_names,
+        )
+        version = cython_version()
+        if version is None:
+            raise UsageError('%%cython requires Cython (pip install cython).')
+        options = {
+            'cplus': '--cplus' in opts,
+            'compile_args': [a for a in opts.get('-c', '').split(',') if a],
+            'libraries': [a for a in opts.get('-l', '').split(',') if a],
+        }
+        name = module_name(body, options, version)
+        if '-f' in opts or '--force' in opts:
+            # The loaded extension modules cannot be replaced in-place.
+            name += f'_{int(time.time() * 1e6)}'
+        try:
+            path = build_module(body, name, options,
+                                self.cython_cache_path or DEFAULT_CACHE_PATH)
+        except CythonBuildError as e:
+            self.stderr.write(str(e))
+            self.stderr.write('[cython] compilation failed\n')
+            return
+        _enter_cell(self)
+        try:
+            module = load_module(name, path)
+        finally:
+            _exit_cell()
+        names = public_names(module)
+        self.user_ns.update(names)
+        self.cells.update_versions(set(names))
+
+    def magic_memprof(self, args, body):
+        '''
+        %memprof [rss|tracemalloc|off] [options]: set the memory profiling
+        mode of the subsequent cells, or show the current mode.  In the
+        "tracemalloc" mode, the top allocation sites are also reported.
+
+        Options:
+          -n <count>     the number of the allocation sites (default: 5)
+          --warn <ratio> warn when a cell grows the process past this share
+                         of the memory limit (default: 0.8)
+        '''
+        from .memprof import MODES as MEMPROF_MODES, format_size
+        mode, _, options = args.partition(' ')
+        if mode.startswith('-'):
+            mode, options = '', args
+        opts, rest = split_magic_options(options, options=('-n', '--warn'))
+        if rest:
+            raise UsageError(f'Unexpected arguments: {rest}')
+        try:
+            if '-n' in opts:
+                self.memory_top = int(opts['-n'])
+            if '--warn' in opts:
+                self.memory_warn_ratio = float(opts['--warn'])
+        except ValueError:
+            raise UsageError('Invalid -n or --warn option.') from None
+        if mode == 'off':
+            self.memory_profile = None
+        elif mode in MEMPROF_MODES:
+            self.memory_profile = mode
+        elif mode:
+            raise UsageError(f'Invalid mode: {mode}')
+        limit = format_size(self.memory_limit) if self.memory_limit else 'none'
+        self.stdout.write(f'[memprof] mode: {self.memory_profile or "off"}, '
+                          f'memory limit: {limit}, '
+                          f'warning at {self.memory_warn_ratio:.0%}\n')
+
+    def magic_rerun_stale(self, args, body):
+        '''
+        %rerun-stale: re-execute, in order, only the cells whose inputs have
+        changed since their last executions (including those changed by the
+        re-executed cells).  Up-to-date cells keep their results.
+        '''
+        num_rerun = num_uptodate = 0
+        for record in list(self.cells.cells.values()):
+            if not self.cells.is_stale(record):
+                num_uptodate += 1
+                continue
+            self.stdout.write(f'[rerun-stale] {record.title}\n')
+            num_rerun += 1
+            if not self.execute(record.source):
+                self.stdout.write('[rerun-stale] stopped due to an error.\n')
+                return
+        self.stdout.write(f'[rerun-stale] {num_rerun} cell(s) re-executed, '
+                          f'{num_uptodate} cell(s) up to date.\n')
+
+    def get_snapshot(self, path):
+        path = Path(path).expanduser() if path else self.snapshot_path
+        snapshot = self.snapshots.get(path)
+        if snapshot is None:
+            from .snapshot import NamespaceSnapshot
+            snapshot = self.snapshots[path] = NamespaceSnapshot(path)
+        return snapshot
+
+    def magic_snapshot(self, args, body):
+        '''
+        %snapshot [path]: save the picklable objects in the user namespace,
+        rewriting only those changed since the last snapshot/restore.
+        '''
+        snapshot = self.get_snapshot(args)
+        summary = snapshot.save(self.user_ns, self.cells.versions, self.user_module)
+        self.stdout.write(f'[snapshot] {len(summary["written"])} object(s) written, '
+                          f'{len(summary["unchanged"])} unchanged '
+                          f'to {snapshot.path}\n')
+        if summary['skipped']:
+            self.stdout.write('[snapshot] skipped (functions, classes, or '
+                              'unpicklable): ' +
+                              ', '.join(sorted(summary['skipped'])) + '\n')
+
+    def magic_restore(self, args, body):
+        '''
+        %restore [path]: load the objects saved by %snapshot.
+        Large arrays are memory-mapped and loaded on first access.
+        '''
+        snapshot = self.get_snapshot(args)
+        summary = snapshot.restore(self.user_ns, self.user_module)
+        self.cells.update_versions(summary['restored'])
+        snapshot.saved_versions = {name: self.cells.versions.get(name)
+                                   for name in summary['restored']}
+        self.stdout.write(f'[restore] {len(summary["restored"])} object(s) '
+                          f'restored from {snapshot.path}\n')
+        if summary['failed']:
+            self.stderr.write('[restore] failed: ' +
+                              ', '.join(sorted(summary['failed'])) + '\n')
 
     def handle_input(self, prompt=None, password=False):
         if prompt is None:
             prompt = 'Password: ' if password else ''
+        self.flush_console()
         # Use synchronous version of ZeroMQ sockets
         if prompt:
             self.output_queue.put([
@@ -150,6 +856,16 @@ class PythonInprocRunner(threading.Thread):
         data = self.user_input_queue.get()
         return data
 
+    @property
+    def completer(self):
+        if self._completer is None:
+            # Perform lazy-import for fast initialization.
+            from IPython.core.completer import Completer
+            completer = Completer(namespace=self.user_ns, global_namespace={})
+            completer.limit_to__all__ = True
+            self._completer = completer
+        return self._completer
+
     def complete(self, data):
         # This method is executed in the main thread.
         state = 0
@@ -162,7 +878,61 @@ class PythonInprocRunner(threading.Thread):
             state += 1
         return matches
 
+    @property
+    def variable_inspector(self):
+        if self._variable_inspector is None:
+            from .variables import VariableInspector
+            self._variable_inspector = VariableInspector()
+        return self._variable_inspector
+
+    def inspect_variables(self):
+        # This method is executed in the main thread.
+        return self.variable_inspector.inspect(self.user_ns,
+                                               dict(self.cells.versions))
+
+    def inspect_stacks(self, duration=0, interval=0.01):
+        '''
+        Returns the current stacks of the user-code threads (this runner and
+        its running background jobs).  If ``duration`` is given, it also
+        samples the stack of this runner for the duration (blocking the
+        caller) and returns the hottest functions.
+        This method is executed outside the user-code thread.
+        '''
+        from .profiling import StackSampler, capture_stacks, hot_frames
+        threads = [(self.name, self.worker_ident)]
+        threads.extend((f'job {job.id}', job.thread.ident)
+                       for job in list(self.jobs.values())
+                       if job.thread.is_alive())
+        result = {'threads': capture_stacks(threads)}
+        duration = min(float(duration), MAX_SAMPLING_DURATION)
+        if duration > 0:
+            sampler = StackSampler(self.worker_ident, max(float(interval), 0.001))
+            sampler.start()
+            time.sleep(duration)
+            sampler.stop()
+            result['num_samples'] = sampler.num_samples
+            result['hot_frames'] = hot_frames(sampler)
+        return result
+
+    def flush_console(self):
+        self.stdout.drain()
+        self.stderr.drain()
+
+    def flush_console_if_expired(self):
+        # This method is executed in the main thread.
+        self.stdout.flush_if_expired()
+        self.stderr.flush_if_expired()
+
+    def emit_console(self, record):
+        self.output_queue.put([
+            b'stdout' if record.target == 'stdout' else b'stderr',
+            record.data,
+        ])
+
     def emit(self, record):
+        if not isinstance(record, ConsoleRecord):
+            # Keep the ordering of buffered console outputs and media outputs.
+            self.flush_console()
         if isinstance(record, ConsoleRecord):
             assert record.target in ('stdout', 'stderr')
             self.output_queue.put([
@@ -190,10 +960,10 @@ class PythonInprocRunner(threading.Thread):
             raise TypeError('Unsupported record type.')
 
     @staticmethod
-    def strip_traceback(tb):
+    def strip_traceback(tb, filename='<input>'):
         while tb is not None:
             frame_summary = traceback.extract_tb(tb, limit=1)[0]
-            if frame_summary[0] == '<input>':
+            if frame_summary[0] == filename:
                 break
             tb = tb.tb_next
         return tb
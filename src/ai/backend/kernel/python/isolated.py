@@ -0,0 +1,607 @@
+'''
+An optional query-mode backend which runs PythonInprocRunner inside a child
+process instead of a thread of the kernel runner.
+
+Since user codes run in the main thread of a separate process, interrupts are
+delivered as real SIGINT signals, the memory usage is accounted per session
+process, and a crashed or stuck session can be replaced by a pre-spawned warm
+spare process within a few milliseconds.
+
+The session processes are fresh interpreters rather than forks of the kernel
+runner, as forking a process with running threads (ZeroMQ I/O, executors, and
+logging) and an event loop may copy their locks in the locked state.
+
+The child process sends its outputs through a shared-memory ring buffer and
+wakes up the kernel runner's event loop via a pipe only when the ring buffer
+transitions from empty to non-empty.
+'''
+
+import asyncio
+from collections import deque
+import json
+import logging
+import mmap
+import os
+from pathlib import Path
+import queue
+import select
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import msgpack
+
+from .inproc import DEFAULT_SNAPSHOT_PATH, STACK_OPTIONS, PythonInprocRunner
+
+log = logging.getLogger()
+
+_HEAD_OFFSET = 0
+_TAIL_OFFSET = 64   # keep head and tail on separate cache lines
+_DATA_OFFSET = 128
+_COUNTER = struct.Struct('Q')
+_FRAME_HDR = struct.Struct('I')
+_FRAME_MORE = 0x80000000
+REQUEST_TIMEOUT = 10.0  # for the requests answered by the session process
+
+# The search path to import this package in the session processes
+_PACKAGE_ROOT = str(Path(__file__).resolve().parents[4])
+_CHILD_BOOTSTRAP = (
+    'import sys; sys.path.append(sys.argv.pop(1)); '
+    'from ai.backend.kernel.python.isolated import _child_main; '
+    '_child_main(sys.argv[1:])'
+)
+
+
+class SharedRingBuffer:
+    '''
+    A single-producer single-consumer byte ring on a shared mmap of an
+    unlinked temporary file (in /dev/shm if available).  The creator passes
+    :attr:`fd` to the other process, which attaches to the same ring by
+    giving the file descriptor instead of the size.
+
+    Frames are length-prefixed.  A frame larger than the currently available
+    space is split into multiple chunks, which the reader reassembles.
+    '''
+
+    def __init__(self, size=4 * 1024 * 1024, *, fd=None):
+        if fd is None:
+            try:
+                self._file = tempfile.TemporaryFile(dir='/dev/shm')
+            except OSError:
+                self._file = tempfile.TemporaryFile()
+            fd = self._file.fileno()
+            os.ftruncate(fd, _DATA_OFFSET + size)
+        else:
+            self._file = open(fd, 'rb', buffering=0)
+            size = os.fstat(fd).st_size - _DATA_OFFSET
+        self.fd = fd
+        self.capacity = size
+        self._mem = mmap.mmap(fd, _DATA_OFFSET + size)
+        self._partial = bytearray()
+
+    def close(self):
+        self._mem.close()
+        self._file.close()
+
+    def _load(self, offset):
+        return _COUNTER.unpack_from(self._mem, offset)[0]
+
+    def _store(self, offset, value):
+        _COUNTER.pack_into(self._mem, offset, value)
+
+    def _copy_in(self, pos, data):
+        offset = pos % self.capacity
+        first = min(len(data), self.capacity - offset)
+        start = _DATA_OFFSET + offset
+        self._mem[start:start + first] = data[:first]
+        if first < len(data):
+            rest = len(data) - first
+            self._mem[_DATA_OFFSET:_DATA_OFFSET + rest] = data[first:]
+
+    def _copy_out(self, pos, size):
+        offset = pos % self.capacity
+        first = min(size, self.capacity - offset)
+        start = _DATA_OFFSET + offset
+        data = self._mem[start:start + first]
+        if first < size:
+            data += self._mem[_DATA_OFFSET:_DATA_OFFSET + size - first]
+        return data
+
+    def write_chunk(self, data):
+        '''
+        Write as much of the given data as possible as a single chunk.
+        (Producer side)
+
+        Returns a pair of the number of written bytes and whether the ring
+        buffer was empty before writing.
+        '''
+        head = self._load(_HEAD_OFFSET)
+        tail = self._load(_TAIL_OFFSET)
+        free = self.capacity - (head - tail) - _FRAME_HDR.size
+        if free <= 0:
+            return 0, head == tail
+        size = min(len(data), free)
+        hdr = size | (_FRAME_MORE if size < len(data) else 0)
+        self._copy_in(head, _FRAME_HDR.pack(hdr))
+        self._copy_in(head + _FRAME_HDR.size, data[:size])
+        # Publish the chunk after its content is written.
+        self._store(_HEAD_OFFSET, head + _FRAME_HDR.size + size)
+        return size, head == tail
+
+    def read_frames(self):
+        '''
+        Read all complete frames available.  (Consumer side)
+        '''
+        frames = []
+        head = self._load(_HEAD_OFFSET)
+        tail = self._load(_TAIL_OFFSET)
+        while tail < head:
+            hdr = _FRAME_HDR.unpack(self._copy_out(tail, _FRAME_HDR.size))[0]
+            size = hdr & ~_FRAME_MORE
+            chunk = self._copy_out(tail + _FRAME_HDR.size, size)
+            tail += _FRAME_HDR.size + size
+            if hdr & _FRAME_MORE:
+                self._partial += chunk
+            elif self._partial:
+                self._partial += chunk
+                frames.append(bytes(self._partial))
+                self._partial.clear()
+            else:
+                frames.append(chunk)
+        self._store(_TAIL_OFFSET, tail)
+        return frames
+
+
+def _write_frame(fd, data):
+    buf = memoryview(_FRAME_HDR.pack(len(data)) + data)
+    while buf:
+        written = os.write(fd, buf)
+        buf = buf[written:]
+
+
+def _read_exact(fd, size):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = os.read(fd, size - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+def _read_frame(fd):
+    hdr = _read_exact(fd, _FRAME_HDR.size)
+    if hdr is None:
+        return None
+    return _read_exact(fd, _FRAME_HDR.unpack(hdr)[0])
+
+
+class _RingOutput:
+    '''
+    An output queue replacement used by PythonInprocRunner in the child
+    process, which serializes the output messages into the ring buffer.
+    '''
+
+    def __init__(self, ring, wakeup_fd, sentinel):
+        self._ring = ring
+        self._wakeup_fd = wakeup_fd
+        self._sentinel = sentinel
+        self._lock = threading.Lock()
+
+    def put(self, msg):
+        if msg is self._sentinel:
+            msg = None
+        data = memoryview(msgpack.packb(msg, use_bin_type=True))
+        with self._lock:
+            while True:
+                written, was_empty = self._ring.write_chunk(data)
+                if was_empty or written == 0:
+                    self._wakeup()
+                data = data[written:]
+                if not data:
+                    break
+                if written == 0:
+                    # Wait until the parent drains the ring buffer.
+                    time.sleep(0.0005)
+
+    def _wakeup(self):
+        try:
+            os.write(self._wakeup_fd, b'\x00')
+        except BlockingIOError:
+            pass  # the parent has pending wakeups already
+
+
+def _child_control(ctrl_fd, runner, code_queue, user_input_queue, output):
+    while True:
+        readable, _, _ = select.select([ctrl_fd], [], [], runner.flush_interval)
+        if not readable:
+            runner.flush_console_if_expired()
+            continue
+        frame = _read_frame(ctrl_fd)
+        if frame is None:
+            # The kernel runner has gone away.
+            os._exit(0)
+        op, payload = msgpack.unpackb(frame, raw=False)
+        if op == 'code':
+            code_queue.put(payload)
+        elif op == 'input':
+            user_input_queue.put(payload)
+        elif op == 'complete':
+            try:
+                matches = runner.complete(payload)
+            except Exception:
+                log.exception('unexpected error (complete)')
+                matches = []
+            output.put([b'completion', json.dumps(matches).encode('utf8')])
+        elif op == 'variables':
+            try:
+                variables = runner.inspect_variables()
+            except Exception:
+                log.exception('unexpected error (variables)')
+                variables = []
+            output.put([b'variables', json.dumps(variables).encode('utf8')])
+        elif op == 'stacks':
+            # Sample in another thread not to block the control loop.
+            threading.Thread(target=_send_stacks, args=(runner, payload, output),
+                             daemon=True).start()
+
+
+def _send_stacks(runner, options, output):
+    try:
+        options = {key: value for key, value in options.items()
+                   if key in STACK_OPTIONS}
+        stacks = runner.inspect_stacks(**options)
+    except Exception:
+        log.exception('unexpected error (stacks)')
+        stacks = {'threads': []}
+    output.put([b'stacks', json.dumps(stacks).encode('utf8')])
+
+
+def _child_main(args):
+    # The arguments are given by IsolatedInprocRunner._spawn().
+    ctrl_fd, wakeup_fd, ring_fd = (int(arg) for arg in args[:3])
+    runner_options = json.loads(args[3])
+    if runner_options['snapshot_path'] is not None:
+        runner_options['snapshot_path'] = Path(runner_options['snapshot_path'])
+    # The logs go to the kernel runner's stderr (the container log).
+    logging.basicConfig(
+        level=logging.INFO,
+        format='python-session: {message}',
+        style='{',
+    )
+    os.set_blocking(wakeup_fd, False)
+    ring = SharedRingBuffer(fd=ring_fd)
+
+    sentinel = object()
+    code_queue = queue.Queue()
+    user_input_queue = queue.Queue()
+    output = _RingOutput(ring, wakeup_fd, sentinel)
+    runner = PythonInprocRunner(code_queue, output, user_input_queue, sentinel,
+                                **runner_options)
+    control_thread = threading.Thread(
+        target=_child_control, name='IsolatedControl', daemon=True,
+        args=(ctrl_fd, runner, code_queue, user_input_queue, output))
+    control_thread.start()
+    # User codes run in the main thread to receive real signals.
+    while True:
+        try:
+            runner.run()
+        except KeyboardInterrupt:
+            # interrupted while idle
+            continue
+
+
+class _SessionProcess:
+
+    __slots__ = ('proc', 'pid', 'ctrl_fd', 'wakeup_fd', 'ring', 'killed')
+
+    def __init__(self, proc, ctrl_fd, wakeup_fd, ring):
+        self.proc = proc
+        self.pid = proc.pid
+        self.ctrl_fd = ctrl_fd
+        self.wakeup_fd = wakeup_fd
+        self.ring = ring
+        self.killed = None
+
+    @property
+    def returncode(self):
+        return self.proc.returncode
+
+    def send(self, op, payload):
+        _write_frame(self.ctrl_fd, msgpack.packb([op, payload], use_bin_type=True))
+
+    def kill(self, reason):
+        if self.returncode is None and self.killed is None:
+            self.killed = reason
+            os.kill(self.pid, signal.SIGKILL)
+
+    def poll(self, block=False):
+        if block:
+            return self.proc.wait()
+        return self.proc.poll()
+
+    def get_rss(self):
+        try:
+            with open(f'/proc/{self.pid}/statm', 'rb') as f:
+                return int(f.read().split()[1]) * mmap.PAGESIZE
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def close(self):
+        os.close(self.ctrl_fd)
+        os.close(self.wakeup_fd)
+        self.ring.close()
+
+
+class IsolatedInprocRunner:
+    '''
+    A replacement of PythonInprocRunner which executes user codes in a child
+    process spawned by the kernel runner, keeping the same interface with
+    the input/output/user-input channels.
+
+    It keeps one pre-spawned warm spare process so that a session can be
+    restarted in a few milliseconds when it crashes, when it does not respond
+    to an interrupt within ``interrupt_grace`` seconds, or when its resident
+    memory exceeds ``max_rss`` bytes after a cell.
+    Restarting a session discards the user namespace.
+    '''
+
+    def __init__(self, input_queue, output_queue, user_input_queue, sentinel, *,
+                 loop, flush_interval=0.05, ring_size=4 * 1024 * 1024,
+                 interrupt_grace=5.0, max_rss=None, prewarm=False,
+                 snapshot_path=DEFAULT_SNAPSHOT_PATH, memory_profile=None,
+                 memory_warn_ratio=0.8):
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.user_input_queue = user_input_queue
+        self.sentinel = sentinel
+        self.loop = loop
+        self.flush_interval = flush_interval
+        self.ring_size = ring_size
+        self.interrupt_grace = interrupt_grace
+        self.max_rss = max_rss
+        self.prewarm = prewarm
+        self.snapshot_path = snapshot_path
+        self.memory_profile = memory_profile
+        self.memory_warn_ratio = memory_warn_ratio
+
+        self.active = None
+        self.spare = None
+        self.running = False
+        self._query_seq = 0
+        self._completions = deque()
+        self._variable_requests = deque()
+        self._stack_requests = deque()
+        self._poll_handle = None
+        self._input_task = None
+
+    def start(self):
+        self.spare = self._spawn()
+        self._activate()
+        self._input_task = self.loop.create_task(self._forward_inputs())
+
+    async def shutdown(self):
+        if self._input_task is not None:
+            self._input_task.cancel()
+            await self._input_task
+        for proc in (self.active, self.spare):
+            if proc is not None:
+                self._discard(proc, 'shutdown')
+
+    def _spawn(self):
+        ring = SharedRingBuffer(self.ring_size)
+        ctrl_r, ctrl_w = os.pipe()
+        wakeup_r, wakeup_w = os.pipe()
+        options = {
+            'flush_interval': self.flush_interval,
+            'prewarm': self.prewarm,
+            'snapshot_path': (None if self.snapshot_path is None
+                              else str(self.snapshot_path)),
+            'memory_profile': self.memory_profile,
+            'memory_warn_ratio': self.memory_warn_ratio,
+        }
+        try:
+            # Only the given pipes and the ring are inherited, so the other
+            # sessions see EOF when the kernel runner exits.
+            proc = subprocess.Popen(
+                [sys.executable, '-c', _CHILD_BOOTSTRAP, _PACKAGE_ROOT,
+                 str(ctrl_r), str(wakeup_w), str(ring.fd), json.dumps(options)],
+                stdin=subprocess.DEVNULL,
+                pass_fds=(ctrl_r, wakeup_w, ring.fd),
+            )
+        except BaseException:
+            for fd in (ctrl_w, wakeup_r):
+                os.close(fd)
+            ring.close()
+            raise
+        finally:
+            os.close(ctrl_r)
+            os.close(wakeup_w)
+        os.set_blocking(wakeup_r, False)
+        return _SessionProcess(proc, ctrl_w, wakeup_r, ring)
+
+    def _activate(self):
+        proc, self.spare = self.spare, None
+        if proc is None:
+            proc = self._spawn()
+        self.active = proc
+        self.loop.add_reader(proc.wakeup_fd, self._on_wakeup, proc)
+        # Prepare the next warm spare right away.
+        self.spare = self._spawn()
+        log.debug('activated isolated session process (pid: %d)', proc.pid)
+
+    def _discard(self, proc, reason):
+        if proc is self.active:
+            self.active = None
+            self.loop.remove_reader(proc.wakeup_fd)
+        elif proc is self.spare:
+            self.spare = None
+        proc.kill(reason)
+        proc.poll(block=True)
+        proc.close()
+
+    async def _forward_inputs(self):
+        try:
+            while True:
+                code_text = await self.input_queue.async_q.get()
+                if self.active is None:
+                    self._activate()
+                self.running = True
+                self._query_seq += 1
+                self.active.send('code', code_text)
+                self._schedule_poll()
+        except asyncio.CancelledError:
+            pass
+
+    async def _forward_user_input(self, proc):
+        text = await self.user_input_queue.async_q.get()
+        if proc is self.active:
+            proc.send('input', text)
+
+    def _schedule_poll(self):
+        if self._poll_handle is None:
+            self._poll_handle = self.loop.call_later(
+                self.flush_interval, self._poll, self.active)
+
+    def _poll(self, proc):
+        # A fallback for wakeups lost by memory reordering between processes
+        # and for child exits hidden by grandchildren holding the wakeup pipe.
+        self._poll_handle = None
+        if proc is not self.active:
+            return
+        self._drain(proc)
+        if proc.poll() is not None:
+            self._on_exit(proc)
+        elif self.running:
+            self._schedule_poll()
+
+    def _on_wakeup(self, proc):
+        try:
+            data = os.read(proc.wakeup_fd, 4096)
+        except BlockingIOError:
+            data = b'\x00'
+        self._drain(proc)
+        if not data:
+            # EOF means that the child process has exited.
+            proc.poll(block=True)
+            self._on_exit(proc)
+
+    def _drain(self, proc):
+        for frame in proc.ring.read_frames():
+            msg = msgpack.unpackb(frame, raw=False)
+            if msg is None:
+                self.running = False
+                self._check_memory(proc)
+                self.output_queue.put(self.sentinel)
+            elif msg[0] == b'completion':
+                if self._completions:
+                    self._completions.popleft().set_result(json.loads(msg[1]))
+            elif msg[0] == b'variables':
+                if self._variable_requests:
+                    self._variable_requests.popleft().set_result(
+                        json.loads(msg[1]))
+            elif msg[0] == b'stacks':
+                if self._stack_requests:
+                    self._stack_requests.popleft().set_result(json.loads(msg[1]))
+            elif msg[0] == b'waiting-input':
+                self.output_queue.put(msg)
+                self.loop.create_task(self._forward_user_input(proc))
+            else:
+                self.output_queue.put(msg)
+
+    def _check_memory(self, proc):
+        if self.max_rss is None:
+            return
+        rss = proc.get_rss()
+        if rss is not None and rss > self.max_rss:
+            self.output_queue.put([
+                b'stderr',
+                (f'The session memory usage ({rss / 2**20:.1f} MiB) has exceeded '
+                 f'the limit ({self.max_rss / 2**20:.1f} MiB). '
+                 'Restarting the session...\n').encode('utf8'),
+            ])
+            self._discard(proc, 'memory')
+
+    def _on_exit(self, proc):
+        if proc is not self.active:
+            return
+        self.active = None
+        self.loop.remove_reader(proc.wakeup_fd)
+        returncode = proc.poll()
+        proc.close()
+        while self._completions:
+            self._completions.popleft().set_result([])
+        while self._variable_requests:
+            self._variable_requests.popleft().set_result([])
+        while self._stack_requests:
+            self._stack_requests.popleft().set_result({'threads': []})
+        if self.running:
+            self.running = False
+            if proc.killed == 'interrupt':
+                reason = 'did not respond to the interrupt'
+            elif returncode is not None and returncode < 0:
+                reason = f'was killed by signal {-returncode}'
+            else:
+                reason = f'has exited with code {returncode}'
+            self.output_queue.put([
+                b'stderr',
+                (f'The session process {reason}. '
+                 'A new session has been started and '
+                 'all previous variables are lost.\n').encode('utf8'),
+            ])
+            self.output_queue.put(self.sentinel)
+
+    async def complete(self, data):
+        if self.active is None:
+            self._activate()
+        fut = self.loop.create_future()
+        self._completions.append(fut)
+        self.active.send('complete', data)
+        return await fut
+
+    async def inspect_variables(self):
+        if self.active is None:
+            self._activate()
+        fut = self.loop.create_future()
+        self._variable_requests.append(fut)
+        self.active.send('variables', None)
+        try:
+            # The future is kept to match with a late reply.
+            return await asyncio.wait_for(asyncio.shield(fut), REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            log.warning('The session process did not answer the variables '
+                        'request in time.')
+            return []
+
+    async def inspect_stacks(self, **options):
+        if self.active is None:
+            self._activate()
+        fut = self.loop.create_future()
+        self._stack_requests.append(fut)
+        self.active.send('stacks', options)
+        return await fut
+
+    def interrupt(self):
+        proc = self.active
+        if proc is None or not self.running:
+            log.error('No user code is running!')
+            return
+        os.kill(proc.pid, signal.SIGINT)
+        self.loop.call_later(self.interrupt_grace, self._escalate_interrupt,
+                             proc, self._query_seq)
+
+    def _escalate_interrupt(self, proc, query_seq):
+        if proc is self.active and self.running and self._query_seq == query_seq:
+            log.warning('The session did not respond to the interrupt; '
+                        'restarting it...')
+            proc.kill('interrupt')
+            # The exit is handled by _on_wakeup() when the pipe gets EOF.
+            self._schedule_poll()
+
+    def flush_console_if_expired(self):
+        # The child process flushes its console buffers by itself.
+        pass
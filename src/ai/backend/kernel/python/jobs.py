@@ -0,0 +1,129 @@
+'''
+Background jobs of query-mode cells (the ``%%background`` magic).
+
+A job runs a cell on its own thread sharing the user namespace.  Its console
+outputs are tagged with the job ID.  They are streamed while a foreground
+cell is running, and otherwise kept (up to a limit) until the next one.
+'''
+
+from collections import deque
+import ctypes
+from io import IOBase, UnsupportedOperation
+import threading
+import time
+
+from .types import ConsoleRecord
+
+MAX_PENDING_OUTPUT = 1024 * 1024
+
+
+class JobConsole(IOBase):
+
+    def __init__(self, job, stream_type):
+        self._job = job
+        self._stream_type = stream_type
+
+    def writable(self):
+        return True
+
+    def fileno(self):
+        raise OSError(f'{self._stream_type} has no file descriptor '
+                      'because it is a virtual console.')
+
+    def read(self, *args, **kwargs):
+        raise UnsupportedOperation()
+
+    def write(self, s):
+        if isinstance(s, str):
+            s = s.encode('utf8')
+        self._job.write(self._stream_type, s)
+        return len(s)
+
+    def isatty(self):
+        return True
+
+
+class BackgroundJob:
+    '''
+    It provides the runner-like interface (consoles, ``emit()``, and
+    ``handle_input()``) used to route the outputs of the job thread.
+    '''
+
+    def __init__(self, job_id, code_text, runner):
+        self.id = job_id
+        self.code_text = code_text
+        self.runner = runner
+        self.status = 'running'
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.thread = None
+        self.event_loop = None
+        self.stdout = JobConsole(self, 'stdout')
+        self.stderr = JobConsole(self, 'stderr')
+        self._prefix = f'[job {job_id}] '.encode('utf8')
+        self._at_line_start = {'stdout': True, 'stderr': True}
+        self._pending = deque()
+        self._pending_size = 0
+        self._num_dropped = 0
+        self._lock = threading.Lock()
+
+    @property
+    def title(self):
+        lines = self.code_text.strip().splitlines()
+        first_line = lines[0] if lines else ''
+        return first_line if len(first_line) <= 50 else first_line[:47] + '...'
+
+    @property
+    def elapsed(self):
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    def write(self, stream_type, data):
+        tagged = bytearray()
+        for chunk in data.splitlines(keepends=True):
+            if self._at_line_start[stream_type]:
+                tagged += self._prefix
+            tagged += chunk
+            self._at_line_start[stream_type] = chunk.endswith((b'\n', b'\r'))
+        with self._lock:
+            self._pending.append((stream_type, bytes(tagged)))
+            self._pending_size += len(tagged)
+            while self._pending_size > MAX_PENDING_OUTPUT:
+                _, dropped = self._pending.popleft()
+                self._pending_size -= len(dropped)
+                self._num_dropped += len(dropped)
+        if not self.runner.idle.is_set():
+            self.flush_pending()
+
+    def flush_pending(self):
+        '''
+        Emit the pending outputs to the runner's output queue.
+        '''
+        with self._lock:
+            if self._num_dropped:
+                self.runner.emit_console(ConsoleRecord(
+                    'stderr',
+                    self._prefix + f'({self._num_dropped} bytes of output '
+                                   'dropped)\n'.encode('utf8')))
+                self._num_dropped = 0
+            while self._pending:
+                stream_type, data = self._pending.popleft()
+                self.runner.emit_console(ConsoleRecord(stream_type, data))
+            self._pending_size = 0
+
+    def emit(self, record):
+        self.runner.emit(record)
+
+    def handle_input(self, prompt=None, password=False):
+        raise RuntimeError('Background jobs cannot read user inputs.')
+
+    def interrupt(self):
+        if self.thread is None or not self.thread.is_alive():
+            return False
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(
+            ctypes.c_long(self.thread.ident),
+            ctypes.py_object(KeyboardInterrupt))
+        event_loop = self.event_loop
+        if event_loop is not None and event_loop.is_running():
+            event_loop.call_soon_threadsafe(lambda: None)
+        return True
@@ -0,0 +1,157 @@
+'''
+Per-cell memory profiling of query-mode cells (the ``%memprof`` magic).
+
+In the "rss" mode, the peak and net growth of the process resident memory
+during a cell are measured almost for free, by resetting the kernel's peak
+RSS counter (``VmHWM``) before the cell or, where it is not permitted, by
+polling ``/proc/self/statm``.  The "tracemalloc" mode additionally traces
+Python allocations to report the top allocation sites of the cell, at the
+cost of slowing down allocation-heavy code.
+
+Both are process-wide, so the results include the memory used by the other
+threads (e.g., background jobs) during the cell.
+'''
+
+import linecache
+import os
+import threading
+import tracemalloc
+
+MODES = ('rss', 'tracemalloc')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def read_rss():
+    with open('/proc/self/statm', 'rb') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def _read_peak_rss():
+    with open('/proc/self/status', 'rb') as f:
+        for line in f:
+            if line.startswith(b'VmHWM:'):
+                return int(line.split()[1]) * 1024
+    raise OSError('VmHWM is not available')
+
+
+def _reset_peak_rss():
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+
+
+def format_size(num_bytes, signed=False):
+    sign = '-' if num_bytes < 0 else '+' if signed else ''
+    num_bytes = abs(num_bytes)
+    for unit in ('B', 'KiB', 'MiB'):
+        if num_bytes < 1024:
+            return f'{sign}{num_bytes:.0f} {unit}' if unit == 'B' \
+                   else f'{sign}{num_bytes:.1f} {unit}'
+        num_bytes /= 1024
+    return f'{sign}{num_bytes:.2f} GiB'
+
+
+class _RSSPoller(threading.Thread):
+
+    def __init__(self, interval):
+        super().__init__(name='RSSPoller', daemon=True)
+        self.interval = interval
+        self.peak = read_rss()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, read_rss())
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.peak = max(self.peak, read_rss())
+
+
+class CellMemoryMonitor:
+    '''
+    A context manager measuring the memory usage of the code executed within
+    it.  After exiting, :meth:`format_report` and :meth:`format_warning`
+    describe the results.
+    '''
+
+    def __init__(self, mode='rss', *, code_text='', top=5, warn_ratio=0.8,
+                 limit=None, poll_interval=0.01):
+        if mode not in MODES:
+            raise ValueError(f'Invalid memory profiling mode: {mode!r}')
+        self.mode = mode
+        self.code_lines = code_text.splitlines()
+        self.top = top
+        self.warn_ratio = warn_ratio
+        self.limit = limit
+        self.poll_interval = poll_interval
+        self.rss_before = self.rss_after = self.peak_rss = 0
+        self.traced_peak = None
+        self.top_sites = []
+        self._poller = None
+        self._tracing = False
+
+    def __enter__(self):
+        self.rss_before = read_rss()
+        try:
+            _reset_peak_rss()
+        except OSError:
+            self._poller = _RSSPoller(self.poll_interval)
+            self._poller.start()
+        # Do not interfere with the tracing started by user codes.
+        if self.mode == 'tracemalloc' and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._tracing:
+            snapshot = tracemalloc.take_snapshot()
+            _, self.traced_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self._tracing = False
+            snapshot = snapshot.filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ))
+            self.top_sites = snapshot.statistics('lineno')[:self.top]
+        self.rss_after = read_rss()
+        if self._poller is not None:
+            self._poller.stop()
+            self.peak_rss = self._poller.peak
+        else:
+            self.peak_rss = _read_peak_rss()
+
+    def format_report(self):
+        peak = format_size(self.peak_rss - self.rss_before, signed=True)
+        net = format_size(self.rss_after - self.rss_before, signed=True)
+        lines = [f'[memprof] peak {peak}, net {net} '
+                 f'(RSS {format_size(self.rss_after)})\n']
+        if self.traced_peak is not None:
+            lines.append(f'[memprof] peak of traced Python allocations: '
+                         f'{format_size(self.traced_peak)}\n')
+        for stat in self.top_sites:
+            frame = stat.traceback[0]
+            if frame.filename == '<input>':
+                source = self.code_lines[frame.lineno - 1].strip() \
+                         if frame.lineno <= len(self.code_lines) else ''
+            else:
+                source = linecache.getline(frame.filename, frame.lineno).strip()
+            lines.append(f'[memprof] {format_size(stat.size):>10s} '
+                         f'{stat.count:7d} blocks  '
+                         f'{frame.filename}:{frame.lineno}  {source}\n')
+        return ''.join(lines)
+
+    def format_warning(self):
+        '''
+        Returns a warning if the cell has grown the process past
+        ``warn_ratio`` of the memory limit, or None.
+        '''
+        if self.limit is None or self.peak_rss <= self.rss_before:
+            return None
+        ratio = max(self.rss_after, self.peak_rss) / self.limit
+        if ratio < self.warn_ratio:
+            return None
+        return (f'[memprof] warning: the process has used {ratio:.0%} of the '
+                f'memory limit ({format_size(self.limit)}).  It may be killed '
+                'if the memory usage grows further.\n')
@@ -0,0 +1,124 @@
+'''
+Usage-driven background pre-warming of heavy modules for query mode.
+
+The import statistics of user cells are persisted in the user's home
+directory, so that a new session can import the most frequently used heavy
+modules in a background thread while it is idle after startup.
+'''
+
+import ast
+import importlib
+import json
+import logging
+import os
+from pathlib import Path
+import sys
+import threading
+
+log = logging.getLogger()
+
+
+class ImportStats:
+    '''
+    Counts the number of sessions which have imported each heavy top-level
+    package.  A package is regarded "heavy" if it has loaded at least
+    ``min_submodules`` modules including itself.
+
+    The statistics are stored in ``~/.cache/backend.ai/python-imports.json``
+    by default.
+    '''
+
+    def __init__(self, path=None, min_submodules=10):
+        if path is None:
+            path = Path.home() / '.cache' / 'backend.ai' / 'python-imports.json'
+        self.path = Path(path)
+        self.min_submodules = min_submodules
+        self.counts = {}
+        self._recorded = set()
+        self._lock = threading.Lock()
+        try:
+            counts = json.loads(self.path.read_text())
+            if isinstance(counts, dict):
+                self.counts = {k: int(v) for k, v in counts.items()}
+        except (OSError, ValueError):
+            pass
+
+    def top(self, num_modules):
+        ranked = sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+        return [name for name, _ in ranked[:num_modules]]
+
+    def record(self, code_text):
+        '''
+        Record the heavy packages imported by the given cell code.
+        It should be called after executing the cell.
+        '''
+        if 'import' not in code_text:
+            return
+        try:
+            tree = ast.parse(code_text)
+        except (SyntaxError, ValueError):
+            return
+        names = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names.update(alias.name.partition('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                if node.level == 0 and node.module:
+                    names.add(node.module.partition('.')[0])
+        names -= self._recorded
+        if not names:
+            return
+        loaded = list(sys.modules)
+        updated = False
+        with self._lock:
+            for name in names:
+                if name not in sys.modules:
+                    continue
+                prefix = name + '.'
+                num_submodules = sum(1 for m in loaded
+                                     if m == name or m.startswith(prefix))
+                if num_submodules < self.min_submodules:
+                    continue
+                self._recorded.add(name)
+                self.counts[name] = self.counts.get(name, 0) + 1
+                updated = True
+            if updated:
+                self._save()
+
+    def _save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + f'.{os.getpid()}')
+            tmp_path.write_text(json.dumps(self.counts))
+            tmp_path.replace(self.path)
+        except OSError:
+            log.warning('could not save the import statistics to %s', self.path)
+
+
+class ModulePrewarmer(threading.Thread):
+    '''
+    Imports the given modules one by one in the background, only while the
+    session is idle.
+
+    Python uses per-module import locks, so a foreground cell waits only when
+    it imports the module being pre-warmed at the moment, which it would have
+    to import anyway.
+    '''
+
+    def __init__(self, modules, idle_event):
+        super().__init__(name='ModulePrewarmer', daemon=True)
+        self.modules = modules
+        self.idle_event = idle_event
+        self.imported = []
+
+    def run(self):
+        for name in self.modules:
+            self.idle_event.wait()
+            if name in sys.modules:
+                continue
+            try:
+                importlib.import_module(name)
+            except Exception:
+                # Pre-warming is a best-effort optimization.
+                continue
+            self.imported.append(name)
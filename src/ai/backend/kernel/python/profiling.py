@@ -0,0 +1,237 @@
+'''
+CPU profiling of query-mode cells (the ``%prun`` and ``%%prun`` magics) and
+on-demand stack inspection of running cells (the "stacks" op).
+
+A cell is profiled deterministically by cProfile and/or by a low-overhead
+sampling profiler, which periodically captures the Python stack of the
+thread running the cell.  The sampled stacks are exported as a flame graph
+in the speedscope file format (https://www.speedscope.app).
+'''
+
+from collections import Counter
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+SPEEDSCOPE_MIME = 'application/x-speedscope+json'
+CELL_FILENAME = '<input>'
+
+
+def _extract_stack(frame):
+    # Returns the frames from the outermost frame of the cell code to the
+    # innermost one, or None if the thread is not running the cell code.
+    stack = []
+    root = None
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+        if code.co_filename == CELL_FILENAME:
+            root = len(stack)
+        frame = frame.f_back
+    if root is None:
+        return None
+    return tuple(reversed(stack[:root]))
+
+
+class StackSampler(threading.Thread):
+    '''
+    Samples the Python stack of the given thread every ``interval`` seconds
+    and accumulates the time spent in each distinct stack.
+
+    Each sample is weighted by the actual time elapsed since the previous
+    one, since the sampler may wake up late while the sampled thread holds
+    the GIL.
+    '''
+
+    def __init__(self, thread_id, interval=0.005):
+        super().__init__(name='StackSampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.weights = Counter()
+        self.num_samples = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        last_time = time.perf_counter()
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = _extract_stack(frame)
+            del frame
+            now = time.perf_counter()
+            if stack is not None:
+                self.weights[stack] += now - last_time
+                self.num_samples += 1
+            last_time = now
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def _frame_label(frame_key):
+    name, filename, lineno = frame_key
+    if filename == CELL_FILENAME:
+        return f'{name} ({filename}:{lineno})'
+    return f'{name} ({os.path.basename(filename)}:{lineno})'
+
+
+def _aggregate(sampler):
+    # Returns the self and total (inclusive) times of each function.
+    self_times = Counter()
+    total_times = Counter()
+    for stack, weight in sampler.weights.items():
+        self_times[stack[-1]] += weight
+        for frame_key in set(stack):
+            total_times[frame_key] += weight
+    keys = sorted(total_times,
+                  key=lambda key: (self_times[key], total_times[key]),
+                  reverse=True)
+    return keys, self_times, total_times
+
+
+def format_samples(sampler, limit=20):
+    '''
+    Returns the hotspot table of the sampled stacks, sorted by the self time
+    of each function.
+    '''
+    keys, self_times, total_times = _aggregate(sampler)
+    total = sum(sampler.weights.values())
+    lines = [f'{sampler.num_samples} samples taken every '
+             f'{sampler.interval * 1000:g} ms\n\n',
+             '  self(s)  self%  total(s) total%  function\n']
+    if not total:
+        return ''.join(lines)
+    for key in keys[:limit]:
+        lines.append(f'{self_times[key]:9.3f} '
+                     f'{self_times[key] / total:6.1%} '
+                     f'{total_times[key]:9.3f} '
+                     f'{total_times[key] / total:6.1%}  '
+                     f'{_frame_label(key)}\n')
+    return ''.join(lines)
+
+
+def hot_frames(sampler, limit=20):
+    '''
+    Returns the hottest functions of the sampled stacks as a
+    JSON-serializable list.  The times are in seconds.
+    '''
+    keys, self_times, total_times = _aggregate(sampler)
+    return [{
+        'name': name,
+        'file': filename,
+        'line': lineno,
+        'self': self_times[(name, filename, lineno)],
+        'total': total_times[(name, filename, lineno)],
+    } for name, filename, lineno in keys[:limit]]
+
+
+def capture_stacks(threads):
+    '''
+    Returns the current stacks of the given threads (pairs of names and
+    idents) without stopping them, from the outermost frame.
+    '''
+    frames = sys._current_frames()
+    results = []
+    for name, ident in threads:
+        frame = frames.get(ident)
+        if frame is None:
+            continue
+        results.append({
+            'thread': name,
+            'stack': [{
+                'name': summary.name,
+                'file': summary.filename,
+                'line': summary.lineno,
+                'code': summary.line,
+            } for summary in traceback.extract_stack(frame)],
+        })
+    del frames
+    return results
+
+
+def format_stats(profiler, sort_key='tottime', limit=20):
+    '''
+    Returns the hotspot table of the cProfile results.
+    '''
+    buf = io.StringIO()
+    stats = pstats.Stats(profiler, stream=buf)
+    stats.sort_stats(sort_key).print_stats(limit)
+    return buf.getvalue().lstrip('\n')
+
+
+def speedscope_profile(sampler, name='cell'):
+    '''
+    Returns the sampled stacks as a speedscope "sampled" profile (a
+    JSON-serializable dict).  The weights are in milliseconds.
+    '''
+    frames = []
+    frame_indices = {}
+    samples = []
+    weights = []
+    for stack, weight in sampler.weights.items():
+        sample = []
+        for frame_key in stack:
+            index = frame_indices.get(frame_key)
+            if index is None:
+                index = frame_indices[frame_key] = len(frames)
+                frames.append({
+                    'name': frame_key[0],
+                    'file': frame_key[1],
+                    'line': frame_key[2],
+                })
+            sample.append(index)
+        samples.append(sample)
+        weights.append(round(weight * 1000, 3))
+    return {
+        '$schema': SPEEDSCOPE_SCHEMA,
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights,
+        }],
+        'name': name,
+        'activeProfileIndex': 0,
+        'exporter': 'backend.ai-kernel',
+    }
+
+
+class CellProfiler:
+    '''
+    A context manager profiling the code executed within it on the current
+    thread.  If ``deterministic`` is False, only the sampling profiler is
+    used to minimize the overhead.
+    '''
+
+    def __init__(self, *, deterministic=True, interval=0.005):
+        self.profiler = cProfile.Profile() if deterministic else None
+        self.sampler = StackSampler(threading.get_ident(), interval)
+
+    def __enter__(self):
+        self.sampler.start()
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.sampler.stop()
+
+    def format_hotspots(self, sort_key='tottime', limit=20):
+        if self.profiler is not None:
+            return format_stats(self.profiler, sort_key, limit)
+        return format_samples(self.sampler, limit)
+
+    def flame_graph(self, name='cell'):
+        return speedscope_profile(self.sampler, name)
@@ -0,0 +1,177 @@
+'''
+Query-mode sessions hosted by the Python kernel runner.
+
+A runner hosts the default session, which serves the ops without a session
+ID, and any number of secondary sessions created on demand by the ops with a
+session ID.  Since they share the runner process, the imported libraries are
+loaded only once.
+'''
+
+import asyncio
+import ctypes
+from functools import partial
+import logging
+import threading
+
+from ..channel import ThreadChannel
+from ..utils import safe_close_task
+from .inproc import STACK_OPTIONS, PythonInprocRunner
+from .isolated import IsolatedInprocRunner
+
+log = logging.getLogger()
+
+
+class QuerySession:
+    '''
+    A user namespace with its own worker (a thread, or a child process if
+    ``isolation`` is "process"), channels, and completer.
+    '''
+
+    def __init__(self, session_id, *, loop, isolation='thread', max_rss=None,
+                 prewarm=False, snapshot_path=None, memory_profile=None,
+                 memory_warn_ratio=0.8):
+        self.session_id = session_id
+        self.loop = loop
+        self.isolation = isolation
+        self.max_rss = max_rss
+        self.prewarm = prewarm
+        self.snapshot_path = snapshot_path
+        self.memory_profile = memory_profile
+        self.memory_warn_ratio = memory_warn_ratio
+        self.sentinel = object()
+        self.input_queue = ThreadChannel(loop=loop)
+        self.output_queue = ThreadChannel(loop=loop)
+        self.user_input_queue = ThreadChannel(loop=loop)
+        self.inproc_runner = None
+        # ops serialized with the queries (used by secondary sessions)
+        self.task_queue = asyncio.Queue(loop=loop)
+        self.worker_task = None
+
+    def ensure_inproc_runner(self):
+        if self.inproc_runner is None:
+            options = {
+                'prewarm': self.prewarm,
+                'memory_profile': self.memory_profile,
+                'memory_warn_ratio': self.memory_warn_ratio,
+            }
+            if self.snapshot_path is not None:
+                options['snapshot_path'] = self.snapshot_path
+            if self.isolation == 'process':
+                self.inproc_runner = IsolatedInprocRunner(
+                    self.input_queue,
+                    self.output_queue,
+                    self.user_input_queue,
+                    self.sentinel,
+                    loop=self.loop,
+                    max_rss=self.max_rss,
+                    **options)
+            else:
+                self.inproc_runner = PythonInprocRunner(
+                    self.input_queue.sync_q,
+                    self.output_queue.sync_q,
+                    self.user_input_queue.sync_q,
+                    self.sentinel,
+                    **options)
+            self.inproc_runner.start()
+
+    async def query(self, code_text, send):
+        '''
+        Run the code and pass its outputs to ``send`` until it finishes.
+        '''
+        self.ensure_inproc_runner()
+        self.input_queue.put(code_text)
+        flush_task = self.loop.create_task(self._flush_console_periodically())
+        try:
+            # Read the generated outputs until done
+            done = False
+            while not done:
+                try:
+                    msgs = await self.output_queue.async_q.get_batch()
+                except asyncio.CancelledError:
+                    break
+                for msg in msgs:
+                    if msg is self.sentinel:
+                        done = True
+                        break
+                    send(msg)
+        finally:
+            await safe_close_task(flush_task)
+        return 0
+
+    async def _flush_console_periodically(self):
+        # Pick up the buffered console outputs of user codes gone quiet.
+        try:
+            while True:
+                await asyncio.sleep(self.inproc_runner.flush_interval)
+                self.inproc_runner.flush_console_if_expired()
+        except asyncio.CancelledError:
+            pass
+
+    async def complete(self, data):
+        self.ensure_inproc_runner()
+        if self.isolation == 'process':
+            return await self.inproc_runner.complete(data)
+        return self.inproc_runner.complete(data)
+
+    async def inspect_variables(self):
+        if self.inproc_runner is None:
+            return []
+        if self.isolation == 'process':
+            return await self.inproc_runner.inspect_variables()
+        return self.inproc_runner.inspect_variables()
+
+    async def inspect_stacks(self, options):
+        if self.inproc_runner is None:
+            return {'threads': []}
+        if not isinstance(options, dict):
+            options = {}
+        # Ignore the unknown options given by the client.
+        options = {key: value for key, value in options.items()
+                   if key in STACK_OPTIONS}
+        if self.isolation == 'process':
+            return await self.inproc_runner.inspect_stacks(**options)
+        return await self.loop.run_in_executor(
+            None, partial(self.inproc_runner.inspect_stacks, **options))
+
+    def interrupt(self):
+        if self.inproc_runner is None:
+            log.error('No user code is running!')
+            return
+        if self.isolation == 'process':
+            # Deliver a real SIGINT to the session process.
+            self.inproc_runner.interrupt()
+            return
+        # A dirty hack to raise an exception inside a running thread.
+        target_tid = self.inproc_runner.ident
+        if target_tid not in {t.ident for t in threading.enumerate()}:
+            log.error('Interrupt failed due to missing thread.')
+            return
+        affected_count = ctypes.pythonapi.PyThreadState_SetAsyncExc(
+            ctypes.c_long(target_tid),
+            ctypes.py_object(KeyboardInterrupt))
+        # Wake up the session's event loop blocked in polling (if any) to let
+        # the exception be raised.
+        event_loop = self.inproc_runner.event_loop
+        if event_loop is not None and event_loop.is_running():
+            event_loop.call_soon_threadsafe(lambda: None)
+        if affected_count == 0:
+            log.error('Interrupt failed due to invalid thread identity.')
+        elif affected_count > 1:
+            ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                ctypes.c_long(target_tid),
+                ctypes.c_long(0))
+            log.error('Interrupt broke the interpreter state -- '
+                      'recommended to reset the session.')
+
+    async def shutdown(self):
+        if self.worker_task is not None and \
+                self.worker_task is not asyncio.Task.current_task(loop=self.loop):
+            await safe_close_task(self.worker_task)
+        if self.inproc_runner is None:
+            return
+        if self.isolation == 'process':
+            await self.inproc_runner.shutdown()
+        else:
+            # Let the thread finish to release the namespace.
+            self.input_queue.put(None)
+        self.inproc_runner = None
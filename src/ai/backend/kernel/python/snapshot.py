@@ -0,0 +1,183 @@
+'''
+Checkpointing of the query-mode user namespace to local disk.
+
+Each picklable object is stored in its own file so that a snapshot can be
+updated incrementally, rewriting only the objects changed since the last
+snapshot (as versioned by :class:`.cells.CellTracker`).  Large NumPy arrays
+and single-dtype pandas objects are stored as ``.npy`` files and restored as
+copy-on-write memory maps, so their contents are loaded lazily by the OS on
+first access.  Imported modules are recorded by name and re-imported.
+'''
+
+from contextlib import contextmanager
+import importlib
+import json
+from pathlib import Path
+import pickle
+import sys
+import types
+import uuid
+
+INDEX_NAME = 'index.json'
+OBJECTS_DIR = 'objects'
+
+
+@contextmanager
+def _as_main_module(user_module):
+    # Objects of user-defined classes refer to "__main__".
+    orig_main = sys.modules.get('__main__')
+    sys.modules['__main__'] = user_module
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = orig_main
+
+
+class NamespaceSnapshot:
+    '''
+    A snapshot directory of a user namespace.
+
+    Only the objects whose versions differ from those at the last
+    :meth:`save` or :meth:`restore` of this instance are rewritten.
+    '''
+
+    def __init__(self, path, *, mmap_threshold=1024 * 1024):
+        self.path = Path(path)
+        self.mmap_threshold = mmap_threshold
+        self.saved_versions = {}
+        try:
+            self.index = json.loads((self.path / INDEX_NAME).read_text())
+        except (OSError, ValueError):
+            self.index = {}
+
+    def _new_file(self, suffix):
+        # Never overwrite the files which restored objects may map.
+        return f'{OBJECTS_DIR}/{uuid.uuid4().hex}{suffix}'
+
+    def _write_pickle(self, obj):
+        filename = self._new_file('.pkl')
+        with open(self.path / filename, 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return filename
+
+    def _write_array(self, arr):
+        np = sys.modules['numpy']
+        filename = self._new_file('.npy')
+        np.save(str(self.path / filename), arr, allow_pickle=False)
+        return filename
+
+    def _encode(self, obj):
+        if isinstance(obj, types.ModuleType):
+            return {'kind': 'module', 'module': obj.__name__}
+        if isinstance(obj, (types.FunctionType, type)):
+            # Codes are restored by re-running their cells.
+            return None
+        np = sys.modules.get('numpy')
+        if np is not None and isinstance(obj, np.ndarray) and \
+                type(obj) in (np.ndarray, np.memmap) and \
+                not obj.dtype.hasobject and obj.nbytes >= self.mmap_threshold:
+            return {'kind': 'ndarray', 'data': self._write_array(obj)}
+        pd = sys.modules.get('pandas')
+        if pd is not None and isinstance(obj, (pd.DataFrame, pd.Series)):
+            dtypes = obj.dtypes.unique() if isinstance(obj, pd.DataFrame) \
+                     else [obj.dtype]
+            if len(dtypes) == 1 and isinstance(dtypes[0], np.dtype) and \
+                    not dtypes[0].hasobject and \
+                    obj.values.nbytes >= self.mmap_threshold:
+                if isinstance(obj, pd.DataFrame):
+                    meta = {'index': obj.index, 'columns': obj.columns}
+                    kind = 'dataframe'
+                else:
+                    meta = {'index': obj.index, 'name': obj.name}
+                    kind = 'series'
+                return {
+                    'kind': kind,
+                    'data': self._write_array(obj.values),
+                    'meta': self._write_pickle(meta),
+                }
+        return {'kind': 'pickle', 'data': self._write_pickle(obj)}
+
+    def _decode(self, entry):
+        kind = entry['kind']
+        if kind == 'module':
+            return importlib.import_module(entry['module'])
+        if kind == 'pickle':
+            with open(self.path / entry['data'], 'rb') as f:
+                return pickle.load(f)
+        import numpy as np
+        data = np.load(str(self.path / entry['data']), mmap_mode='c')
+        if kind == 'ndarray':
+            return data
+        import pandas as pd
+        with open(self.path / entry['meta'], 'rb') as f:
+            meta = pickle.load(f)
+        if kind == 'dataframe':
+            return pd.DataFrame(data, index=meta['index'],
+                                columns=meta['columns'], copy=False)
+        return pd.Series(data, index=meta['index'], name=meta['name'], copy=False)
+
+    def save(self, namespace, versions, user_module):
+        '''
+        Save the namespace objects and returns a summary dict.
+        '''
+        (self.path / OBJECTS_DIR).mkdir(parents=True, exist_ok=True)
+        new_index = {}
+        written, unchanged, skipped = [], [], []
+        with _as_main_module(user_module):
+            for name, obj in list(namespace.items()):
+                if name.startswith('__') and name.endswith('__'):
+                    continue
+                version = versions.get(name)
+                if name in self.index and version is not None and \
+                        self.saved_versions.get(name) == version:
+                    new_index[name] = self.index[name]
+                    unchanged.append(name)
+                    continue
+                try:
+                    entry = self._encode(obj)
+                except Exception:
+                    entry = None
+                if entry is None:
+                    skipped.append(name)
+                    continue
+                new_index[name] = entry
+                self.saved_versions[name] = version
+                written.append(name)
+        self._replace_index(new_index)
+        return {'written': written, 'unchanged': unchanged, 'skipped': skipped}
+
+    def restore(self, namespace, user_module):
+        '''
+        Load the objects in the snapshot into the namespace and returns a
+        summary dict.  The caller should update :attr:`saved_versions` with
+        the versions of the restored names.
+        '''
+        restored, failed = [], []
+        with _as_main_module(user_module):
+            for name, entry in self.index.items():
+                try:
+                    namespace[name] = self._decode(entry)
+                except Exception:
+                    failed.append(name)
+                else:
+                    restored.append(name)
+        return {'restored': restored, 'failed': failed}
+
+    def _replace_index(self, new_index):
+        tmp_path = self.path / (INDEX_NAME + '.tmp')
+        tmp_path.write_text(json.dumps(new_index))
+        tmp_path.replace(self.path / INDEX_NAME)
+        # Remove the files no longer referenced.  (Memory-mapped files
+        # remain accessible to the restored objects after unlinking.)
+        used = set()
+        for entry in new_index.values():
+            used.update(entry[key] for key in ('data', 'meta') if key in entry)
+        for child in (self.path / OBJECTS_DIR).iterdir():
+            if f'{OBJECTS_DIR}/{child.name}' not in used:
+                try:
+                    child.unlink()
+                except OSError:
+                    pass
+        self.index = new_index
+        self.saved_versions = {name: self.saved_versions.get(name)
+                               for name in new_index}
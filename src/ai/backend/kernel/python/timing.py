@@ -0,0 +1,127 @@
+'''
+Micro-benchmarking of statements (the ``%timeit`` and ``%%timeit`` magics).
+'''
+
+import gc
+import math
+import statistics
+import timeit
+
+TIMEIT_MIME = 'application/x-sorna-timeit'
+CALIBRATION_TIME = 0.2  # the minimum duration of each run in seconds
+
+
+def format_time(seconds):
+    if seconds <= 0:
+        return '0 s'
+    for unit, scale in (('s', 1), ('ms', 1e3), ('µs', 1e6), ('ns', 1e9)):
+        if seconds >= 1 / scale:
+            return f'{seconds * scale:.3g} {unit}'
+    return f'{seconds * 1e9:.3g} ns'
+
+
+class TimeitResult:
+    '''
+    The statistics of the per-loop times of the runs.
+    Outliers are detected by the Tukey's fences (1.5 IQR beyond the
+    quartiles).
+    '''
+
+    def __init__(self, loops, timings, gc_enabled=False):
+        self.loops = loops
+        self.timings = [t / loops for t in timings]
+        self.gc_enabled = gc_enabled
+        self.mean = statistics.mean(self.timings)
+        self.median = statistics.median(self.timings)
+        self.stdev = statistics.stdev(self.timings) if len(timings) > 1 else 0.0
+        self.best = min(self.timings)
+        self.worst = max(self.timings)
+        q1, q3 = self._quartiles(sorted(self.timings))
+        low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+        self.outliers = [i for i, t in enumerate(self.timings)
+                         if t < low or t > high]
+
+    @staticmethod
+    def _quartiles(values):
+        def percentile(p):
+            pos = (len(values) - 1) * p
+            lower, upper = math.floor(pos), math.ceil(pos)
+            return values[lower] + (values[upper] - values[lower]) * (pos - lower)
+        return percentile(0.25), percentile(0.75)
+
+    def format(self):
+        runs = len(self.timings)
+        lines = [
+            f'{format_time(self.mean)} ± {format_time(self.stdev)} per loop '
+            f'(mean ± std. dev. of {runs} run{"s" if runs > 1 else ""}, '
+            f'{self.loops} loop{"s" if self.loops > 1 else ""} each)\n',
+            f'median {format_time(self.median)}, '
+            f'min {format_time(self.best)}, max {format_time(self.worst)}'
+            f'{"" if self.gc_enabled else ", GC disabled"}\n',
+        ]
+        if self.outliers:
+            lines.append(f'{len(self.outliers)} outlier run(s) detected: ' +
+                         ', '.join(format_time(self.timings[i])
+                                   for i in self.outliers) + '\n')
+        if self.worst > self.best * 4 and self.worst > 1e-6:
+            lines.append(f'The slowest run took {self.worst / self.best:.1f} '
+                         'times longer than the fastest.  This could mean '
+                         'that an intermediate result is being cached.\n')
+        return ''.join(lines)
+
+    def to_dict(self):
+        return {
+            'loops': self.loops,
+            'timings': self.timings,
+            'mean': self.mean,
+            'median': self.median,
+            'stdev': self.stdev,
+            'min': self.best,
+            'max': self.worst,
+            'outliers': self.outliers,
+            'gc_enabled': self.gc_enabled,
+        }
+
+
+class StatementTimer(timeit.Timer):
+    '''
+    A :class:`timeit.Timer` running the statement in the given namespace,
+    optionally keeping the garbage collector enabled.
+    '''
+
+    def __init__(self, stmt, setup, namespace, *, gc_enabled=False):
+        super().__init__(stmt, setup, globals=namespace)
+        self.gc_enabled = gc_enabled
+
+    def timeit(self, number=timeit.default_number):
+        if not self.gc_enabled:
+            return super().timeit(number)
+        # timeit.Timer always disables GC during the timing.
+        inner = self.inner
+
+        def inner_with_gc(it, timer):
+            gc.enable()
+            return inner(it, timer)
+
+        self.inner = inner_with_gc
+        try:
+            return super().timeit(number)
+        finally:
+            self.inner = inner
+
+    def measure(self, loops=None, repeat=7):
+        '''
+        Measure the statement ``repeat`` times.  If ``loops`` is not given,
+        it is calibrated so that each run takes at least 0.2 seconds.
+        '''
+        if loops is None:
+            loops = 1
+            while True:
+                elapsed = self.timeit(loops)
+                if elapsed >= CALIBRATION_TIME:
+                    break
+                # Jump close to the target, but by at most 10 times per step.
+                estimate = CALIBRATION_TIME / max(elapsed, 1e-9) * loops
+                loops = int(min(max(estimate * 1.1, loops * 2), loops * 10))
+        timings = self.repeat(repeat, loops)
+        return TimeitResult(loops, timings, self.gc_enabled)
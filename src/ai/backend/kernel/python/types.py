@@ -1,28 +1,82 @@
-from namedlist import namedtuple, FACTORY
+class _Record:
+    '''
+    A lightweight base for output records.
 
+    Records are created for every console write and media output, so they use
+    ``__slots__`` instead of per-instance dicts while keeping the indexing and
+    unpacking behavior of tuples.
+    '''
 
-InputRequest = namedtuple('InputRequest', [
-    ('is_password', False),
-])
+    __slots__ = ()
 
-ControlRecord = namedtuple('ControlRecord', [
-    ('event', None),
-])
+    def __len__(self):
+        return len(self.__slots__)
 
-CompletionRecord = namedtuple('CompletionRecord', [
-    ('matches', FACTORY(list)),
-])
+    def __iter__(self):
+        return (getattr(self, name) for name in self.__slots__)
 
-ConsoleRecord = namedtuple('ConsoleRecord', [
-    ('target', 'stdout'),  # or 'stderr'
-    ('data', ''),
-])
+    def __getitem__(self, index):
+        return tuple(self)[index]
 
-MediaRecord = namedtuple('MediaRecord', [
-    ('type', None),  # mime-type
-    ('data', None),
-])
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return tuple(self) == tuple(other)
 
-HTMLRecord = namedtuple('HTMLRecord', [
-    ('html', None),  # raw HTML string
-])
+    def __hash__(self):
+        return hash((type(self), tuple(self)))
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}'
+                           for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+
+class InputRequest(_Record):
+
+    __slots__ = ('is_password', )
+
+    def __init__(self, is_password=False):
+        self.is_password = is_password
+
+
+class ControlRecord(_Record):
+
+    __slots__ = ('event', )
+
+    def __init__(self, event=None):
+        self.event = event
+
+
+class CompletionRecord(_Record):
+
+    __slots__ = ('matches', )
+
+    def __init__(self, matches=None):
+        self.matches = [] if matches is None else matches
+
+
+class ConsoleRecord(_Record):
+
+    __slots__ = ('target', 'data')
+
+    def __init__(self, target='stdout', data=''):
+        self.target = target  # or 'stderr'
+        self.data = data
+
+
+class MediaRecord(_Record):
+
+    __slots__ = ('type', 'data')
+
+    def __init__(self, type=None, data=None):
+        self.type = type  # mime-type
+        self.data = data
+
+
+class HTMLRecord(_Record):
+
+    __slots__ = ('html', )
+
+    def __init__(self, html=None):
+        self.html = html  # raw HTML string
@@ -0,0 +1,142 @@
+'''
+Summaries of the query-mode user namespace for the variable explorer (the
+"variables" op).
+
+Sizes are estimated cheaply by type-specific fast paths: ``nbytes`` of
+arrays, ``memory_usage()`` of pandas objects, and the deep size of
+containers extrapolated from a sample of their items.  The summary of each
+variable is cached until its version (see :class:`.cells.CellTracker`)
+changes, so repeated inspections of namespaces with large objects are cheap.
+'''
+
+from collections import deque
+import itertools
+import sys
+import types
+
+CONTAINER_TYPES = (list, tuple, set, frozenset, dict, deque)
+HIDDEN_TYPES = (types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+                type)
+
+
+def _sample(container, sample_size):
+    # Returns the sampled items (evenly spread for sequences).
+    if isinstance(container, (list, tuple)) and len(container) > sample_size:
+        step = len(container) // sample_size
+        return container[::step][:sample_size]
+    return list(itertools.islice(container, sample_size))
+
+
+def _estimate_pandas_size(obj, sample_size):
+    # memory_usage(deep=True) inspects every Python object in the object
+    # columns, so extrapolate their sizes from samples instead.
+    usage = obj.memory_usage(index=True)
+    size = int(usage.sum() if hasattr(usage, 'sum') else usage)
+    approx = False
+    columns = obj.items() if hasattr(obj, 'columns') else [(None, obj)]
+    for _, column in columns:
+        if column.dtype.hasobject and len(column):
+            step = max(1, len(column) // sample_size)
+            values = column.values[::step][:sample_size].tolist()
+            mean = sum(sys.getsizeof(v) for v in values) / len(values)
+            size += int(mean * len(column))
+            approx = True
+    return size, approx
+
+
+def estimate_size(obj, sample_size=100, depth=3):
+    '''
+    Returns the approximate deep size of the object in bytes and whether it
+    has been extrapolated from samples.
+    '''
+    if type(obj).__module__.startswith('pandas.') and \
+            callable(getattr(obj, 'memory_usage', None)):
+        return _estimate_pandas_size(obj, sample_size)
+    nbytes = getattr(obj, 'nbytes', None)
+    if isinstance(nbytes, int) and not isinstance(obj, type):
+        # NumPy arrays and alike
+        return nbytes, False
+    size = sys.getsizeof(obj)
+    if depth == 0 or isinstance(obj, (str, bytes, bytearray)):
+        return size, False
+    if isinstance(obj, CONTAINER_TYPES):
+        if not obj:
+            return size, False
+        if isinstance(obj, dict):
+            items = _sample(obj.items(), sample_size)
+            sizes = [estimate_size(k, max(1, sample_size // 4), depth - 1)[0] +
+                     estimate_size(v, max(1, sample_size // 4), depth - 1)[0]
+                     for k, v in items]
+        else:
+            items = _sample(obj, sample_size)
+            sizes = [estimate_size(item, max(1, sample_size // 4), depth - 1)[0]
+                     for item in items]
+        approx = len(items) < len(obj)
+        return size + int(sum(sizes) / len(items) * len(obj)), approx
+    attrs = getattr(obj, '__dict__', None)
+    if isinstance(attrs, dict):
+        attrs_size, approx = estimate_size(attrs, sample_size, depth - 1)
+        return size + attrs_size, approx
+    return size, False
+
+
+def summarize(name, obj, sample_size=100):
+    info = {
+        'name': name,
+        'type': type(obj).__qualname__,
+        'shape': None,
+        'dtype': None,
+    }
+    module = type(obj).__module__
+    if module not in ('builtins', '__main__'):
+        info['type'] = f'{module.partition(".")[0]}.{info["type"]}'
+    shape = getattr(obj, 'shape', None)
+    if isinstance(shape, tuple) and all(isinstance(n, int) for n in shape):
+        info['shape'] = list(shape)
+    elif hasattr(obj, '__len__') and not isinstance(obj, type):
+        try:
+            info['shape'] = [len(obj)]
+        except Exception:
+            pass
+    dtype = getattr(obj, 'dtype', None)
+    if dtype is not None:
+        info['dtype'] = str(dtype)
+    else:
+        dtypes = getattr(obj, 'dtypes', None)
+        if dtypes is not None and hasattr(dtypes, 'unique'):
+            unique = [str(t) for t in dtypes.unique()]
+            info['dtype'] = unique[0] if len(unique) == 1 else 'mixed'
+    try:
+        info['size'], info['approximate'] = estimate_size(obj, sample_size)
+    except Exception:
+        info['size'], info['approximate'] = sys.getsizeof(obj, 0), True
+    return info
+
+
+class VariableInspector:
+    '''
+    Summarizes the user variables, caching the results by the versions of
+    the names.  Modules, functions, classes, and the names starting with an
+    underscore are omitted.
+    '''
+
+    def __init__(self, sample_size=100):
+        self.sample_size = sample_size
+        self._cache = {}
+
+    def inspect(self, namespace, versions):
+        cache = {}
+        results = []
+        for name, obj in sorted(list(namespace.items())):
+            if name.startswith('_') or isinstance(obj, HIDDEN_TYPES):
+                continue
+            key = (versions.get(name), id(obj))
+            cached = self._cache.get(name)
+            if cached is not None and cached[0] == key and key[0] is not None:
+                info = cached[1]
+            else:
+                info = summarize(name, obj, self.sample_size)
+            cache[name] = (key, info)
+            results.append(info)
+        self._cache = cache
+        return results
@@ -0,0 +1,313 @@
+'''
+A fork-server ("zygote") for batch-mode Python executions.
+
+The zygote is a Python process of the user environment which imports a set of
+heavy modules (e.g., numpy and pandas) only once.  Each batch execution is
+served by forking the zygote, so the user program starts with those modules
+already imported.
+
+The server part runs as a script under the user's Python interpreter, so this
+module must depend only on the standard library.
+'''
+
+import array
+import asyncio
+import importlib
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import traceback
+
+_LEN = struct.Struct('I')
+_NUM_FDS = 3  # stdin, stdout, stderr
+
+# Modules which are known to break when used after fork() once they have
+# initialized their runtimes in the parent process.
+FORK_UNSAFE_MODULES = {
+    'tensorflow',
+    'torch.cuda',
+    'jax',
+}
+
+
+def _preload(modules):
+    preloaded = []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f'zygote: failed to preload {name}: {e!r}', file=sys.stderr)
+        else:
+            preloaded.append(name)
+    return preloaded
+
+
+def _check_fork_safety():
+    unsafe_modules = FORK_UNSAFE_MODULES & set(sys.modules)
+    if unsafe_modules:
+        return False, ('fork-unsafe modules are imported: ' +
+                       ', '.join(sorted(unsafe_modules)))
+    if threading.active_count() > 1:
+        return False, 'preloading has started background threads'
+    return True, None
+
+
+def _recv_request(conn):
+    fds = array.array('i')
+    msg, ancdata, _, _ = conn.recvmsg(
+        65536, socket.CMSG_LEN(_NUM_FDS * fds.itemsize))
+    for level, type_, data in ancdata:
+        if level == socket.SOL_SOCKET and type_ == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+    while len(msg) < _LEN.size:
+        msg += conn.recv(65536)
+    size = _LEN.unpack_from(msg)[0]
+    body = msg[_LEN.size:]
+    while len(body) < size:
+        chunk = conn.recv(65536)
+        if not chunk:
+            raise EOFError
+        body += chunk
+    return json.loads(body.decode('utf8')), list(fds)
+
+
+def _run_child(request, fds):
+    # This function never returns.
+    try:
+        # in its own process group as other children of the kernel runner
+        os.setsid()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+        for fd in fds:
+            if fd > 2:
+                os.close(fd)
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        script = request['argv'][1]
+        sys.argv = request['argv'][1:]
+        sys.path[0] = os.path.dirname(os.path.abspath(script))
+    except BaseException:
+        traceback.print_exc()
+        os._exit(1)
+    code = 0
+    try:
+        import runpy
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def _handle(conn):
+    request, fds = _recv_request(conn)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        conn.close()
+        _run_child(request, fds)
+    for fd in fds:
+        os.close(fd)
+    conn.sendall(json.dumps({'pid': pid}).encode('utf8') + b'\n')
+    _, status = os.waitpid(pid, 0)
+    if os.WIFSIGNALED(status):
+        returncode = -os.WTERMSIG(status)
+    else:
+        returncode = os.WEXITSTATUS(status)
+    conn.sendall(json.dumps({'returncode': returncode}).encode('utf8') + b'\n')
+
+
+def serve(sock_path, modules):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    preloaded = _preload(modules)
+    fork_safe, reason = _check_fork_safety()
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(sock_path)
+    listener.listen(1)
+    print(json.dumps({
+        'fork_safe': fork_safe,
+        'reason': reason,
+        'preloaded': preloaded,
+    }), flush=True)
+    if not fork_safe:
+        return
+    stdin_fd = sys.stdin.fileno()
+    while True:
+        readable, _, _ = select.select([listener, stdin_fd], [], [])
+        if stdin_fd in readable and not os.read(stdin_fd, 4096):
+            # The kernel runner has closed our stdin.
+            break
+        if listener in readable:
+            conn, _ = listener.accept()
+            try:
+                _handle(conn)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                conn.close()
+
+
+class ZygoteProcess:
+    '''
+    A process handle for a program forked from the zygote, which provides
+    the subset of the asyncio.subprocess.Process interface used by
+    BaseRunner.
+    '''
+
+    def __init__(self, pid, reader, writer, stdout, stderr):
+        self.pid = pid
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = None
+        self._reader = reader
+        self._writer = writer
+
+    def send_signal(self, sig):
+        if self.returncode is None:
+            os.kill(self.pid, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    async def wait(self):
+        if self.returncode is None:
+            line = await self._reader.readline()
+            try:
+                self.returncode = json.loads(line)['returncode']
+            except ValueError:
+                # The zygote has died.
+                self.returncode = -1
+            finally:
+                self._writer.close()
+        return self.returncode
+
+
+class PythonZygote:
+    '''
+    Manages a zygote process from the kernel runner.
+    '''
+
+    def __init__(self, python_cmd, modules, env, *, loop=None):
+        self.python_cmd = python_cmd
+        self.modules = modules
+        self.env = env
+        self.loop = loop
+        self.proc = None
+        self.ready = False
+        self.sock_path = None
+        self.reason = None
+
+    async def start(self, timeout=120.0):
+        self.sock_path = os.path.join(tempfile.mkdtemp(prefix='bai-zygote-'),
+                                      'zygote.sock')
+        try:
+            self.proc = await asyncio.create_subprocess_exec(
+                self.python_cmd, os.path.abspath(__file__),
+                self.sock_path, *self.modules,
+                env=self.env,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+            )
+        except OSError as e:
+            self.reason = f'the zygote could not be spawned ({e!r})'
+            await self.close()
+            return False
+        try:
+            line = await asyncio.wait_for(self.proc.stdout.readline(), timeout)
+            info = json.loads(line)
+        except (asyncio.TimeoutError, ValueError):
+            self.reason = 'the zygote did not start'
+            await self.close()
+            return False
+        if not info['fork_safe']:
+            self.reason = info['reason']
+            await self.close()
+            return False
+        self.ready = True
+        return True
+
+    async def spawn(self, argv, env, cwd):
+        '''
+        Fork a new program from the zygote.
+        '''
+        loop = self.loop or asyncio.get_event_loop()
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        null_fd = os.open(os.devnull, os.O_RDONLY)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.sock_path)
+            body = json.dumps({'argv': argv, 'env': env, 'cwd': cwd}).encode('utf8')
+            fds = array.array('i', [null_fd, out_w, err_w])
+            sock.sendmsg([_LEN.pack(len(body)) + body],
+                         [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+        except OSError:
+            sock.close()
+            for fd in (out_r, err_r):
+                os.close(fd)
+            raise
+        finally:
+            for fd in (null_fd, out_w, err_w):
+                os.close(fd)
+        sock.setblocking(False)
+        reader, writer = await asyncio.open_unix_connection(sock=sock, loop=loop)
+        stdout = await self._connect_pipe(loop, out_r)
+        stderr = await self._connect_pipe(loop, err_r)
+        line = await reader.readline()
+        pid = json.loads(line)['pid']
+        return ZygoteProcess(pid, reader, writer, stdout, stderr)
+
+    @staticmethod
+    async def _connect_pipe(loop, fd):
+        reader = asyncio.StreamReader(loop=loop)
+        protocol = asyncio.StreamReaderProtocol(reader, loop=loop)
+        await loop.connect_read_pipe(lambda: protocol, os.fdopen(fd, 'rb', 0))
+        return reader
+
+    async def close(self):
+        self.ready = False
+        if self.proc is not None and self.proc.returncode is None:
+            self.proc.stdin.close()
+            try:
+                await asyncio.wait_for(self.proc.wait(), 2.0)
+            except asyncio.TimeoutError:
+                self.proc.kill()
+                await self.proc.wait()
+        self.proc = None
+        if self.sock_path is not None:
+            try:
+                os.unlink(self.sock_path)
+                os.rmdir(os.path.dirname(self.sock_path))
+            except OSError:
+                pass
+            self.sock_path = None
+
+
+if __name__ == '__main__':
+    serve(sys.argv[1], sys.argv[2:])
@@ -4,6 +4,7 @@ from pathlib import Path
 import tempfile
 
 from .. import BaseRunner
+from ..utils import scratch_dir
 
 log = logging.getLogger()
 
@@ -35,17 +36,18 @@ class Runner(BaseRunner):
 
     async def execute_heuristic(self):
         if Path('main.R').is_file():
-            cmd = 'Rscript main.R'
+            cmd = ['Rscript', 'main.R']
             return await self.run_subproc(cmd)
         else:
             log.error('cannot find executable ("main.R").')
             return 127
 
     async def query(self, code_text):
-        with tempfile.NamedTemporaryFile(suffix='.R', dir='.') as tmpf:
+        with tempfile.NamedTemporaryFile(suffix='.R',
+                                         dir=scratch_dir()) as tmpf:
             tmpf.write(code_text.encode('utf8'))
             tmpf.flush()
-            cmd = f'Rscript {tmpf.name}'
+            cmd = ['Rscript', tmpf.name]
             return await self.run_subproc(cmd)
 
     async def complete(self, data):
@@ -0,0 +1,150 @@
+'''
+Probing of the resources available to the kernel container.
+
+The CPU count reported by the OS is that of the host, while the container
+may be limited by a CFS quota or a cpuset of its cgroup.  Numerical
+libraries (OpenMP, OpenBLAS, MKL, ...) and runtimes like Go size their
+thread pools by the host CPUs unless told otherwise, so a container limited
+to 2 CPUs on a 64-core host would spawn dozens of threads contending for
+two CPUs.  :func:`thread_env` gives the environment variables sizing them
+by the CPUs actually available.
+'''
+
+import math
+import os
+from pathlib import Path
+
+__all__ = (
+    'ResourceLimits',
+    'cgroup_cpu_quota',
+    'cgroup_memory_limit',
+    'thread_env',
+)
+
+CGROUP_ROOT = Path('/sys/fs/cgroup')
+UNLIMITED = 2**62  # cgroup v1 reports unlimited as a huge page-aligned value
+
+# the variables limiting the thread pools of numerical libraries and runtimes
+THREAD_COUNT_VARS = (
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+    'GOMAXPROCS',
+)
+
+
+def _read(path):
+    try:
+        return Path(path).read_text().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_quota(root=CGROUP_ROOT):
+    '''
+    Returns the CPU quota of the container's cgroup as the number of CPUs
+    (possibly fractional), or None if unlimited or unknown.
+    '''
+    root = Path(root)
+    value = _read(root / 'cpu.max')  # cgroup v2
+    if value is not None:
+        quota, _, period = value.partition(' ')
+        if quota == 'max':
+            return None
+    else:
+        for subsys in ('cpu', 'cpu,cpuacct'):
+            quota = _read(root / subsys / 'cpu.cfs_quota_us')
+            period = _read(root / subsys / 'cpu.cfs_period_us')
+            if quota is not None and period is not None:
+                break
+        else:
+            return None
+    try:
+        quota, period = int(quota), int(period)
+    except ValueError:
+        return None
+    if quota <= 0 or period <= 0:  # -1 means unlimited in cgroup v1
+        return None
+    return quota / period
+
+
+def cgroup_memory_limit(root=CGROUP_ROOT):
+    '''
+    Returns the memory limit of the container's cgroup in bytes, or None if
+    unlimited or unknown.
+    '''
+    root = Path(root)
+    for path in (root / 'memory.max', root / 'memory' / 'memory.limit_in_bytes'):
+        value = _read(path)
+        if value is None:
+            continue
+        if value == 'max':
+            return None
+        try:
+            limit = int(value)
+        except ValueError:
+            return None
+        return limit if limit < UNLIMITED else None
+    return None
+
+
+def _affinity_cpus():
+    # The affinity mask reflects the cpuset of the cgroup.
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+class ResourceLimits:
+    '''
+    The CPU and memory limits of the container.  :attr:`cpus` is the number
+    of CPUs usable at once, i.e., the size of the cpuset capped by the CPU
+    quota (rounded up).
+    '''
+
+    def __init__(self, cpuset_size, cpu_quota=None, memory_limit=None):
+        self.cpuset_size = cpuset_size
+        self.cpu_quota = cpu_quota
+        self.memory_limit = memory_limit
+        self.cpus = cpuset_size
+        if cpu_quota is not None:
+            self.cpus = max(1, min(cpuset_size, math.ceil(cpu_quota)))
+
+    @classmethod
+    def probe(cls, root=CGROUP_ROOT):
+        return cls(_affinity_cpus(), cgroup_cpu_quota(root),
+                   cgroup_memory_limit(root))
+
+    @property
+    def executor_workers(self):
+        # the default of ThreadPoolExecutor since Python 3.8, but by the
+        # CPUs of the container instead of the host
+        return min(32, self.cpus + 4)
+
+    def to_dict(self):
+        return {
+            'cpus': self.cpus,
+            'cpuset_size': self.cpuset_size,
+            'cpu_quota': self.cpu_quota,
+            'memory_limit': self.memory_limit,
+        }
+
+    def __repr__(self):
+        return (f'ResourceLimits(cpus={self.cpus}, '
+                f'cpuset_size={self.cpuset_size}, cpu_quota={self.cpu_quota}, '
+                f'memory_limit={self.memory_limit})')
+
+
+def thread_env(limits):
+    '''
+    Returns the environment variables sizing the thread pools and the malloc
+    arenas of child processes by the given resource limits.
+    '''
+    env = {name: str(limits.cpus) for name in THREAD_COUNT_VARS}
+    # glibc creates up to 8 malloc arenas per (host) CPU for threaded
+    # programs, which bloats their memory usage in small containers.
+    env['MALLOC_ARENA_MAX'] = str(max(2, limits.cpus))
+    return env
@@ -4,7 +4,7 @@ from pathlib import Path
 import tempfile
 
 from .. import BaseRunner
-from ..utils import find_executable
+from ..utils import find_executable, scratch_dir
 
 log = logging.getLogger()
 
@@ -32,9 +32,9 @@ class Runner(BaseRunner):
 
     async def build_heuristic(self) -> int:
         if Path('Cargo.toml').is_file():
-            return await self.run_subproc('cargo build')
+            return await self.run_subproc(['cargo', 'build'])
         elif Path('main.rs').is_file():
-            return await self.run_subproc('rustc -o main main.rs')
+            return await self.run_subproc(['rustc', '-o', 'main', 'main.rs'])
         else:
             log.error(
                 'cannot find the main/build file ("Cargo.toml" or "main.rs").')
@@ -43,19 +43,22 @@ class Runner(BaseRunner):
     async def execute_heuristic(self) -> int:
         out = find_executable('./target/debug', './target/release')
         if out is not None:
-            return await self.run_subproc(f'{out}')
+            return await self.run_subproc([str(out)])
         elif Path('./main').is_file():
-            return await self.run_subproc('./main')
+            return await self.run_subproc(['./main'])
         else:
             log.error('cannot find executable ("main" or target directories).')
             return 127
 
     async def query(self, code_text) -> int:
-        with tempfile.NamedTemporaryFile(suffix='.rs', dir='.') as tmpf:
-            tmpf.write(code_text.encode('utf8'))
-            tmpf.flush()
-            cmd = f'rustc -o main {tmpf.name} && ./main'
-            return await self.run_subproc(cmd)
+        with tempfile.TemporaryDirectory(dir=scratch_dir()) as tmpdir:
+            src = Path(tmpdir) / 'main.rs'
+            src.write_bytes(code_text.encode('utf8'))
+            binary = Path(tmpdir) / 'main'
+            ret = await self.run_subproc(['rustc', '-o', str(binary), str(src)])
+            if ret != 0:  # stop if rustc has failed
+                return ret
+            return await self.run_subproc([str(binary)])
 
     async def complete(self, data):
         return []
@@ -0,0 +1,170 @@
+'''
+Scheduling policies (CPU affinity, nice and ionice levels) of the child
+processes of each kind, so that builds and helper services do not compete
+on equal terms with the user's executions and queries.
+
+The policy of each kind is configured by the ``BACKENDAI_SCHED_<KIND>``
+environment variable as space-separated settings, e.g.,
+``"cpus=0-1,3 nice=10 ionice=be:7"``.  An empty value disables it.
+All settings are applied on a best-effort basis: raising the priority
+above the kernel runner's own or pinning to CPUs outside the container's
+cpuset is silently skipped.
+
+The policies are applied to the child processes right after spawning them
+rather than by a ``preexec_fn``, which is unsafe in the multi-threaded kernel
+runner and disables the fast spawn paths of the subprocess module.
+'''
+
+import ctypes
+import logging
+import os
+import platform
+
+from .logging import BraceStyleAdapter
+from .procgroup import group_members
+
+log = BraceStyleAdapter(logging.getLogger())
+
+__all__ = (
+    'SCHED_KINDS',
+    'SchedPolicy',
+)
+
+SCHED_KINDS = ('build', 'exec', 'query', 'service')
+DEFAULT_POLICIES = {
+    'build': 'nice=10 ionice=be:7',
+    'service': 'nice=5',
+}
+
+IOPRIO_CLASSES = {'rt': 1, 'be': 2, 'idle': 3}
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_WHO_PGRP = 2
+_IOPRIO_SET_SYSCALLS = {
+    'x86_64': 251,
+    'i686': 289,
+    'aarch64': 30,
+    'armv7l': 314,
+    'ppc64le': 273,
+    's390x': 282,
+}
+
+try:
+    _libc = ctypes.CDLL(None, use_errno=True)
+except OSError:
+    _libc = None
+
+
+def _parse_cpus(text):
+    cpus = set()
+    for item in text.split(','):
+        first, _, last = item.partition('-')
+        cpus.update(range(int(first), int(last or first) + 1))
+    return frozenset(cpus)
+
+
+def _format_cpus(cpus):
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(f'{a}' if a == b else f'{a}-{b}' for a, b in ranges)
+
+
+class SchedPolicy:
+    '''
+    The CPU affinity (a set of CPU numbers), the nice level, and the I/O
+    scheduling class and level (a pair like ``('be', 7)``) of processes.
+    The unset (None) ones are inherited from the kernel runner.
+    '''
+
+    def __init__(self, *, cpus=None, nice=None, ionice=None):
+        self.cpus = cpus
+        self.nice = nice
+        self.ionice = ionice
+        self._ioprio_syscall = _IOPRIO_SET_SYSCALLS.get(platform.machine())
+
+    @classmethod
+    def parse(cls, text):
+        kwargs = {}
+        for item in text.split():
+            key, _, value = item.partition('=')
+            if key == 'cpus':
+                kwargs['cpus'] = _parse_cpus(value)
+            elif key == 'nice':
+                kwargs['nice'] = int(value)
+            elif key == 'ionice':
+                ioclass, _, level = value.partition(':')
+                if ioclass not in IOPRIO_CLASSES:
+                    raise ValueError(f'Unknown I/O scheduling class: {ioclass}')
+                kwargs['ionice'] = (ioclass, int(level or 0))
+            else:
+                raise ValueError(f'Unknown scheduling setting: {key}')
+        return cls(**kwargs)
+
+    @classmethod
+    def from_env(cls, kind):
+        text = os.environ.get(f'BACKENDAI_SCHED_{kind.upper()}',
+                              DEFAULT_POLICIES.get(kind, ''))
+        try:
+            return cls.parse(text)
+        except ValueError:
+            log.warning('ignoring invalid scheduling policy for {0}: {1!r}',
+                        kind, text)
+            return cls()
+
+    def __bool__(self):
+        return not (self.cpus is None and self.nice is None and
+                    self.ionice is None)
+
+    def __str__(self):
+        items = []
+        if self.cpus is not None:
+            items.append(f'cpus={_format_cpus(self.cpus)}')
+        if self.nice is not None:
+            items.append(f'nice={self.nice}')
+        if self.ionice is not None:
+            items.append(f'ionice={self.ionice[0]}:{self.ionice[1]}')
+        return ' '.join(items)
+
+    def to_dict(self):
+        return {
+            'cpus': sorted(self.cpus) if self.cpus is not None else None,
+            'nice': self.nice,
+            'ionice': '{0}:{1}'.format(*self.ionice) if self.ionice else None,
+        }
+
+    def apply(self, pid=0, *, group=False):
+        '''
+        Apply the policy to the given process (0 for the current one).
+        If ``group`` is set, ``pid`` is a process group leader and the policy
+        is applied to the whole group, covering the processes it has already
+        spawned (e.g., by a shell) before the policy is applied.
+        '''
+        if self.cpus is not None:
+            pids = [pid]
+            if group:
+                pids.extend(member for member, _ in group_members(pid)
+                            if member != pid)
+            for target in pids:
+                try:
+                    cpus = self.cpus & os.sched_getaffinity(target)
+                    if cpus:
+                        os.sched_setaffinity(target, cpus)
+                except OSError:
+                    pass
+        if self.nice is not None:
+            try:
+                os.setpriority(os.PRIO_PGRP if group else os.PRIO_PROCESS,
+                               pid, self.nice)
+            except OSError:
+                pass
+        if (self.ionice is not None and _libc is not None and
+                self._ioprio_syscall is not None):
+            ioclass, level = self.ionice
+            ioprio = (IOPRIO_CLASSES[ioclass] << IOPRIO_CLASS_SHIFT) | level
+            _libc.syscall(self._ioprio_syscall,
+                          IOPRIO_WHO_PGRP if group else IOPRIO_WHO_PROCESS,
+                          pid, ioprio)
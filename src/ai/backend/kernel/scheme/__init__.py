@@ -2,6 +2,7 @@ import logging
 import tempfile
 
 from .. import BaseRunner
+from ..utils import scratch_dir
 
 log = logging.getLogger()
 
@@ -33,7 +34,8 @@ class Runner(BaseRunner):
         pass
 
     async def query(self, code_text) -> int:
-        with tempfile.NamedTemporaryFile(suffix='.scm', dir='.') as tmpf:
+        with tempfile.NamedTemporaryFile(suffix='.scm',
+                                         dir=scratch_dir()) as tmpf:
             tmpf.write(code_text.encode('utf8'))
             tmpf.flush()
             cmd = f'scheme --quiet < {tmpf.name}'
@@ -16,7 +16,7 @@ import zmq, zmq.asyncio
 
 from .compat import current_loop
 from .logging import BraceStyleAdapter
-from .utils import safe_close_task
+from .utils import read_fd, safe_close_task, write_fd
 
 log = BraceStyleAdapter(logging.getLogger())
 
@@ -126,22 +126,9 @@ class Terminal:
                 self.sock_term_out = self.zctx.socket(zmq.PUB)
                 self.sock_term_out.bind('tcp://*:2003')
 
-            term_reader = asyncio.StreamReader()
-            term_read_protocol = asyncio.StreamReaderProtocol(term_reader)
-            await self.loop.connect_read_pipe(
-                lambda: term_read_protocol, os.fdopen(self.fd, 'rb'))
-
-            _reader_factory = lambda: asyncio.StreamReaderProtocol(
-                asyncio.StreamReader())
-            term_writer_transport, term_writer_protocol = \
-                await self.loop.connect_write_pipe(_reader_factory,
-                                                   os.fdopen(self.fd, 'wb'))
-            term_writer = asyncio.StreamWriter(term_writer_transport,
-                                               term_writer_protocol,
-                                               None, self.loop)
-
-            self.term_in_task = self.loop.create_task(self.term_in(term_writer))
-            self.term_out_task = self.loop.create_task(self.term_out(term_reader))  # noqa
+            os.set_blocking(fd, False)
+            self.term_in_task = self.loop.create_task(self.term_in(fd))
+            self.term_out_task = self.loop.create_task(self.term_out(fd))
             self.accept_term_input = True
             await asyncio.sleep(0)
 
@@ -157,7 +144,7 @@ class Terminal:
         except Exception:
             log.exception('Unexpected error during restart of terminal')
 
-    async def term_in(self, term_writer):
+    async def term_in(self, fd):
         try:
             while True:
                 data = await self.sock_term_in.recv_multipart()
@@ -165,8 +152,7 @@ class Terminal:
                     break
                 if self.accept_term_input:
                     try:
-                        term_writer.write(data[0])
-                        await term_writer.drain()
+                        await write_fd(self.loop, fd, data[0])
                     except IOError:
                         break
         except asyncio.CancelledError:
@@ -174,19 +160,17 @@ class Terminal:
         except Exception:
             log.exception('Unexpected error at term_in()')
 
-    async def term_out(self, term_reader):
+    async def term_out(self, fd):
         try:
-            while not term_reader.at_eof():
+            while True:
                 try:
-                    data = await term_reader.read(4096)
+                    data = await read_fd(self.loop, fd, 4096)
                 except IOError:
-                    # In docker containers, this path is taken.
                     break
                 if not data:
-                    # In macOS, this path is taken.
                     break
                 await self.sock_term_out.send_multipart([data])
-            self.fd = None
+            self._close_fd()
             if not self.auto_restart:
                 await self.sock_term_out.send_multipart([b'Terminated.\r\n'])
                 return
@@ -197,6 +181,11 @@ class Terminal:
         except Exception:
             log.exception('Unexpected error at term_out()')
 
+    def _close_fd(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
     async def shutdown(self):
         self.term_in_task.cancel()
         self.term_out_task.cancel()
@@ -209,4 +198,4 @@ class Terminal:
         await asyncio.sleep(0)
         os.waitpid(self.pid, 0)
         self.pid = None
-        self.fd = None
+        self._close_fd()
@@ -1,12 +1,28 @@
 import asyncio
+import errno
+import os
 from pathlib import Path
+import pty
+import tempfile
+import termios
 
 from async_timeout import timeout
 
+from .compat import current_loop
+
+# the size limit of a single command-line argument on Linux (MAX_ARG_STRLEN)
+MAX_ARG_SIZE = 128 * 1024
+
 __all__ = (
+    'MAX_ARG_SIZE',
+    'FdReader',
     'find_executable',
+    'open_pty',
+    'read_fd',
     'safe_close_task',
+    'scratch_dir',
     'wait_local_port_open',
+    'write_fd',
 )
 
 
@@ -25,6 +41,31 @@ def find_executable(*paths):
     return None
 
 
+def _is_usable_scratch_dir(path):
+    try:
+        st = os.statvfs(path)
+    except OSError:
+        return False
+    # Compiled query binaries are executed from it.
+    if st.f_flag & (os.ST_RDONLY | os.ST_NOEXEC):
+        return False
+    return os.access(path, os.W_OK | os.X_OK)
+
+
+def scratch_dir():
+    '''
+    Returns the directory to keep the transient files of queries (sources
+    and binaries), preferring the memory-backed /dev/shm to the workspace
+    and the temp directory which may be on a network or overlay volume.
+    It is overridden by the ``BACKENDAI_SCRATCH_DIR`` environment variable.
+    /dev/shm is skipped if mounted with noexec as Docker does by default.
+    '''
+    for path in (os.environ.get('BACKENDAI_SCRATCH_DIR'), '/dev/shm'):
+        if path and _is_usable_scratch_dir(path):
+            return path
+    return tempfile.gettempdir()
+
+
 async def safe_close_task(task):
     if task is not None and not task.done():
         task.cancel()
@@ -50,3 +91,85 @@ async def wait_local_port_open(port):
             if hasattr(writer, 'wait_closed'):
                 await writer.wait_closed()
             break
+
+
+def _wake_up(future):
+    if not future.done():
+        future.set_result(None)
+
+
+async def read_fd(loop, fd, size):
+    '''
+    Read up to ``size`` bytes from a non-blocking file descriptor, waiting
+    until it becomes readable.  Returns an empty bytes at EOF (including
+    EIO from a pty master whose slave side has been closed).
+
+    Unlike ``loop.connect_read_pipe()``, it works with pty file descriptors
+    on both the default asyncio loop and uvloop.
+    '''
+    while True:
+        try:
+            return os.read(fd, size)
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            if e.errno == errno.EIO:
+                return b''
+            raise
+        readable = loop.create_future()
+        loop.add_reader(fd, _wake_up, readable)
+        try:
+            await readable
+        finally:
+            loop.remove_reader(fd)
+
+
+async def write_fd(loop, fd, data):
+    '''
+    Write all the data to a non-blocking file descriptor, waiting until it
+    becomes writable whenever its buffer is full.
+    '''
+    view = memoryview(data)
+    while view:
+        try:
+            written = os.write(fd, view)
+        except BlockingIOError:
+            writable = loop.create_future()
+            loop.add_writer(fd, _wake_up, writable)
+            try:
+                await writable
+            finally:
+                loop.remove_writer(fd)
+            continue
+        view = view[written:]
+
+
+class FdReader:
+    '''
+    A minimal stream reader of a non-blocking file descriptor (e.g., a pty
+    master) that can be passed to :func:`.base.pipe_output`.
+    '''
+
+    def __init__(self, fd, *, loop=None):
+        self.fd = fd
+        self.loop = loop if loop else current_loop()
+
+    async def read(self, n=-1):
+        return await read_fd(self.loop, self.fd, n if n > 0 else 65536)
+
+
+def open_pty():
+    '''
+    Open a pty pair for the output of a child process and return the
+    non-blocking master and the slave file descriptors.
+
+    The output post-processing (e.g., "\\n" to "\\r\\n") of the line
+    discipline is turned off so that the master reads exactly the bytes
+    written to the slave.
+    '''
+    master, slave = pty.openpty()
+    attrs = termios.tcgetattr(slave)
+    attrs[1] &= ~termios.OPOST
+    termios.tcsetattr(slave, termios.TCSANOW, attrs)
+    os.set_blocking(master, False)
+    return master, slave
@@ -1,14 +1,18 @@
 import asyncio
 import json
+import os
 import signal
+import sys
 import time
 from unittest.mock import call
 
 import asynctest
+import msgpack
 import pytest
 import zmq, zmq.asyncio
 
 from ai.backend.kernel.base import pipe_output
+from ai.backend.kernel.sched import SchedPolicy
 from ai.backend.kernel.test_utils import MockableZMQAsyncSock
 
 
@@ -58,6 +62,46 @@ class TestPipeOutput:
         assert type.decode('ascii').rstrip() == 'stderr'
         assert data.decode('utf-8').rstrip() == 'stderr...'
 
+    @pytest.mark.asyncio
+    async def test_pipe_output_compacts_progress(self, sockets):
+        proc = await asyncio.create_subprocess_shell(
+            'for i in $(seq 1 200); do printf "\\r%3d%%" $i; done; echo',
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        outsock, observer = sockets
+        await pipe_output(proc.stdout, outsock, 'stdout', compact=True)
+        await proc.wait()
+
+        output = b''
+        while output.count(b'\n') == 0:
+            _, data = await observer.recv_multipart()
+            output += data
+        assert output.endswith(b'200%\n')
+        assert output.count(b'%') < 200
+
+    @pytest.mark.asyncio
+    async def test_pipe_output_keeps_raw_bytes(self, sockets):
+        data = bytes(range(256)) * 4
+        proc = await asyncio.create_subprocess_exec(
+            'cat',
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        outsock, observer = sockets
+        pipe_task = asyncio.ensure_future(
+            pipe_output(proc.stdout, outsock, 'stdout'))
+        proc.stdin.write(data)
+        proc.stdin.close()
+        await pipe_task
+        await proc.wait()
+
+        output = b''
+        while len(output) < len(data):
+            _, chunk = await observer.recv_multipart()
+            output += chunk
+        assert output == data
+
     @pytest.mark.asyncio
     async def test_pipe_output_rejects_invalid_target(self, sockets):
         proc = await asyncio.create_subprocess_shell(
@@ -74,6 +118,34 @@ class TestPipeOutput:
 
 class TestBaseRunner:
 
+    def test_thread_env(self, base_runner, mocker):
+        mocker.patch.dict(os.environ, {'OMP_NUM_THREADS': '7'})
+        os.environ.pop('MKL_NUM_THREADS', None)
+        runner = type(base_runner)()
+        cpus = str(runner.resources.cpus)
+        assert runner.child_env['MKL_NUM_THREADS'] == cpus
+        assert os.environ['MKL_NUM_THREADS'] == cpus
+        # user-set variables are kept.
+        assert 'OMP_NUM_THREADS' not in runner.child_env
+        assert os.environ['OMP_NUM_THREADS'] == '7'
+
+    @pytest.mark.asyncio
+    async def test_build_sched_policy(self, base_runner):
+        base_runner.outsock = MockableZMQAsyncSock.create_mock()
+        nice = os.nice(0) + 2
+        base_runner.sched_policies['build'] = SchedPolicy(nice=nice)
+        cmd = f'{sys.executable} -c "import os; print(os.nice(0))"'
+        await base_runner._build(cmd)
+        base_runner.outsock.send_multipart.assert_any_call(
+            [b'stdout', f'{nice}\n'.encode()])
+
+        await base_runner._send_status()
+        _, status = base_runner.outsock.send_multipart.call_args[0][0]
+        policies = msgpack.unpackb(status, raw=False)['sched_policies']
+        assert policies['build']['nice'] == nice
+        assert 'event_loop' in msgpack.unpackb(status, raw=False)
+        assert set(policies) == {'build', 'exec', 'query', 'service'}
+
     @pytest.mark.asyncio
     async def test_skip_clean_without_cmd(self, base_runner):
         base_runner.run_subproc = asynctest.CoroutineMock()
@@ -239,6 +311,62 @@ class TestBaseRunner:
             call([b'stdout', b'testing...\n']),
         ], any_order=True)
 
+    @pytest.mark.asyncio
+    async def test_interrupt_subproc_group(self, base_runner, event_loop):
+        base_runner.outsock = MockableZMQAsyncSock.create_mock()
+        base_runner.interrupt_grace = (0.2, 0.2)
+        # The background job ignores SIGINT and keeps the output pipes open.
+        task = event_loop.create_task(
+            base_runner.run_subproc('sleep 30 & sleep 30'))
+        await asyncio.sleep(0.3)
+        begin = time.monotonic()
+        await base_runner._interrupt()
+        assert await asyncio.wait_for(task, 5) != 0
+        assert time.monotonic() - begin < 2
+
+    @pytest.mark.asyncio
+    async def test_run_subproc_argv(self, base_runner):
+        base_runner.outsock = MockableZMQAsyncSock.create_mock()
+        assert await base_runner.run_subproc(['echo', 'a  b', '$HOME']) == 0
+        base_runner.outsock.send_multipart.assert_has_awaits([
+            call([b'stdout', b'a  b $HOME\n']),
+        ])
+        ret = await base_runner.run_subproc(['no-such-command'])
+        assert ret == 127
+        base_runner.outsock.send_multipart.assert_any_call(
+            [b'stderr', b'no-such-command: No such file or directory\n'])
+
+    @pytest.mark.asyncio
+    async def test_run_subproc_pty(self, base_runner):
+        base_runner.outsock = MockableZMQAsyncSock.create_mock()
+        # Python block-buffers its stdout unless it is a terminal.
+        cmd = (f'{sys.executable} -c "import sys, time; '
+               f'print(sys.stdout.isatty(), sys.stderr.isatty()); '
+               f'time.sleep(0.3); print(\'done\')"')
+        await base_runner.run_subproc(cmd)
+        base_runner.outsock.send_multipart.assert_has_awaits([
+            call([b'stdout', b'False False\ndone\n']),
+        ])
+
+        base_runner.outsock = MockableZMQAsyncSock.create_mock()
+        base_runner._sched_kind = 'query'
+        ret = await base_runner.run_subproc(cmd + ' && echo err >&2')
+        assert ret == 0
+        base_runner.outsock.send_multipart.assert_has_awaits([
+            call([b'stdout', b'True False\n']),
+            call([b'stdout', b'done\n']),
+        ])
+        base_runner.outsock.send_multipart.assert_has_awaits([
+            call([b'stderr', b'err\n']),
+        ])
+
+    @pytest.mark.asyncio
+    async def test_unsupported_stacks(self, base_runner):
+        base_runner.outsock = MockableZMQAsyncSock.create_mock()
+        await base_runner._send_stacks({})
+        base_runner.outsock.send_multipart.assert_called_once_with(
+            [b'stacks', b'{"threads": []}'])
+
     def test_run_tasks(self, base_runner, event_loop):
         async def fake_task():
             base_runner.task_done = True
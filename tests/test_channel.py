@@ -0,0 +1,81 @@
+import asyncio
+import queue
+import threading
+
+import pytest
+
+from ai.backend.kernel.channel import ThreadChannel, ChannelClosed
+
+
+@pytest.mark.asyncio
+async def test_channel_thread_to_loop(event_loop):
+    channel = ThreadChannel(loop=event_loop)
+    sentinel = object()
+
+    def producer():
+        for i in range(1000):
+            channel.sync_q.put(i)
+        channel.sync_q.put(sentinel)
+
+    thread = threading.Thread(target=producer)
+    thread.start()
+    received = []
+    done = False
+    while not done:
+        for item in await channel.async_q.get_batch():
+            if item is sentinel:
+                done = True
+                break
+            received.append(item)
+    thread.join()
+    assert received == list(range(1000))
+    assert channel.async_q.empty()
+
+
+@pytest.mark.asyncio
+async def test_channel_loop_to_thread(event_loop):
+    channel = ThreadChannel(loop=event_loop)
+    received = []
+
+    def consumer():
+        while True:
+            item = channel.sync_q.get()
+            if item is None:
+                break
+            received.append(item)
+
+    thread = threading.Thread(target=consumer)
+    thread.start()
+    for i in range(100):
+        await channel.async_q.put(i)
+        if i % 10 == 0:
+            await asyncio.sleep(0.001)
+    channel.async_q.put_nowait(None)
+    await event_loop.run_in_executor(None, thread.join)
+    assert received == list(range(100))
+
+
+@pytest.mark.asyncio
+async def test_channel_get_batch_limit(event_loop):
+    channel = ThreadChannel(loop=event_loop)
+    for i in range(5):
+        channel.put(i)
+    assert await channel.async_q.get_batch(max_items=2) == [0, 1]
+    assert await channel.async_q.get() == 2
+    assert await channel.async_q.get_batch() == [3, 4]
+    with pytest.raises(queue.Empty):
+        channel.async_q.get_nowait()
+    with pytest.raises(queue.Empty):
+        channel.sync_q.get(timeout=0.01)
+
+
+@pytest.mark.asyncio
+async def test_channel_close(event_loop):
+    channel = ThreadChannel(loop=event_loop)
+    waiter = event_loop.create_task(channel.async_q.get())
+    await asyncio.sleep(0)
+    channel.close()
+    with pytest.raises(ChannelClosed):
+        await waiter
+    with pytest.raises(ChannelClosed):
+        channel.put(1)
@@ -0,0 +1,80 @@
+from ai.backend.kernel.compactor import OutputCompactor
+
+
+def test_plain_lines_pass_through():
+    compactor = OutputCompactor()
+    assert compactor.feed(b'hello\nwor', 1.0) == b'hello\nwor'
+    assert compactor.feed(b'ld\n', 1.01) == b'ld\n'
+    assert compactor.feed('안녕\n'.encode('utf8'), 1.02) == '안녕\n'.encode('utf8')
+    assert not compactor.dirty
+    assert compactor.flush() == b''
+
+
+def test_progress_bar_is_throttled():
+    compactor = OutputCompactor(refresh_interval=0.1)
+    outputs = []
+    for i in range(101):
+        outputs.append(compactor.feed(b'\r%3d%%' % i, 1.0 + i * 0.0005))
+    # only the first state is sent within the refresh interval
+    assert b''.join(outputs) == b'  0%'
+    assert compactor.dirty
+    assert compactor.refresh(1.05) == b''
+    assert compactor.refresh(1.2) == b'\r100%'
+    assert not compactor.dirty
+    # the erased tail is cleared on the client as well.
+    assert compactor.feed(b'\rok\x1b[K\n', 1.21) == b'\rok\x1b[K\n'
+
+
+def test_overwrites_within_line():
+    compactor = OutputCompactor()
+    assert compactor.feed(b'long line here\rab\x1b[K', 1.0) == b'ab'
+    compactor = OutputCompactor()
+    # colors take no columns and are kept around the overwritten text.
+    output = compactor.feed(b'\x1b[31mred\x1b[0m\rR', 1.0)
+    assert output == b'\x1b[31mRed\x1b[0m\r\x1b[1C'
+    compactor = OutputCompactor()
+    # an escape sequence split across feeds
+    assert compactor.feed(b'abc\x1b', 1.0) == b'abc'
+    assert compactor.feed(b'[1Dd\n', 2.0) == b'\rabd\n'
+
+
+def test_repeated_lines():
+    compactor = OutputCompactor(min_repeats=3)
+    output = compactor.feed(b'x\n' * 10 + b'y\n', 1.0)
+    assert output == b'x\n(repeated 9 times)\ny\n'
+    output = compactor.feed(b'z\nz\nz\n', 1.1) + compactor.flush()
+    assert output == b'z\nz\nz\n'
+    # blank lines are not collapsed.
+    assert compactor.feed(b'\n\n\n', 1.2) == b'\n\n\n'
+
+
+def test_multiple_progress_bars():
+    compactor = OutputCompactor(refresh_interval=0.1)
+    output = b''
+    for i in range(50):
+        output += compactor.feed(b'\router %d\n\rinner %d\x1b[A' % (i // 10, i),
+                                 1.0 + i * 0.01)
+    output += compactor.flush()
+    assert output.count(b'inner') < 10
+    assert output.endswith(b'\router 4\ninner 41\x1b[1A\ninner 49\x1b[1A')
+
+
+def test_repeated_lines_are_not_held_back():
+    compactor = OutputCompactor(refresh_interval=0.1, min_repeats=3)
+    outputs = [compactor.feed(b'waiting\n', 1.0 + i * 0.01) for i in range(4)]
+    assert outputs == [b'waiting\n', b'', b'', b'']
+    assert compactor.dirty
+    assert compactor.refresh(1.05) == b''
+    assert compactor.refresh(1.2) == b'(repeated 3 times)\n'
+    assert not compactor.dirty
+    # a slow heartbeat is shown as-is within the refresh interval.
+    assert compactor.feed(b'waiting\n', 2.0) == b'waiting\n'
+    assert compactor.feed(b'waiting\n', 3.0) == b''
+    assert compactor.refresh(3.1) == b'waiting\n'
+
+
+def test_line_endings_are_kept():
+    compactor = OutputCompactor()
+    assert compactor.feed(b'a\r\nb\r\n', 1.0) == b'a\r\nb\r\n'
+    assert compactor.feed(b'c\r', 1.1) + compactor.feed(b'\nd\n', 1.2) == \
+        b'c\r\nd\n'
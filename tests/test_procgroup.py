@@ -0,0 +1,38 @@
+import asyncio
+import signal
+
+import pytest
+
+from ai.backend.kernel.procgroup import (
+    grace_periods_from_env, group_members, terminate_group,
+)
+
+
+async def spawn(cmd):
+    proc = await asyncio.create_subprocess_shell(cmd, start_new_session=True)
+    await asyncio.sleep(0.2)  # let it spawn the descendants
+    return proc
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('cmd, last_sig', [
+    ('sleep 30', signal.SIGINT),
+    # The background jobs of a non-interactive shell ignore SIGINT.
+    ('sleep 30 & sleep 30 & wait', signal.SIGTERM),
+    ('trap "" INT TERM; sleep 30 & sleep 30', signal.SIGKILL),
+])
+async def test_terminate_group(cmd, last_sig):
+    proc = await spawn(cmd)
+    assert group_members(proc.pid)
+    sig = await terminate_group(proc, (0.2, 0.2), poll_interval=0.01)
+    assert sig == last_sig
+    await proc.wait()
+    # Orphaned zombies may remain until the init process reaps them.
+    assert all(state == 'Z' for _, state in group_members(proc.pid))
+
+
+def test_grace_periods_from_env(monkeypatch):
+    monkeypatch.setenv('BACKENDAI_INTERRUPT_GRACE', '0.5,1')
+    assert grace_periods_from_env() == (0.5, 1.0)
+    monkeypatch.setenv('BACKENDAI_INTERRUPT_GRACE', '5')
+    assert grace_periods_from_env() == (2.0, 3.0)
@@ -0,0 +1,90 @@
+import queue
+
+from ai.backend.kernel.python.cells import analyze_cell, CellTracker
+from ai.backend.kernel.python.inproc import PythonInprocRunner
+
+
+def test_analyze_cell():
+    reads, writes = analyze_cell(
+        'import numpy as np, os.path\n'
+        'from math import pi\n'
+        'a = b + 1\n'
+        'c[0] = d\n'
+        'e.attr += 1\n'
+        'items.append(f)\n'
+        '@deco\n'
+        'def func(arg):\n'
+        '    local = arg + g\n'
+        '    return local\n'
+        'class K(Base):\n'
+        '    member = h\n')
+    assert reads >= {'b', 'c', 'd', 'e', 'items', 'f', 'deco', 'g', 'Base', 'h'}
+    assert 'local' not in writes and 'member' not in writes
+    assert writes == {'np', 'os', 'pi', 'a', 'c', 'e', 'items', 'func', 'K'}
+    assert analyze_cell('def f(:') is None
+
+
+def test_cell_tracker():
+    ns = {}
+    tracker = CellTracker(ns)
+
+    def run(code_text):
+        record = tracker.begin(code_text)
+        exec(code_text, ns)
+        tracker.end(record)
+        return record
+
+    cell_x = run('x = [1]')
+    cell_y = run('y = len(x)')
+    cell_inc = run('y = y + 1')
+    assert tracker.stale_cells() == []
+
+    # in-place mutations are tracked by explicit writes.
+    run('x.append(2)')
+    assert tracker.stale_cells() == [cell_y]
+    run('y = len(x)')
+    assert tracker.stale_cells() == [cell_inc]
+    assert not tracker.is_stale(cell_x)
+
+    # deleted names make their readers stale.
+    run('del x')
+    assert tracker.is_stale(cell_y)
+
+
+def _run_cell(runner, code_text):
+    runner.input_queue.put(code_text)
+    outputs = []
+    while True:
+        msg = runner.output_queue.get()
+        if msg is runner.sentinel:
+            return b''.join(data for _, data in outputs).decode('utf8')
+        outputs.append(msg)
+
+
+def test_rerun_stale():
+    runner = PythonInprocRunner(queue.Queue(), queue.Queue(), queue.Queue(),
+                                object())
+    runner.start()
+    _run_cell(runner, 'x = 1')
+    _run_cell(runner, 'y = x * 10')
+    _run_cell(runner, 'z = 5')
+    assert _run_cell(runner, 'print(y + z)') == '15\n'
+    _run_cell(runner, 'x = 2')
+
+    output = _run_cell(runner, '%rerun-stale')
+    assert output == ('[rerun-stale] y = x * 10\n'
+                      '[rerun-stale] print(y + z)\n'
+                      '25\n'
+                      '[rerun-stale] 2 cell(s) re-executed, '
+                      '3 cell(s) up to date.\n')
+    output = _run_cell(runner, '%rerun-stale')
+    assert output.endswith('0 cell(s) re-executed, 5 cell(s) up to date.\n')
+
+    # re-execution stops at the first failure.
+    _run_cell(runner, 'w = z + undefined_name')
+    _run_cell(runner, 'v = w')
+    output = _run_cell(runner, '%rerun-stale')
+    assert 'NameError' in output
+    assert output.endswith('[rerun-stale] stopped due to an error.\n')
+
+    assert 'not found' in _run_cell(runner, '%unknown-magic')
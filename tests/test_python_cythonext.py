@@ -0,0 +1,116 @@
+import ctypes
+import queue
+import threading
+import time
+
+import pytest
+
+from ai.backend.kernel.procgroup import group_members
+from ai.backend.kernel.python import cythonext
+from ai.backend.kernel.python.cythonext import (
+    CythonBuildError, build_module, module_name,
+)
+from ai.backend.kernel.python.inproc import PythonInprocRunner
+
+
+def _run_cell(runner, code_text):
+    runner.input_queue.put(code_text)
+    outputs = []
+    while True:
+        msg = runner.output_queue.get()
+        if msg is runner.sentinel:
+            return outputs
+        outputs.append(msg)
+
+
+def test_module_name():
+    name = module_name('x = 1', {'cplus': False}, '0.29')
+    assert name == module_name('x = 1', {'cplus': False}, '0.29')
+    assert name != module_name('x = 2', {'cplus': False}, '0.29')
+    assert name != module_name('x = 1', {'cplus': True}, '0.29')
+    assert name != module_name('x = 1', {'cplus': False}, '3.0')
+    assert name.isidentifier()
+
+
+def test_cython_magic(tmpdir):
+    pytest.importorskip('Cython')
+    runner = PythonInprocRunner(queue.Queue(), queue.Queue(), queue.Queue(),
+                                object())
+    runner.cython_cache_path = tmpdir / 'cython'
+    runner.start()
+    code = ('%%cython\n'
+            'def fib(int n):\n'
+            '    cdef int i, a = 0, b = 1\n'
+            '    for i in range(n):\n'
+            '        a, b = b, a + b\n'
+            '    return a\n'
+            'print("loaded")\n')
+    outputs = _run_cell(runner, code)
+    assert outputs == [[b'stdout', b'loaded\n']]
+    assert runner.user_ns['fib'](10) == 55
+    assert len(tmpdir.join('cython').listdir()) == 1
+
+    # An unchanged cell reuses the loaded module.
+    begin = time.perf_counter()
+    assert _run_cell(runner, code) == []
+    assert time.perf_counter() - begin < 0.5
+    _run_cell(runner, 'print(fib(20))')
+
+    outputs = _run_cell(runner, '%%cython\ndef broken(:\n    pass\n')
+    stderr = b''.join(data for target, data in outputs if target == b'stderr')
+    assert b'[cython] compilation failed' in stderr
+    assert len(tmpdir.join('cython').listdir()) == 1
+
+
+def test_cython_build_error(tmpdir):
+    pytest.importorskip('Cython')
+    with pytest.raises(CythonBuildError):
+        build_module('cdef int x = "str"\n', 'broken', {}, str(tmpdir))
+
+
+def test_cython_magic_without_cython(mocker):
+    mocker.patch.object(cythonext, 'cython_version', return_value=None)
+    runner = PythonInprocRunner(queue.Queue(), queue.Queue(), queue.Queue(),
+                                object())
+    runner.start()
+    outputs = _run_cell(runner, '%%cython\nx = 1\n')
+    assert outputs == [[b'stderr',
+                        b'UsageError: %%cython requires Cython '
+                        b'(pip install cython).\n']]
+
+
+def test_cython_build_interrupt(tmpdir, monkeypatch):
+    # a build spawning a long-running compiler
+    monkeypatch.setattr(cythonext, '_BUILD_SCRIPT',
+                        'import subprocess\nsubprocess.call(["sleep", "30"])')
+    pids = []
+    communicate = cythonext._communicate
+
+    def recording_communicate(proc):
+        pids.append(proc.pid)
+        return communicate(proc)
+
+    monkeypatch.setattr(cythonext, '_communicate', recording_communicate)
+    result = {}
+
+    def build():
+        try:
+            build_module('x = 1\n', 'slow', {}, str(tmpdir))
+        except KeyboardInterrupt:
+            result['interrupted'] = True
+
+    thread = threading.Thread(target=build)
+    thread.start()
+    time.sleep(0.3)
+    assert len(group_members(pids[0])) == 2
+    # as PythonInprocRunner.interrupt() does
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_long(thread.ident), ctypes.py_object(KeyboardInterrupt))
+    thread.join(5)
+    assert not thread.is_alive()
+    assert result == {'interrupted': True}
+    # Orphaned zombies may remain until the init process reaps them.
+    deadline = time.monotonic() + 2
+    while any(state != 'Z' for _, state in group_members(pids[0])):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
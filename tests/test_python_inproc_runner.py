@@ -1,9 +1,14 @@
 from io import BytesIO, UnsupportedOperation, SEEK_SET
+import queue
+import subprocess
 import sys
+import time
 
 import pytest
 
-from ai.backend.kernel.python.inproc import ConsoleOutput
+from ai.backend.kernel.python.inproc import (
+    ConsoleOutput, BufferedConsoleOutput, PythonInprocRunner,
+)
 from ai.backend.kernel.python.types import ConsoleRecord
 
 
@@ -88,3 +93,119 @@ def test_console_output_replacing_sys():
 
     out.close()
     err.close()
+
+
+def test_buffered_console_output():
+    records = []
+
+    def emit(rec):
+        assert isinstance(rec, ConsoleRecord)
+        records.append(rec)
+
+    stdout = BufferedConsoleOutput(emit, 'stdout',
+                                   buffer_size=16, flush_interval=60)
+
+    # small writes are batched until explicit flushes.
+    print('abc', file=stdout)
+    stdout.write('안녕')
+    assert len(records) == 0
+    stdout.flush()
+    assert len(records) == 1
+    assert records[0].target == 'stdout'
+    assert records[0].data == 'abc\n안녕'.encode('utf8')
+    stdout.flush()  # no-op when empty
+    assert len(records) == 1
+
+    # the buffer is flushed when it becomes full.
+    records.clear()
+    stdout.write(b'0123456789')
+    stdout.write(b'0123456789')
+    assert [r.data for r in records] == [b'0123456789']
+    stdout.flush()
+    assert [r.data for r in records] == [b'0123456789', b'0123456789']
+
+    # writes larger than the buffer are emitted as-is.
+    records.clear()
+    stdout.write(b'x' * 40)
+    assert [r.data for r in records] == [b'x' * 40]
+
+
+def test_buffered_console_output_flush_policies():
+    records = []
+    stdout = BufferedConsoleOutput(records.append, 'stdout', flush_interval=60)
+    stderr = BufferedConsoleOutput(records.append, 'stderr', flush_interval=60,
+                                   line_buffering=True)
+    stdout.sibling = stderr
+    stderr.sibling = stdout
+
+    # line buffering flushes at newlines.
+    stderr.write('partial')
+    assert len(records) == 0
+    stderr.write(' line\n')
+    assert [(r.target, r.data) for r in records] == [('stderr', b'partial line\n')]
+
+    # writing to the sibling console flushes the other one first.
+    records.clear()
+    stdout.write('out')
+    stderr.write('err\n')
+    assert [(r.target, r.data) for r in records] == [
+        ('stdout', b'out'),
+        ('stderr', b'err\n'),
+    ]
+
+    # expired buffers are picked up by periodic checks.
+    records.clear()
+    stdout.flush_interval = 0.01
+    stdout.write('late')
+    stdout.flush_if_expired()
+    time.sleep(0.02)
+    stdout.flush_if_expired()
+    assert [r.data for r in records] == [b'late']
+
+
+def test_buffered_console_output_compaction():
+    records = []
+    stdout = BufferedConsoleOutput(records.append, 'stdout', flush_interval=60,
+                                   refresh_interval=60)
+    # progress bars flushing after every update are throttled.
+    for i in range(100):
+        stdout.write(f'\r{i:3d}%')
+        stdout.flush()
+    assert [r.data for r in records] == [b'  0%']
+    # draining sends the latest state.
+    stdout.drain()
+    assert [r.data for r in records] == [b'  0%', b'\r 99%']
+    records.clear()
+    stdout.write('\n' + 'same\n' * 5)
+    stdout.drain()
+    assert b''.join(r.data for r in records) == b'\nsame\n(repeated 4 times)\n'
+
+    uncompacted = BufferedConsoleOutput(records.append, 'stdout', compact=False)
+    records.clear()
+    uncompacted.write('\r1\r2')
+    uncompacted.drain()
+    assert [r.data for r in records] == [b'\r1\r2']
+
+
+def test_inproc_runner_lazy_completer():
+    runner = PythonInprocRunner(queue.Queue(), queue.Queue(), queue.Queue(),
+                                object())
+    runner.user_ns['my_variable'] = 1
+    assert runner.complete({'line': 'my_v'}) == ['my_variable']
+    assert runner.complete({'line': 'pri'}) == ['print']
+
+
+def test_inproc_runner_lazy_features():
+    # The optional features should not slow down the runner startup.
+    script = (
+        'import sys\n'
+        'import ai.backend.kernel.python\n'
+        'print(" ".join(sorted(sys.modules)))\n'
+    )
+    modules = subprocess.run([sys.executable, '-c', script],
+                             stdout=subprocess.PIPE, check=True).stdout.split()
+    for name in ('pstats', 'cythonext', 'profiling', 'memprof', 'snapshot',
+                 'timing', 'variables', 'jobs', 'prewarm'):
+        if name != 'pstats':
+            name = 'ai.backend.kernel.python.' + name
+        assert name.encode() not in modules
@@ -0,0 +1,119 @@
+import asyncio
+import os
+
+import pytest
+
+from ai.backend.kernel.channel import ThreadChannel
+from ai.backend.kernel.python.isolated import (
+    IsolatedInprocRunner, SharedRingBuffer,
+)
+
+
+def test_shared_ring_buffer():
+    ring = SharedRingBuffer(64)
+    assert ring.read_frames() == []
+
+    written, was_empty = ring.write_chunk(b'hello')
+    assert (written, was_empty) == (5, True)
+    written, was_empty = ring.write_chunk(b'world!')
+    assert (written, was_empty) == (6, False)
+    assert ring.read_frames() == [b'hello', b'world!']
+
+    # frames wrapping around the end of the buffer
+    for i in range(10):
+        data = bytes([i]) * 20
+        assert ring.write_chunk(data)[0] == 20
+        assert ring.read_frames() == [data]
+
+    # frames larger than the free space are split into chunks.
+    data = bytes(range(200))
+    pos = 0
+    frames = []
+    while pos < len(data):
+        written, _ = ring.write_chunk(data[pos:])
+        assert written > 0
+        pos += written
+        frames.extend(ring.read_frames())
+    assert frames == [data]
+
+    # a full buffer rejects writes until drained.
+    while ring.write_chunk(b'x' * 8)[0] == 8:
+        pass
+    assert ring.write_chunk(b'x' * 100)[0] < 100
+    assert len(ring.read_frames()) > 0
+    assert ring.write_chunk(b'y')[0] == 1
+
+    # another process attaches to the ring by its file descriptor.
+    peer = SharedRingBuffer(fd=os.dup(ring.fd))
+    assert peer.capacity == 64
+    assert peer.read_frames()[-1] == b'y'
+    peer.close()
+    ring.close()
+
+
+BREAK_INSPECTION = '''
+import gc
+for _obj in gc.get_objects():
+    if type(_obj).__name__ == 'PythonInprocRunner':
+        _obj.inspect_variables = lambda: 1 / 0
+del gc, _obj
+'''
+
+
+async def _run_cell(runner, code_text, sentinel):
+    runner.input_queue.put(code_text)
+    outputs = []
+    while True:
+        for msg in await runner.output_queue.async_q.get_batch():
+            if msg is sentinel:
+                return outputs
+            outputs.append(msg)
+
+
+@pytest.mark.asyncio
+async def test_isolated_runner(event_loop):
+    sentinel = object()
+    runner = IsolatedInprocRunner(
+        ThreadChannel(loop=event_loop),
+        ThreadChannel(loop=event_loop),
+        ThreadChannel(loop=event_loop),
+        sentinel, loop=event_loop, interrupt_grace=0.5)
+    runner.start()
+    try:
+        outputs = await _run_cell(runner, 'x = 42\nprint(x)', sentinel)
+        assert outputs == [[b'stdout', b'42\n']]
+        assert 'x' in await runner.complete({'line': 'x'})
+        variables = await runner.inspect_variables()
+        assert [(v['name'], v['type']) for v in variables] == [('x', 'int')]
+
+        # A failing request is still answered and keeps the session alive.
+        await _run_cell(runner, BREAK_INSPECTION, sentinel)
+        assert await runner.inspect_variables() == []
+        assert 'x' in await runner.complete({'line': 'x'})
+        stacks = await runner.inspect_stacks(unknown=1)
+        assert len(stacks['threads']) == 1
+        assert await runner.inspect_stacks(duration='x') == {'threads': []}
+
+        # SIGINT interrupts a running cell while keeping the namespace.
+        event_loop.call_later(0.2, runner.interrupt)
+        outputs = await _run_cell(runner, 'import time\ntime.sleep(30)', sentinel)
+        assert outputs == [[b'stderr', b'Interrupted!\n']]
+
+        # A cell ignoring the interrupt is killed and the session restarts.
+        event_loop.call_later(0.2, runner.interrupt)
+        outputs = await _run_cell(
+            runner, 'import itertools\nsum(itertools.repeat(1, 10**12))',
+            sentinel)
+        assert b'did not respond to the interrupt' in outputs[0][1]
+        outputs = await _run_cell(runner, 'print(globals().get("x"))', sentinel)
+        assert outputs == [[b'stdout', b'None\n']]
+
+        # A crashed session is replaced by the warm spare.
+        pid = runner.active.pid
+        outputs = await _run_cell(runner, 'import os\nos._exit(3)', sentinel)
+        assert b'exited with code 3' in outputs[0][1]
+        outputs = await _run_cell(runner, 'import os\nprint(os.getpid())', sentinel)
+        assert int(outputs[0][1]) != pid
+    finally:
+        await runner.shutdown()
+    await asyncio.sleep(0)
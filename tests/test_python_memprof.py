@@ -0,0 +1,57 @@
+import queue
+
+from ai.backend.kernel.python.inproc import PythonInprocRunner
+from ai.backend.kernel.python.memprof import CellMemoryMonitor, format_size
+
+
+def test_cell_memory_monitor():
+    code_text = 'data = bytearray(32 * 2**20)\n'
+    ns = {}
+    with CellMemoryMonitor('tracemalloc', code_text=code_text,
+                           limit=2**40) as monitor:
+        exec(compile(code_text, '<input>', 'exec'), ns)
+    assert monitor.peak_rss - monitor.rss_before >= 32 * 2**20
+    assert monitor.rss_after - monitor.rss_before >= 32 * 2**20
+    assert monitor.traced_peak >= 32 * 2**20
+    report = monitor.format_report()
+    assert '<input>:1  data = bytearray(32 * 2**20)' in report
+    assert monitor.format_warning() is None
+
+    monitor.limit = monitor.rss_after
+    assert 'warning' in monitor.format_warning()
+
+    with CellMemoryMonitor('rss') as monitor:
+        del ns['data']
+    assert monitor.rss_after < monitor.rss_before
+    assert monitor.format_warning() is None
+    assert monitor.traced_peak is None
+
+
+def test_format_size():
+    assert format_size(512) == '512 B'
+    assert format_size(3 * 2**20, signed=True) == '+3.0 MiB'
+    assert format_size(-5 * 2**30) == '-5.00 GiB'
+
+
+def _run_cell(runner, code_text):
+    runner.input_queue.put(code_text)
+    outputs = []
+    while True:
+        msg = runner.output_queue.get()
+        if msg is runner.sentinel:
+            return b''.join(data for _, data in outputs).decode('utf8')
+        outputs.append(msg)
+
+
+def test_memprof_magic():
+    runner = PythonInprocRunner(queue.Queue(), queue.Queue(), queue.Queue(),
+                                object())
+    runner.start()
+    assert _run_cell(runner, 'x = 1') == ''
+    assert 'mode: rss' in _run_cell(runner, '%memprof rss --warn 0.5')
+    assert runner.memory_warn_ratio == 0.5
+    assert _run_cell(runner, 'x = 2').startswith('[memprof] peak ')
+    assert 'mode: off' in _run_cell(runner, '%memprof off')
+    assert _run_cell(runner, 'x = 3') == ''
+    assert 'UsageError' in _run_cell(runner, '%memprof -n many')
+    runner.input_queue.put(None)
@@ -0,0 +1,61 @@
+import queue
+import sys
+import threading
+
+from ai.backend.kernel.python.inproc import PythonInprocRunner
+from ai.backend.kernel.python.prewarm import ImportStats, ModulePrewarmer
+
+
+def test_import_stats(tmpdir):
+    path = str(tmpdir / 'imports.json')
+    stats = ImportStats(path)
+    assert stats.top(3) == []
+
+    # "json" has only a few submodules and unknown modules are ignored.
+    stats.record('import asyncio.events\nimport json\nimport os.path as p\n'
+                 'from nonexistent import x')
+    assert stats.counts == {'asyncio': 1}
+    # Each package is counted once per session.
+    stats.record('import asyncio')
+    assert stats.counts == {'asyncio': 1}
+    stats.record('def f(:\n    import asyncio')  # syntax error
+
+    stats = ImportStats(path)
+    assert stats.counts == {'asyncio': 1}
+    stats.record('from asyncio import sleep')
+    assert stats.top(3) == ['asyncio']
+    assert ImportStats(path).counts == {'asyncio': 2}
+
+
+def test_module_prewarmer(tmpdir, monkeypatch):
+    tmpdir.join('prewarm_dummy.py').write('value = 42\n')
+    monkeypatch.syspath_prepend(str(tmpdir))
+    idle = threading.Event()
+    prewarmer = ModulePrewarmer(['prewarm_dummy', 'prewarm_nonexistent'], idle)
+    prewarmer.start()
+    try:
+        # It waits until the session becomes idle.
+        prewarmer.join(0.1)
+        assert prewarmer.is_alive()
+        assert 'prewarm_dummy' not in sys.modules
+        idle.set()
+        prewarmer.join(5)
+        assert not prewarmer.is_alive()
+        assert prewarmer.imported == ['prewarm_dummy']
+        assert sys.modules['prewarm_dummy'].value == 42
+    finally:
+        sys.modules.pop('prewarm_dummy', None)
+
+
+def test_import_stats_failure_keeps_runner(tmpdir, mocker):
+    runner = PythonInprocRunner(queue.Queue(), queue.Queue(), queue.Queue(),
+                                object(), prewarm=True)
+    runner.import_stats = ImportStats(str(tmpdir / 'imports.json'))
+    mocker.patch.object(runner.import_stats, 'record',
+                        side_effect=RecursionError)
+    runner.start()
+    for _ in range(2):
+        runner.input_queue.put('import os\nprint(1)')
+        assert runner.output_queue.get() == [b'stdout', b'1\n']
+        assert runner.output_queue.get() is runner.sentinel
+    assert runner.import_stats.record.call_count == 2
@@ -0,0 +1,58 @@
+import json
+import queue
+
+from ai.backend.kernel.python.inproc import PythonInprocRunner
+from ai.backend.kernel.python.profiling import CELL_FILENAME, CellProfiler
+
+FIB = 'def fib(n):\n    return n if n < 2 else fib(n - 1) + fib(n - 2)\n'
+
+
+def test_cell_profiler():
+    ns = {}
+    exec(compile(FIB, CELL_FILENAME, 'exec'), ns)
+    code_obj = compile('fib(24)', CELL_FILENAME, 'exec')
+    with CellProfiler(interval=0.001) as profiler:
+        exec(code_obj, ns)
+    assert '<input>:1(fib)' in profiler.format_hotspots('cumulative', 5)
+
+    flame_graph = profiler.flame_graph()
+    frames = flame_graph['shared']['frames']
+    profile = flame_graph['profiles'][0]
+    assert profile['samples']
+    for sample in profile['samples']:
+        # Only the frames of the cell code are included.
+        assert frames[sample[0]]['name'] == '<module>'
+        assert all(frames[i]['name'] == 'fib' for i in sample[1:])
+    assert profile['endValue'] == sum(profile['weights']) > 0
+
+
+def _run_cell(runner, code_text):
+    runner.input_queue.put(code_text)
+    outputs = []
+    while True:
+        msg = runner.output_queue.get()
+        if msg is runner.sentinel:
+            return outputs
+        outputs.append(msg)
+
+
+def test_prun_magic():
+    runner = PythonInprocRunner(queue.Queue(), queue.Queue(), queue.Queue(),
+                                object())
+    runner.start()
+    _run_cell(runner, FIB)
+    outputs = _run_cell(runner, '%%prun --sampling -i 1\nx = fib(24)')
+    text = b''.join(data for kind, data in outputs if kind == b'stdout')
+    assert b'samples taken every 1 ms' in text
+    assert b'fib (<input>:1)' in text
+    media = json.loads(outputs[-1][1])
+    assert outputs[-1][0] == b'media'
+    assert media['type'] == 'application/x-speedscope+json'
+    assert json.loads(media['data'])['profiles'][0]['type'] == 'sampled'
+    assert _run_cell(runner, 'print(x)') == [[b'stdout', b'46368\n']]
+
+    outputs = _run_cell(runner, '%prun -s cumulative -l 3 fib(10)')
+    assert b'Ordered by: cumulative time' in outputs[0][1]
+    outputs = _run_cell(runner, '%prun -s nonsense fib(10)')
+    assert outputs == [[b'stderr', b'UsageError: Invalid sort key: nonsense\n']]
+    runner.input_queue.put(None)
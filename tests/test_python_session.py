@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+
+from ai.backend.kernel.python.session import QuerySession
+
+
+@pytest.mark.asyncio
+async def test_concurrent_sessions(event_loop):
+    sessions = [QuerySession(f'user{i}', loop=event_loop) for i in range(3)]
+    outputs = [[] for _ in sessions]
+    try:
+        # Namespaces are isolated while the queries run concurrently.
+        await asyncio.gather(*(
+            session.query(f'import time\nx = {i}\ntime.sleep(0.2)\n'
+                          f'print("session", x)', outputs[i].append)
+            for i, session in enumerate(sessions)))
+        for i in range(3):
+            assert outputs[i] == [[b'stdout', f'session {i}\n'.encode()]]
+        assert 'x' in await sessions[0].complete({'line': 'x'})
+
+        # Outputs of user threads and interactive inputs are routed to the
+        # session which owns the cell.
+        outputs[1].clear()
+        task = event_loop.create_task(sessions[1].query(
+            'import threading\n'
+            't = threading.Thread(target=print, args=("from thread",))\n'
+            't.start(); t.join()\n'
+            'print(input("name? "))', outputs[1].append))
+        while len(outputs[1]) < 3:
+            await asyncio.sleep(0.01)
+        await sessions[1].user_input_queue.async_q.put('alice')
+        await task
+        assert outputs[1][0] == [b'stdout', b'from thread\n']
+        assert outputs[1][-1] == [b'stdout', b'alice\n']
+
+        runner = sessions[2].inproc_runner
+        await sessions[2].shutdown()
+        await event_loop.run_in_executor(None, runner.join, 5)
+        assert not runner.is_alive()
+    finally:
+        for session in sessions:
+            await session.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_top_level_await(event_loop):
+    session = QuerySession(None, loop=event_loop)
+    outputs = []
+    try:
+        await session.query(
+            'import asyncio\n'
+            'loop = asyncio.get_event_loop()\n'
+            'async def get(x):\n'
+            '    await asyncio.sleep(0)\n'
+            '    return x\n'
+            'result = await get(1)\n'
+            'for i in range(2):\n'
+            '    result += await get(10)\n'
+            'print(result)', outputs.append)
+        assert outputs == [[b'stdout', b'21\n']]
+
+        # The loop and the resources bound to it persist across cells.
+        outputs.clear()
+        await session.query(
+            'queue = asyncio.Queue()\n'
+            'await queue.put(result)\n'
+            'same_loop = asyncio.get_event_loop() is loop\n', outputs.append)
+        await session.query(
+            'print(await queue.get(), same_loop,\n'
+            '      asyncio.get_event_loop() is loop)', outputs.append)
+        assert outputs == [[b'stdout', b'21 True True\n']]
+
+        # Errors and interrupts keep the line numbers and the loop usable.
+        outputs.clear()
+        await session.query('x = 1\nawait asyncio.sleep(0)\nraise ValueError(x)',
+                            outputs.append)
+        err = b''.join(data for _, data in outputs)
+        assert b'line 3' in err and b'ValueError: 1' in err
+        outputs.clear()
+        event_loop.call_later(0.2, session.interrupt)
+        await session.query('await asyncio.sleep(10)', outputs.append)
+        assert outputs == [[b'stderr', b'Interrupted!\n']]
+        outputs.clear()
+        await session.query('print(await get("ok"))', outputs.append)
+        assert outputs == [[b'stdout', b'ok\n']]
+    finally:
+        await session.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_background_jobs(event_loop):
+    session = QuerySession(None, loop=event_loop)
+    outputs = []
+
+    def output_text():
+        return b''.join(data for _, data in outputs).decode()
+
+    try:
+        await session.query(
+            '%%background\n'
+            'import time\n'
+            'while not globals().get("go"):\n'
+            '    time.sleep(0.01)\n'
+            'for i in range(3):\n'
+            '    print("tick", i)\n'
+            '    time.sleep(0.1)\n'
+            'answer = 42\n', outputs.append)
+        assert output_text().startswith('[job 1] started\n')
+
+        # The namespace is shared while the job keeps running.
+        await session.query('%jobs', outputs.append)
+        assert '[job 1] running' in output_text()
+        await session.query('go = True', outputs.append)
+        await session.query('%join 1', outputs.append)
+        text = output_text()
+        for i in range(3):
+            assert f'[job 1] tick {i}\n' in text
+        assert '[job 1] done (' in text
+        outputs.clear()
+        await session.query('print(answer)', outputs.append)
+        assert output_text() == '42\n'
+
+        # Jobs are interrupted individually.
+        outputs.clear()
+        await session.query('%%background\nwhile True: time.sleep(0.01)',
+                            outputs.append)
+        await session.query('%%background\nraise ValueError("oops")',
+                            outputs.append)
+        await session.query('%join 3', outputs.append)
+        assert 'ValueError: oops' in output_text()
+        await session.query('%interrupt 2', outputs.append)
+        outputs.clear()
+        await session.query('%join 2', outputs.append)
+        await session.query('%jobs', outputs.append)
+        text = output_text()
+        assert '[job 2] interrupted' in text
+        assert '[job 3] failed' in text
+        outputs.clear()
+        await session.query('%join 9', outputs.append)
+        assert 'No such job' in output_text()
+    finally:
+        await session.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_inspect_stacks(event_loop):
+    session = QuerySession(None, loop=event_loop)
+    task = None
+    try:
+        assert await session.inspect_stacks({}) == {'threads': []}
+        await session.query('def spin():\n'
+                            '    while not done: pass\n'
+                            'done = False', lambda msg: None)
+        task = event_loop.create_task(session.query('spin()', lambda msg: None))
+        await asyncio.sleep(0.1)
+        # unknown options are ignored.
+        stacks = await session.inspect_stacks({'duration': 0.3,
+                                               'interval': 0.005,
+                                               'unknown': 1})
+        thread, = stacks['threads']
+        assert thread['thread'] == 'InprocRunner'
+        assert thread['stack'][-1]['name'] == 'spin'
+        assert thread['stack'][-1]['line'] == 2
+        assert stacks['num_samples'] > 0
+        assert stacks['hot_frames'][0]['name'] == 'spin'
+        assert stacks['hot_frames'][0]['self'] > 0.1
+        # The cell keeps running.
+        assert not task.done()
+    finally:
+        if task is not None:
+            session.inproc_runner.user_ns['done'] = True
+            await task
+        await session.shutdown()
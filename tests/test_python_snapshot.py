@@ -0,0 +1,63 @@
+import queue
+
+import pytest
+
+from ai.backend.kernel.python.inproc import PythonInprocRunner
+
+
+def _run_cell(runner, code_text):
+    runner.input_queue.put(code_text)
+    outputs = []
+    while True:
+        msg = runner.output_queue.get()
+        if msg is runner.sentinel:
+            return b''.join(data for _, data in outputs).decode('utf8')
+        outputs.append(msg)
+
+
+def _start_runner():
+    runner = PythonInprocRunner(queue.Queue(), queue.Queue(), queue.Queue(),
+                                object())
+    runner.start()
+    return runner
+
+
+def test_snapshot_and_restore(tmpdir):
+    np = pytest.importorskip('numpy')
+    pytest.importorskip('pandas')
+    path = str(tmpdir / 'snapshot')
+
+    runner = _start_runner()
+    _run_cell(runner, 'import numpy as np\nimport pandas as pd\n'
+                      'import threading\n'
+                      'arr = np.arange(1024 * 1024, dtype=np.float64)\n'
+                      'df = pd.DataFrame({"a": arr, "b": arr * 2})\n'
+                      'small = {"key": [1, 2, 3]}\n'
+                      'lock = threading.Lock()\n'
+                      'def func(): pass\n')
+    output = _run_cell(runner, f'%snapshot {path}')
+    assert '6 object(s) written, 0 unchanged' in output
+    assert 'skipped (functions, classes, or unpicklable): func, lock' in output
+
+    # Only the changed objects are rewritten.
+    _run_cell(runner, 'small["key"].append(4)\narr[0] = -1')
+    output = _run_cell(runner, f'%snapshot {path}')
+    assert '2 object(s) written, 4 unchanged' in output
+
+    # A new session restores the namespace.
+    runner = _start_runner()
+    output = _run_cell(runner, f'%restore {path}')
+    assert '6 object(s) restored' in output
+    ns = runner.user_ns
+    assert isinstance(ns['arr'], np.memmap)  # loaded lazily
+    assert ns['arr'][0] == -1 and ns['arr'][-1] == 1024 * 1024 - 1
+    assert ns['small'] == {'key': [1, 2, 3, 4]}
+    assert list(ns['df'].columns) == ['a', 'b']
+    assert ns['df']['b'].iloc[3] == 6
+    assert _run_cell(runner, 'arr[1] = 42\nprint(arr[1], np.__name__)') == \
+        '42.0 numpy\n'
+
+    output = _run_cell(runner, f'%snapshot {path}')
+    assert '1 object(s) written, 5 unchanged' in output
+    # stale files are removed (modules have no files).
+    assert len((tmpdir / 'snapshot' / 'objects').listdir()) == 4
@@ -0,0 +1,67 @@
+import json
+import queue
+
+import pytest
+
+from ai.backend.kernel.python.inproc import PythonInprocRunner
+from ai.backend.kernel.python.timing import (
+    StatementTimer, TimeitResult, format_time,
+)
+
+
+def test_timeit_result():
+    result = TimeitResult(10, [1.0, 1.1, 1.0, 0.9, 5.0])
+    assert result.timings == pytest.approx([0.1, 0.11, 0.1, 0.09, 0.5])
+    assert result.median == pytest.approx(0.1)
+    assert result.best == pytest.approx(0.09)
+    assert result.worst == pytest.approx(0.5)
+    assert result.outliers == [4]
+    text = result.format()
+    assert 'mean ± std. dev. of 5 runs, 10 loops each' in text
+    assert '1 outlier run(s) detected: 500 ms' in text
+    assert 'GC disabled' in text
+    assert 'times longer than the fastest' in text
+    assert format_time(2.5e-7) == '250 ns'
+    assert format_time(3) == '3 s'
+
+
+def test_statement_timer_calibration():
+    ns = {'calls': []}
+    timer = StatementTimer('calls.append(1)', 'pass', ns, gc_enabled=True)
+    result = timer.measure(repeat=3)
+    assert result.loops > 1
+    assert len(ns['calls']) >= result.loops * 3
+    assert len(result.timings) == 3
+    assert result.to_dict()['gc_enabled']
+
+
+def _run_cell(runner, code_text):
+    runner.input_queue.put(code_text)
+    outputs = []
+    while True:
+        msg = runner.output_queue.get()
+        if msg is runner.sentinel:
+            return outputs
+        outputs.append(msg)
+
+
+def test_timeit_magic():
+    runner = PythonInprocRunner(queue.Queue(), queue.Queue(), queue.Queue(),
+                                object())
+    runner.start()
+    _run_cell(runner, 'xs = list(range(100))')
+    outputs = _run_cell(runner, '%%timeit -n 100 -r 3 ys = xs[:]\nys.sort()')
+    assert outputs[0][0] == b'stdout'
+    assert '3 runs, 100 loops each' in outputs[0][1].decode('utf8')
+    media = json.loads(outputs[1][1])
+    assert media['type'] == 'application/x-sorna-timeit'
+    assert media['data']['loops'] == 100
+    assert len(media['data']['timings']) == 3
+    assert 'ys' not in runner.user_ns
+
+    outputs = _run_cell(runner, '%timeit -r 0 len(xs)')
+    assert outputs == [[b'stderr', b'UsageError: The -n and -r options '
+                                   b'must be positive.\n']]
+    outputs = _run_cell(runner, '%timeit -n 1 undefined_name')
+    assert b'NameError' in b''.join(data for _, data in outputs)
+    runner.input_queue.put(None)
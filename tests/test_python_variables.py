@@ -0,0 +1,68 @@
+import sys
+
+import pytest
+
+from ai.backend.kernel.python.session import QuerySession
+from ai.backend.kernel.python.variables import VariableInspector, estimate_size
+
+
+def test_estimate_size():
+    assert estimate_size('abc') == (sys.getsizeof('abc'), False)
+    items = [str(i) * 10 for i in range(10000)]
+    size, approx = estimate_size(items)
+    exact = sys.getsizeof(items) + sum(sys.getsizeof(s) for s in items)
+    assert approx
+    assert exact * 0.9 < size < exact * 1.1
+    size, approx = estimate_size({i: 'x' for i in range(10)})
+    assert not approx and size > sys.getsizeof({})
+
+
+def test_estimate_size_of_arrays():
+    np = pytest.importorskip('numpy')
+    pd = pytest.importorskip('pandas')
+    arr = np.zeros((100, 10))
+    assert estimate_size(arr) == (8000, False)
+    df = pd.DataFrame({'a': np.arange(100), 'b': np.zeros(100)})
+    assert estimate_size(df)[0] >= 1600
+    assert estimate_size([arr, arr])[0] >= 16000
+    # The strings in object columns are counted by sampling.
+    df['c'] = [f'value {i}' for i in range(100)]
+    size, approx = estimate_size(df)
+    assert approx
+    assert size == pytest.approx(df.memory_usage(deep=True).sum(), rel=0.1)
+
+
+def test_variable_inspector(mocker):
+    inspector = VariableInspector()
+    namespace = {'__name__': '__main__', '_hidden': 1, 'sys': sys,
+                 'data': list(range(10)), 'name': 'abc', 'func': print}
+    versions = {'data': 1, 'name': 1}
+    results = inspector.inspect(namespace, versions)
+    assert [info['name'] for info in results] == ['data', 'name']
+    assert results[0]['type'] == 'list'
+    assert results[0]['shape'] == [10]
+    assert results[0]['size'] > 0
+
+    # The summaries are cached until the versions change.
+    summarize = mocker.patch('ai.backend.kernel.python.variables.summarize',
+                             side_effect=lambda name, obj, size: {'name': name})
+    namespace['data'].append(10)
+    assert inspector.inspect(namespace, versions)[0]['shape'] == [10]
+    assert summarize.call_count == 0
+    versions['data'] = 2
+    inspector.inspect(namespace, versions)
+    assert summarize.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_variables_of_session(event_loop):
+    session = QuerySession(None, loop=event_loop)
+    try:
+        assert await session.inspect_variables() == []
+        await session.query('x = [1, 2, 3]\nclass Point: pass\np = Point()',
+                            lambda msg: None)
+        variables = await session.inspect_variables()
+        assert [(info['name'], info['type']) for info in variables] == \
+            [('p', 'Point'), ('x', 'list')]
+    finally:
+        await session.shutdown()
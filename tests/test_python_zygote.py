@@ -0,0 +1,70 @@
+import asyncio
+import os
+import signal
+import sys
+
+import pytest
+
+from ai.backend.kernel.python.zygote import PythonZygote
+
+
+async def _collect(proc):
+    stdout, stderr, returncode = await asyncio.gather(
+        proc.stdout.read(), proc.stderr.read(), proc.wait())
+    return stdout, stderr, returncode
+
+
+@pytest.mark.asyncio
+async def test_zygote_spawn(event_loop, tmpdir):
+    script = tmpdir.join('main.py')
+    script.write(
+        'import os, sys\n'
+        'print("loaded:", "decimal" in sys.modules)\n'
+        'print("cwd:", os.getcwd())\n'
+        'print("env:", os.environ.get("ZYGOTE_TEST"))\n'
+        'print("oops", file=sys.stderr)\n'
+        'sys.exit(int(sys.argv[1]))\n')
+    zygote = PythonZygote(sys.executable, ['decimal'], dict(os.environ),
+                          loop=event_loop)
+    assert await zygote.start()
+    try:
+        for exit_code in (0, 3):
+            proc = await zygote.spawn(
+                ['python', str(script), str(exit_code)],
+                {'ZYGOTE_TEST': 'hello', 'PATH': os.environ['PATH']},
+                str(tmpdir))
+            stdout, stderr, returncode = await _collect(proc)
+            assert stdout.decode().splitlines() == [
+                'loaded: True',
+                f'cwd: {tmpdir}',
+                'env: hello',
+            ]
+            assert stderr == b'oops\n'
+            assert returncode == exit_code
+
+        # interrupts go to the forked program.
+        script.write('import time\nprint("start", flush=True)\ntime.sleep(30)\n')
+        proc = await zygote.spawn(['python', str(script)], dict(os.environ),
+                                  str(tmpdir))
+        assert await proc.stdout.readline() == b'start\n'
+        proc.send_signal(signal.SIGINT)
+        stdout, stderr, returncode = await _collect(proc)
+        assert b'KeyboardInterrupt' in stderr
+        assert returncode == 1
+    finally:
+        await zygote.close()
+
+
+@pytest.mark.asyncio
+async def test_zygote_fork_unsafe_fallback(event_loop, tmpdir):
+    # A module which starts a background thread upon import.
+    tmpdir.join('threaded_mod.py').write(
+        'import threading, time\n'
+        'threading.Thread(target=time.sleep, args=(10,), daemon=True).start()\n')
+    env = dict(os.environ)
+    env['PYTHONPATH'] = str(tmpdir)
+    zygote = PythonZygote(sys.executable, ['threaded_mod'], env, loop=event_loop)
+    assert not await zygote.start()
+    assert 'background threads' in zygote.reason
+    assert not zygote.ready
+    assert zygote.proc is None
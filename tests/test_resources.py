@@ -0,0 +1,44 @@
+from ai.backend.kernel.resources import (
+    ResourceLimits, cgroup_cpu_quota, cgroup_memory_limit, thread_env,
+)
+
+
+def test_cgroup_v2(tmpdir):
+    assert cgroup_cpu_quota(tmpdir) is None
+    assert cgroup_memory_limit(tmpdir) is None
+    tmpdir.join('cpu.max').write('max 100000\n')
+    tmpdir.join('memory.max').write('max\n')
+    assert cgroup_cpu_quota(tmpdir) is None
+    assert cgroup_memory_limit(tmpdir) is None
+    tmpdir.join('cpu.max').write('150000 100000\n')
+    tmpdir.join('memory.max').write('1073741824\n')
+    assert cgroup_cpu_quota(tmpdir) == 1.5
+    assert cgroup_memory_limit(tmpdir) == 1073741824
+
+
+def test_cgroup_v1(tmpdir):
+    cpu = tmpdir.mkdir('cpu,cpuacct')
+    cpu.join('cpu.cfs_quota_us').write('-1\n')
+    cpu.join('cpu.cfs_period_us').write('100000\n')
+    memory = tmpdir.mkdir('memory')
+    memory.join('memory.limit_in_bytes').write('9223372036854771712\n')
+    assert cgroup_cpu_quota(tmpdir) is None
+    assert cgroup_memory_limit(tmpdir) is None
+    cpu.join('cpu.cfs_quota_us').write('400000\n')
+    memory.join('memory.limit_in_bytes').write('536870912\n')
+    assert cgroup_cpu_quota(tmpdir) == 4.0
+    assert cgroup_memory_limit(tmpdir) == 536870912
+
+
+def test_resource_limits():
+    limits = ResourceLimits(64, cpu_quota=1.5)
+    assert limits.cpus == 2
+    assert limits.executor_workers == 6
+    assert ResourceLimits(4, cpu_quota=16).cpus == 4
+    assert ResourceLimits(64).executor_workers == 32
+    assert ResourceLimits(8, cpu_quota=0.5).cpus == 1
+    env = thread_env(limits)
+    assert env['OMP_NUM_THREADS'] == '2'
+    assert env['OPENBLAS_NUM_THREADS'] == '2'
+    assert env['MKL_NUM_THREADS'] == '2'
+    assert env['MALLOC_ARENA_MAX'] == '2'
@@ -0,0 +1,68 @@
+import os
+import signal
+import subprocess
+import time
+
+import pytest
+
+from ai.backend.kernel.procgroup import group_members
+from ai.backend.kernel.sched import SchedPolicy
+
+
+def test_parse_policy():
+    policy = SchedPolicy.parse('cpus=0-2,5 nice=10 ionice=be:7')
+    assert policy.cpus == {0, 1, 2, 5}
+    assert policy.nice == 10
+    assert policy.ionice == ('be', 7)
+    assert str(policy) == 'cpus=0-2,5 nice=10 ionice=be:7'
+    assert policy.to_dict() == {'cpus': [0, 1, 2, 5], 'nice': 10,
+                                'ionice': 'be:7'}
+    assert not SchedPolicy.parse('')
+    with pytest.raises(ValueError):
+        SchedPolicy.parse('ionice=fast')
+    with pytest.raises(ValueError):
+        SchedPolicy.parse('priority=1')
+
+
+def test_policy_from_env(monkeypatch):
+    monkeypatch.delenv('BACKENDAI_SCHED_BUILD', raising=False)
+    assert SchedPolicy.from_env('build').nice == 10
+    monkeypatch.setenv('BACKENDAI_SCHED_BUILD', '')
+    assert not SchedPolicy.from_env('build')
+    monkeypatch.setenv('BACKENDAI_SCHED_EXEC', 'nice=x')
+    assert not SchedPolicy.from_env('exec')
+
+
+def test_apply_policy():
+    cpu = min(os.sched_getaffinity(0))
+    policy = SchedPolicy(cpus=frozenset([cpu, 4096]), nice=os.nice(0) + 3,
+                         ionice=('idle', 0))
+    proc = subprocess.Popen(['sleep', '5'])
+    try:
+        policy.apply(proc.pid)
+        assert os.sched_getaffinity(proc.pid) == {cpu}
+        assert os.getpriority(os.PRIO_PROCESS, proc.pid) == policy.nice
+    finally:
+        proc.kill()
+        proc.wait()
+    # the descendants spawned before applying get the policy as well.
+    proc = subprocess.Popen('sleep 5 & sleep 5', shell=True,
+                            start_new_session=True)
+    try:
+        time.sleep(0.2)
+        policy.apply(proc.pid, group=True)
+        members = group_members(proc.pid)
+        assert len(members) >= 2
+        for pid, _ in members:
+            assert os.sched_getaffinity(pid) == {cpu}
+            assert os.getpriority(os.PRIO_PROCESS, pid) == policy.nice
+    finally:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+    # failures (e.g., raising the priority without privileges) are ignored.
+    proc = subprocess.Popen(['sleep', '5'])
+    try:
+        SchedPolicy(nice=-20).apply(proc.pid)
+    finally:
+        proc.kill()
+        proc.wait()
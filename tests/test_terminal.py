@@ -0,0 +1,52 @@
+import asyncio
+import os
+import pty
+import subprocess
+import tty
+
+import pytest
+
+from ai.backend.kernel.compat import install_event_loop_policy
+from ai.backend.kernel.utils import read_fd, write_fd
+
+
+@pytest.fixture(params=['asyncio', 'uvloop'], ids=['default', 'uvloop'])
+def any_loop(request):
+    if install_event_loop_policy(request.param) != request.param:
+        pytest.skip(f'{request.param} is not available')
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+    install_event_loop_policy('asyncio')
+
+
+def test_pty_io(any_loop):
+    loop = any_loop
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    os.set_blocking(master, False)
+    proc = subprocess.Popen(['cat'], stdin=slave, stdout=slave,
+                            close_fds=True)
+    os.close(slave)
+    # larger than the pty buffers to exercise waiting for writability
+    data = os.urandom(1024).hex().encode() * 128
+
+    async def echo():
+        received = bytearray()
+        writing = loop.create_task(write_fd(loop, master, data))
+        while len(received) < len(data):
+            received.extend(await read_fd(loop, master, 4096))
+        await writing
+        assert received == data
+        proc.kill()
+        proc.wait()
+        # EIO from the pty master after its slave is closed means EOF.
+        assert await read_fd(loop, master, 4096) == b''
+
+    try:
+        loop.run_until_complete(asyncio.wait_for(echo(), 10, loop=loop))
+    finally:
+        os.close(master)
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
@@ -0,0 +1,10 @@
+import tempfile
+
+from ai.backend.kernel.utils import scratch_dir
+
+
+def test_scratch_dir(tmpdir, monkeypatch):
+    monkeypatch.setenv('BACKENDAI_SCRATCH_DIR', str(tmpdir))
+    assert scratch_dir() == str(tmpdir)
+    monkeypatch.setenv('BACKENDAI_SCRATCH_DIR', str(tmpdir.join('missing')))
+    assert scratch_dir() in ('/dev/shm', tempfile.gettempdir())